@@ -0,0 +1,45 @@
+"""create tasks table
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tasks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.Column(
+            'status',
+            sa.Enum(
+                'PENDING', 'IN_PROGRESS', 'COMPLETED', 'FAILED', 'CANCELED',
+                name='taskstatus'
+            ),
+            nullable=True
+        ),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True
+    )
+    op.create_index('ix_tasks_id', 'tasks', ['id'], if_not_exists=True)
+    op.create_index('ix_tasks_type', 'tasks', ['type'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_tasks_type', table_name='tasks')
+    op.drop_index('ix_tasks_id', table_name='tasks')
+    op.drop_table('tasks')
+    sa.Enum(name='taskstatus').drop(op.get_bind(), checkfirst=True)
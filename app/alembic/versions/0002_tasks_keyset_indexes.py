@@ -0,0 +1,42 @@
+"""composite indexes for keyset pagination of tasks
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_tasks_created_at_id': ['created_at', 'id'],
+    'ix_tasks_status_created_at_id': ['status', 'created_at', 'id'],
+    'ix_tasks_type_created_at_id': ['type', 'created_at', 'id'],
+}
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY не блокирует запись в большую таблицу,
+    # но не может выполняться внутри транзакции.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name, 'tasks', columns,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name, table_name='tasks',
+                postgresql_concurrently=True,
+                if_exists=True
+            )
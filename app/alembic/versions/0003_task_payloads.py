@@ -0,0 +1,27 @@
+"""store task input payloads
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('data', sa.LargeBinary(), nullable=True))
+    op.add_column(
+        'tasks', sa.Column('data_ref', sa.String(length=64), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column('tasks', 'data_ref')
+    op.drop_column('tasks', 'data')
@@ -0,0 +1,35 @@
+"""task priority
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+taskpriority = sa.Enum('HIGH', 'NORMAL', 'LOW', name='taskpriority')
+
+
+def upgrade():
+    taskpriority.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'tasks',
+        sa.Column(
+            'priority',
+            taskpriority,
+            nullable=False,
+            server_default='NORMAL'
+        )
+    )
+
+
+def downgrade():
+    op.drop_column('tasks', 'priority')
+    taskpriority.drop(op.get_bind(), checkfirst=True)
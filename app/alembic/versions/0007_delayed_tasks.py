@@ -0,0 +1,39 @@
+"""delayed tasks: run_at and outbox availability
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('run_at', sa.DateTime(), nullable=True))
+    op.add_column(
+        'task_outbox',
+        sa.Column(
+            'available_at',
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("timezone('utc', now())")
+        )
+    )
+    op.create_index(
+        'ix_task_outbox_available_at_id',
+        'task_outbox',
+        ['available_at', 'id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_task_outbox_available_at_id', table_name='task_outbox')
+    op.drop_column('task_outbox', 'available_at')
+    op.drop_column('tasks', 'run_at')
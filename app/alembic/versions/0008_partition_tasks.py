@@ -0,0 +1,187 @@
+"""partition tasks by created_at and maintain status counters
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, type, status, priority, result, data, data_ref, run_at, "
+    "created_at, updated_at"
+)
+
+INDEXES = {
+    'ix_tasks_id': ['id'],
+    'ix_tasks_type': ['type'],
+    'ix_tasks_created_at_id': ['created_at', 'id'],
+    'ix_tasks_status_created_at_id': ['status', 'created_at', 'id'],
+    'ix_tasks_type_created_at_id': ['type', 'created_at', 'id'],
+}
+
+# Счётчики задач по (type, status) разбиты на шарды, чтобы конкурентные
+# транзакции не ждали друг друга на одной строке. Триггеры уровня
+# оператора агрегируют изменённые строки, поэтому пакетная вставка или
+# пакетное завершение задач обновляет несколько строк счётчиков, а не
+# по строке на задачу.
+COUNTERS_FUNCTION = """
+CREATE FUNCTION task_counters_apply() RETURNS trigger AS $$
+DECLARE
+    counter_shard smallint := pg_backend_pid() % 16;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO task_counters (type, status, shard, count)
+        SELECT coalesce(type, ''), status, counter_shard, count(*)
+        FROM new_rows WHERE status IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (type, status, shard)
+        DO UPDATE SET count = task_counters.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO task_counters (type, status, shard, count)
+        SELECT coalesce(type, ''), status, counter_shard, -count(*)
+        FROM old_rows WHERE status IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (type, status, shard)
+        DO UPDATE SET count = task_counters.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO task_counters (type, status, shard, count)
+        SELECT type, status, counter_shard, sum(delta)
+        FROM (
+            SELECT coalesce(type, '') AS type, status, 1 AS delta
+            FROM new_rows WHERE status IS NOT NULL
+            UNION ALL
+            SELECT coalesce(type, ''), status, -1
+            FROM old_rows WHERE status IS NOT NULL
+        ) AS changes
+        GROUP BY 1, 2
+        HAVING sum(delta) <> 0
+        ON CONFLICT (type, status, shard)
+        DO UPDATE SET count = task_counters.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGERS = (
+    "CREATE TRIGGER tasks_counters_insert AFTER INSERT ON tasks "
+    "REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION task_counters_apply()",
+    "CREATE TRIGGER tasks_counters_update AFTER UPDATE ON tasks "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION task_counters_apply()",
+    "CREATE TRIGGER tasks_counters_delete AFTER DELETE ON tasks "
+    "REFERENCING OLD TABLE AS old_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION task_counters_apply()",
+)
+
+# Помесячные секции от самой старой задачи до трёх месяцев вперёд.
+# Дальнейшие секции создаёт задача обслуживания app/workers/retention.py.
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    start_month date := date_trunc(
+        'month', coalesce((SELECT min(created_at) FROM tasks_legacy), now())
+    );
+    last_month date := date_trunc('month', now()) + interval '3 months';
+BEGIN
+    WHILE start_month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tasks FOR VALUES FROM (%L) TO (%L)',
+            'tasks_p' || to_char(start_month, 'YYYYMM'),
+            start_month,
+            start_month + interval '1 month'
+        );
+        start_month := start_month + interval '1 month';
+    END LOOP;
+END
+$$
+"""
+
+
+def upgrade():
+    # Секционировать существующую таблицу нельзя: создаём новую, переносим
+    # строки и удаляем старую. Миграция выполняется одной транзакцией и
+    # блокирует запись в tasks на время копирования.
+    op.execute("ALTER TABLE tasks RENAME TO tasks_legacy")
+    op.execute(
+        "UPDATE tasks_legacy SET created_at = timezone('utc', now()) "
+        "WHERE created_at IS NULL"
+    )
+    op.execute("""
+        CREATE TABLE tasks (
+            id integer NOT NULL DEFAULT nextval('tasks_id_seq'),
+            type varchar,
+            status taskstatus,
+            priority taskpriority NOT NULL DEFAULT 'NORMAL',
+            result text,
+            data bytea,
+            data_ref varchar(64),
+            run_at timestamp without time zone,
+            created_at timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(CREATE_PARTITIONS)
+    op.execute("CREATE TABLE tasks_default PARTITION OF tasks DEFAULT")
+
+    op.execute("""
+        CREATE TABLE task_counters (
+            type varchar NOT NULL,
+            status taskstatus NOT NULL,
+            shard smallint NOT NULL,
+            count bigint NOT NULL,
+            PRIMARY KEY (type, status, shard)
+        )
+    """)
+    op.execute(COUNTERS_FUNCTION)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+
+    # Счётчики заполняются триггером вставки
+    op.execute(
+        f"INSERT INTO tasks ({COLUMNS}) SELECT {COLUMNS} FROM tasks_legacy"
+    )
+    op.execute("ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id")
+    op.execute("DROP TABLE tasks_legacy")
+
+    # Первичный ключ секционированной таблицы обязан включать ключ секций
+    op.execute("ALTER TABLE tasks ADD PRIMARY KEY (id, created_at)")
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'tasks', columns)
+
+
+def downgrade():
+    op.execute("ALTER TABLE tasks RENAME TO tasks_partitioned")
+    op.execute("""
+        CREATE TABLE tasks (
+            id integer NOT NULL DEFAULT nextval('tasks_id_seq'),
+            type varchar,
+            status taskstatus,
+            priority taskpriority NOT NULL DEFAULT 'NORMAL',
+            result text,
+            data bytea,
+            data_ref varchar(64),
+            run_at timestamp without time zone,
+            created_at timestamp without time zone,
+            updated_at timestamp without time zone
+        )
+    """)
+    op.execute(
+        f"INSERT INTO tasks ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM tasks_partitioned"
+    )
+    op.execute("ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id")
+    op.execute("DROP TABLE tasks_partitioned")
+    op.execute("DROP FUNCTION task_counters_apply()")
+    op.execute("DROP TABLE task_counters")
+    op.execute("ALTER TABLE tasks ADD PRIMARY KEY (id)")
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'tasks', columns)
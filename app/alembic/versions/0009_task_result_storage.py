@@ -0,0 +1,34 @@
+"""store large task results out of line
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Колонки добавляются в секционированную таблицу и во все её секции
+    op.add_column(
+        'tasks', sa.Column('result_size', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'tasks', sa.Column('result_digest', sa.String(64), nullable=True)
+    )
+    op.add_column(
+        'tasks', sa.Column('result_ref', sa.String(64), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column('tasks', 'result_ref')
+    op.drop_column('tasks', 'result_digest')
+    op.drop_column('tasks', 'result_size')
@@ -0,0 +1,52 @@
+"""workflows: chains of task groups advanced by the worker
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'workflows',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column(
+            'status',
+            postgresql.ENUM(name='taskstatus', create_type=False),
+            nullable=False
+        ),
+        sa.Column('stage_count', sa.SmallInteger(), nullable=False),
+        sa.Column('current_stage', sa.SmallInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column(
+        'tasks', sa.Column('workflow_id', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'tasks', sa.Column('workflow_stage', sa.SmallInteger(), nullable=True)
+    )
+    # Индекс на секционированной таблице создаётся и во всех секциях
+    op.create_index(
+        'ix_tasks_workflow_id_stage',
+        'tasks',
+        ['workflow_id', 'workflow_stage']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tasks_workflow_id_stage', table_name='tasks')
+    op.drop_column('tasks', 'workflow_stage')
+    op.drop_column('tasks', 'workflow_id')
+    op.drop_table('workflows')
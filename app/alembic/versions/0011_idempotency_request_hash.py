@@ -0,0 +1,27 @@
+"""store the request hash with idempotency keys
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ключи, записанные до миграции, остаются без хеша и не сверяются
+    op.add_column(
+        'idempotency_keys',
+        sa.Column('request_hash', sa.String(length=64), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column('idempotency_keys', 'request_hash')
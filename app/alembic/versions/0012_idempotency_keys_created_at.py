@@ -0,0 +1,27 @@
+"""index idempotency keys by creation time for expiry
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Задача обслуживания удаляет ключи старше окна дедупликации
+    op.create_index(
+        'ix_idempotency_keys_created_at', 'idempotency_keys', ['created_at']
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_idempotency_keys_created_at', table_name='idempotency_keys'
+    )
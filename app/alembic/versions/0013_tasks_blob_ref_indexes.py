@@ -0,0 +1,33 @@
+"""index blob references of tasks for blob garbage collection
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Задача обслуживания удаляет блобы, на которые не ссылается ни одна
+    # задача; частичные индексы не включают задачи без блобов.
+    op.create_index(
+        'ix_tasks_data_ref', 'tasks', ['data_ref'],
+        postgresql_where=sa.text('data_ref IS NOT NULL')
+    )
+    op.create_index(
+        'ix_tasks_result_ref', 'tasks', ['result_ref'],
+        postgresql_where=sa.text('result_ref IS NOT NULL')
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tasks_result_ref', table_name='tasks')
+    op.drop_index('ix_tasks_data_ref', table_name='tasks')
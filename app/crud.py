@@ -1,10 +1,57 @@
-from sqlalchemy.orm import Session
+import json
+import os
 from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
-from datetime import datetime
-from app.utils.caching import get_cache, set_cache
-from typing import Optional
+from app.resources import resources
+from datetime import datetime, timedelta, timezone
+from app.utils.caching import (
+    get_cache, get_redis, set_cache, invalidate, payload_digest
+)
+from app.utils.codec import encode_task, decode_task
+from app.utils.events import (
+    publish_cancellations, publish_task_events, task_event
+)
+from app.utils.payloads import decode_payload, encode_payload, task_message
+from app.utils.progress import clear_progress
+from app.utils.results import StoredResult, load_result
+from typing import Optional, List, Tuple
+from sqlalchemy import func, insert, update, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
+from sqlalchemy.orm import undefer
+
+TASK_CACHE_TTL = int(os.getenv("TASK_CACHE_TTL", 3600))
+# Окно дедупликации по Idempotency-Key в секундах; более старые ключи
+# удаляет задача обслуживания app/workers/retention.py.
+IDEMPOTENCY_WINDOW = int(os.getenv("IDEMPOTENCY_WINDOW", 86400))
+# Незавершённая задача, прочитанная при промахе кеша, могла измениться
+# между чтением и записью в кеш, поэтому такая запись живёт недолго.
+TASK_CACHE_ACTIVE_TTL = int(os.getenv("TASK_CACHE_ACTIVE_TTL", 5))
+ACTIVE_STATUSES = (
+    models.TaskStatus.PENDING,
+    models.TaskStatus.IN_PROGRESS,
+)
+
+
+def _filter_tasks(
+    query,
+    status: Optional[schemas.TaskStatus] = None,
+    type: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    if status:
+        query = query.filter(models.Task.status == status)
+    if type:
+        query = query.filter(models.Task.type == type)
+    if created_after:
+        query = query.filter(models.Task.created_at >= created_after)
+    if created_before:
+        query = query.filter(models.Task.created_at <= created_before)
+    return query.order_by(
+        models.Task.created_at.desc(),
+        models.Task.id.desc()
+    )
 
 
 async def get_tasks(
@@ -14,11 +61,18 @@ async def get_tasks(
     created_after: Optional[datetime] = None,
     created_before: Optional[datetime] = None,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    after: Optional[Tuple[datetime, int]] = None
 ):
     """
     Получает список задач из базы данных с возможностью фильтрации.
 
+    Задачи упорядочены от новых к старым по (created_at, id). Если указан
+    `after`, страница начинается сразу после этой позиции (keyset-
+    пагинация): запрос идёт по составному индексу и не пропускает строки,
+    поэтому не замедляется на глубоких страницах. `skip` в этом режиме
+    не применяется.
+
     :param db: Сессия базы данных.
     :param status: Фильтр по статусу задачи (если указан).
     :param type: Фильтр по типу задачи (если указан).
@@ -26,65 +80,480 @@ async def get_tasks(
     :param created_before: Фильтр по дате создания.
     :param skip: Количество записей, которые нужно пропустить.
     :param limit: Максимальное количество записей в ответе.
+    :param after: Позиция (created_at, id) последней задачи предыдущей
+                  страницы.
     :return: Список задач, удовлетворяющих условиям фильтрации.
     """
-    query = select(models.Task)
-    if status:
-        query = query.filter(models.Task.status == status)
-    if type:
-        query = query.filter(models.Task.type == type)
-    if created_after:
-        query = query.filter(models.Task.created_at >= created_after)
-    if created_before:
-        query = query.filter(models.Task.created_at <= created_before)
-    query = query.offset(skip).limit(limit)
+    query = _filter_tasks(
+        select(models.Task),
+        status=status,
+        type=type,
+        created_after=created_after,
+        created_before=created_before
+    )
+    if after:
+        query = query.filter(
+            tuple_(models.Task.created_at, models.Task.id) < after
+        )
+    else:
+        query = query.offset(skip)
+    query = query.limit(limit)
     result = await db.execute(query)
     tasks = result.scalars().all()
     return tasks
 
 
+async def stream_tasks(
+    db: AsyncSession,
+    status: Optional[schemas.TaskStatus] = None,
+    type: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    batch_size: int = 1000
+):
+    """
+    Построчно читает задачи через серверный курсор.
+
+    Строки забираются из БД пачками по `batch_size`, поэтому расход
+    памяти не зависит от размера выборки. Фильтры и порядок те же, что
+    у `get_tasks`.
+
+    :param db: Сессия базы данных.
+    :param status: Фильтр по статусу задачи (если указан).
+    :param type: Фильтр по типу задачи (если указан).
+    :param created_after: Фильтр по дате создания.
+    :param created_before: Фильтр по дате создания.
+    :param batch_size: Размер пачки строк, читаемой из курсора.
+    :return: Асинхронный итератор задач.
+    """
+    query = _filter_tasks(
+        select(models.Task),
+        status=status,
+        type=type,
+        created_after=created_after,
+        created_before=created_before
+    ).execution_options(yield_per=batch_size)
+    result = await db.stream_scalars(query)
+    async for task in result:
+        yield task
+
+
+async def get_task_stats(db: AsyncSession) -> schemas.TaskStats:
+    """
+    Считает задачи по статусам по счётчикам `task_counters`, которые
+    поддерживаются триггерами, без COUNT(*) по таблице задач.
+
+    :param db: Сессия базы данных.
+    :return: Статистика задач.
+    """
+    total_count = func.sum(models.TaskCounter.count)
+    result = await db.execute(
+        select(models.TaskCounter.type, models.TaskCounter.status, total_count)
+        .group_by(models.TaskCounter.type, models.TaskCounter.status)
+        .having(total_count != 0)
+        .order_by(models.TaskCounter.type, models.TaskCounter.status)
+    )
+    counts = [
+        schemas.TaskCount(
+            type=task_type,
+            status=schemas.TaskStatus(status.value),
+            count=count
+        )
+        for task_type, status, count in result
+    ]
+    by_status = dict.fromkeys(schemas.TaskStatus, 0)
+    for item in counts:
+        by_status[item.status] += item.count
+    return schemas.TaskStats(
+        total=sum(by_status.values()),
+        by_status=by_status,
+        counts=counts
+    )
+
+
+def task_cache_key(task_id: int) -> str:
+    """
+    Ключ кеша для задачи.
+    """
+    return f"task:{task_id}"
+
+
+async def cache_task(
+    db_task: models.Task,
+    broadcast: bool = True,
+    expire: int = TASK_CACHE_TTL
+):
+    """
+    Записывает актуальное состояние задачи в кеш (write-through).
+
+    :param db_task: Объект задачи.
+    :param broadcast: Разослать инвалидацию другим процессам.
+    :param expire: Время жизни записи в секундах.
+    :return: Задача в виде schemas.Task, как она лежит в кеше.
+    """
+    task = schemas.Task.from_orm(db_task)
+    await set_cache(
+        task_cache_key(db_task.id),
+        task,
+        expire=expire,
+        broadcast=broadcast,
+        encoder=encode_task
+    )
+    return task
+
+
+async def invalidate_tasks(*task_ids: int):
+    """
+    Удаляет задачи из кеша всех процессов.
+
+    :param task_ids: Идентификаторы задач.
+    """
+    await invalidate(*(task_cache_key(task_id) for task_id in task_ids))
+
+
 async def get_task(
-    db: Session,
-    task_id: int
+    db: AsyncSession,
+    task_id: int,
+    use_cache: bool = True
 ):
     """
     Получает задачу по её ID, используя кеширование.
 
     :param db: Сессия базы данных.
     :param task_id: Идентификатор задачи.
-    :return: Объект задачи или None, если задача не найдена.
+    :param use_cache: Читать из кеша. Для изменения задачи нужен объект
+                      ORM, поэтому пути записи передают False.
+    :return: schemas.Task (при use_cache) или объект ORM (без кеша);
+             None, если задача не найдена.
+
+    При промахе прочитанная задача кладётся в кеш, только если она
+    прочитана с основной БД: реплика может отставать, и устаревший
+    статус закрепился бы в кеше. Незавершённая задача кешируется на
+    TASK_CACHE_ACTIVE_TTL секунд, так как инвалидация от воркера могла
+    прийти между чтением и записью в кеш.
     """
-    cache_key = f"task:{task_id}"
-    cached_task = await get_cache(cache_key)
-    if cached_task:
-        return cached_task
+    if use_cache:
+        cached_task = await get_cache(
+            task_cache_key(task_id),
+            decoder=decode_task
+        )
+        if cached_task:
+            return cached_task
 
     db_task = await db.get(models.Task, task_id)
-    if db_task:
-        await set_cache(cache_key, db_task)
+    if db_task is None or not use_cache:
+        return db_task
+    if db.bind is not resources.engine:
+        return schemas.Task.from_orm(db_task)
+    return await cache_task(
+        db_task,
+        broadcast=False,
+        expire=TASK_CACHE_ACTIVE_TTL
+        if db_task.status in ACTIVE_STATUSES else TASK_CACHE_TTL
+    )
+
+
+async def get_task_result(db: AsyncSession, task_id: int):
+    """
+    Читает то, что нужно для отдачи результата задачи.
+
+    :param db: Сессия базы данных.
+    :param task_id: Идентификатор задачи.
+    :return: Строка (result, result_ref, result_size, result_digest) или
+             None, если задача не найдена.
+    """
+    result = await db.execute(
+        select(
+            models.Task.result,
+            models.Task.result_ref,
+            models.Task.result_size,
+            models.Task.result_digest
+        ).where(models.Task.id == task_id)
+    )
+    return result.first()
+
+
+async def enqueue_tasks(
+    db: AsyncSession,
+    messages: List[dict],
+    available_at: List[Optional[datetime]] = None
+):
+    """
+    Добавляет сообщения для очереди в outbox в текущей транзакции.
+
+    Сообщения публикует `OutboxRelay` после фиксации транзакции, поэтому
+    задача и её сообщение либо сохраняются вместе, либо не сохраняются.
+
+    :param db: Сессия базы данных.
+    :param messages: Сообщения из `task_message`.
+    :param available_at: Время публикации для каждого сообщения
+                         (None - сразу).
+    """
+    if messages:
+        now = datetime.utcnow()
+        if available_at is None:
+            available_at = [None] * len(messages)
+        await db.execute(
+            insert(models.OutboxMessage),
+            [
+                {
+                    'task_id': message['id'],
+                    'payload': json.dumps(message),
+                    'created_at': now,
+                    'available_at': at or now,
+                }
+                for message, at in zip(messages, available_at)
+            ]
+        )
+
+
+def _task_run_at(task: schemas.TaskCreate) -> Optional[datetime]:
+    """
+    Время запуска отложенной задачи в UTC без часового пояса, как и
+    остальные даты в БД.
+    """
+    if task.delay is not None:
+        return datetime.utcnow() + timedelta(seconds=task.delay)
+    run_at = task.run_at
+    if run_at is not None and run_at.tzinfo is not None:
+        run_at = run_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return run_at
+
+
+def _task_priority(task: schemas.TaskCreate) -> models.TaskPriority:
+    if task.priority is None:
+        return models.TaskPriority.NORMAL
+    return models.TaskPriority(task.priority.value)
+
+
+async def _add_task(
+    db: AsyncSession,
+    task: schemas.TaskCreate
+):
+    payload = await encode_payload(task.data)
+    db_task = models.Task(
+        type=task.type,
+        priority=_task_priority(task),
+        run_at=_task_run_at(task),
+        data=payload.data,
+        data_ref=payload.ref
+    )
+    db.add(db_task)
+    await db.flush()
+    await enqueue_tasks(db, [task_message(
+        db_task.id,
+        db_task.type,
+        task.data if payload.inline else None,
+        db_task.priority
+    )], [db_task.run_at])
     return db_task
 
 
-def create_task(
-    db: Session,
+async def create_task(
+    db: AsyncSession,
     task: schemas.TaskCreate
 ):
     """
-    Создаёт новую задачу в базе данных.
+    Создаёт новую задачу в базе данных вместе с её входными данными и
+    сообщением для очереди в outbox.
 
     :param db: Сессия базы данных.
     :param task: Данные новой задачи.
     :return: Созданная задача.
     """
-    db_task = models.Task(type=task.type)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    db_task = await _add_task(db, task)
+    await db.commit()
+    await cache_task(db_task)
     return db_task
 
 
-def update_task(
-    db: Session,
+class IdempotencyKeyMismatch(ValueError):
+    """
+    Ключ идемпотентности уже использован для запроса с другим телом.
+    """
+
+
+def idempotency_cache_key(key: str) -> str:
+    return f"idem:{key}"
+
+
+def payload_idempotency_key(task: schemas.TaskCreate) -> str:
+    """
+    Ключ идемпотентности по содержимому задачи (тип и входные данные).
+
+    Тип и данные хешируются, поэтому длина ключа не зависит от них и
+    укладывается в колонку `idempotency_keys.key`.
+    """
+    return "payload:" + payload_digest({'type': task.type, 'data': task.data})
+
+
+def request_digest(task: schemas.TaskCreate) -> str:
+    """
+    Хеш всего тела запроса на создание задачи, с которым сверяется
+    повторный запрос с тем же Idempotency-Key.
+    """
+    return payload_digest(json.loads(task.json()))
+
+
+def _parse_idempotency_cache(value):
+    """
+    :return: Кортеж (task_id, request_hash) из значения в Redis.
+    """
+    if isinstance(value, bytes):
+        value = value.decode()
+    task_id, _, request_hash = str(value).partition(":")
+    return int(task_id), request_hash or None
+
+
+def _check_request_hash(stored: Optional[str], request_hash: Optional[str]):
+    if stored and request_hash and stored != request_hash:
+        raise IdempotencyKeyMismatch(
+            "Idempotency-Key was already used with a different request."
+        )
+
+
+async def create_task_idempotent(
+    db: AsyncSession,
+    task: schemas.TaskCreate,
+    key: str,
+    window: int,
+    request_hash: Optional[str] = None
+):
+    """
+    Создаёт задачу, если за последние `window` секунд задача с тем же
+    ключом идемпотентности ещё не создавалась.
+
+    Сначала ключ проверяется в Redis. Затем ключ захватывается
+    INSERT ... ON CONFLICT DO UPDATE ... WHERE created_at < начала окна:
+    новый или просроченный ключ захватывается, действующий - нет.
+    Конкурентный дубликат ждёт на первичном ключе, пока первая
+    транзакция не зафиксируется, и получает уже созданную задачу, так
+    что задача и сообщение в очередь создаются один раз.
+
+    Вместе с ключом хранится `request_hash`; повтор с тем же ключом, но
+    другим телом запроса, не возвращает старую задачу, а завершается
+    ошибкой.
+
+    :param db: Сессия базы данных.
+    :param task: Данные новой задачи.
+    :param key: Ключ идемпотентности.
+    :param window: Окно дедупликации в секундах.
+    :param request_hash: Хеш тела запроса (`request_digest`); None - не
+                         сверять тело.
+    :return: Кортеж (задача, создана ли она этим вызовом).
+    :raises IdempotencyKeyMismatch: Если ключ использован с другим телом.
+    :raises ValueError: Если первый запрос с этим ключом ещё выполняется.
+    """
+    cache_key = idempotency_cache_key(key)
+    redis = await get_redis()
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        cached_id, cached_hash = _parse_idempotency_cache(cached)
+        _check_request_hash(cached_hash, request_hash)
+        existing = await get_task(db, cached_id)
+        if existing is not None:
+            return existing, False
+
+    now = datetime.utcnow()
+    claim = (
+        pg_insert(models.IdempotencyKey)
+        .values(
+            key=key, task_id=None, request_hash=request_hash, created_at=now
+        )
+        .on_conflict_do_update(
+            index_elements=[models.IdempotencyKey.key],
+            set_={
+                'task_id': None,
+                'request_hash': request_hash,
+                'created_at': now,
+            },
+            where=models.IdempotencyKey.created_at < now - timedelta(
+                seconds=window
+            )
+        )
+        .returning(models.IdempotencyKey.key)
+    )
+    claimed = (await db.execute(claim)).first()
+    if claimed is None:
+        await db.rollback()
+        task_id, stored_hash = (await db.execute(
+            select(
+                models.IdempotencyKey.task_id,
+                models.IdempotencyKey.request_hash
+            )
+            .where(models.IdempotencyKey.key == key)
+        )).one()
+        _check_request_hash(stored_hash, request_hash)
+        existing = await get_task(db, task_id) if task_id else None
+        if existing is None:
+            raise ValueError("Duplicate request is still being processed.")
+        return existing, False
+
+    db_task = await _add_task(db, task)
+    await db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.key == key)
+        .values(task_id=db_task.id)
+    )
+    await db.commit()
+    await redis.set(cache_key, f"{db_task.id}:{request_hash or ''}", ex=window)
+    return await cache_task(db_task), True
+
+
+async def create_tasks(
+    db: AsyncSession,
+    tasks: List[schemas.TaskCreate]
+):
+    """
+    Создаёт несколько задач и их сообщения в outbox одной транзакцией.
+
+    Строки вставляются многострочным INSERT ... RETURNING, без
+    построения объектов ORM.
+
+    :param db: Сессия базы данных.
+    :param tasks: Данные новых задач.
+    :return: Идентификаторы созданных задач в порядке `tasks`.
+    """
+    if not tasks:
+        return []
+    payloads = [await encode_payload(task.data) for task in tasks]
+    run_at = [_task_run_at(task) for task in tasks]
+    now = datetime.utcnow()
+    result = await db.execute(
+        insert(models.Task).returning(
+            models.Task.id,
+            sort_by_parameter_order=True
+        ),
+        [
+            {
+                'type': task.type,
+                'priority': _task_priority(task),
+                'status': models.TaskStatus.PENDING,
+                'data': payload.data,
+                'data_ref': payload.ref,
+                'run_at': task_run_at,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for task, payload, task_run_at in zip(tasks, payloads, run_at)
+        ]
+    )
+    task_ids = list(result.scalars())
+    await enqueue_tasks(db, [
+        task_message(
+            task_id,
+            task.type,
+            task.data if payload.inline else None,
+            _task_priority(task)
+        )
+        for task_id, task, payload in zip(task_ids, tasks, payloads)
+    ], run_at)
+    await db.commit()
+    return task_ids
+
+
+async def update_task(
+    db: AsyncSession,
     db_task: models.Task,
     updates: schemas.TaskUpdate
 ):
@@ -99,35 +568,279 @@ def update_task(
     for field, value in updates.dict(exclude_unset=True).items():
         setattr(db_task, field, value)
     db_task.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
+    await cache_task(db_task)
+    await publish_task_events([task_event(db_task.id, db_task.status)])
     return db_task
 
 
-def cancel_task(
-    db: Session,
+CANCELABLE_STATUSES = ACTIVE_STATUSES
+
+
+async def cancel_task(
+    db: AsyncSession,
     db_task: models.Task
 ):
     """
     Отменяет задачу, устанавливая статус CANCELED.
 
+    Статус меняется условным UPDATE только у задач в PENDING или
+    IN_PROGRESS, поэтому отмена не перетирает уже записанный результат.
+    После фиксации воркерам рассылается команда отмены: они
+    пропускают сообщения задачи и прерывают её выполнение.
+
     :param db: Сессия базы данных.
     :param db_task: Объект задачи, которую необходимо отменить.
     :return: Обновлённая задача.
+    :raises ValueError: Если задача уже завершена или отменена.
     """
-    db_task.status = models.TaskStatus.CANCELED
-    db_task.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_task)
+    result = await db.execute(
+        update(models.Task)
+        .where(
+            models.Task.id == db_task.id,
+            models.Task.status.in_(CANCELABLE_STATUSES)
+        )
+        .values(
+            status=models.TaskStatus.CANCELED,
+            updated_at=datetime.utcnow()
+        )
+        .returning(models.Task.id)
+    )
+    if result.first() is None:
+        await db.rollback()
+        raise ValueError("Only pending or running tasks can be canceled.")
+    await db.commit()
+    await db.refresh(db_task)
+    await publish_cancellations([db_task.id])
+    await cache_task(db_task)
+    await publish_task_events([task_event(db_task.id, db_task.status)])
+    if db_task.workflow_id is not None:
+        await advance_workflow(db, db_task.workflow_id)
     return db_task
 
 
+async def create_workflow(
+    db: AsyncSession,
+    workflow: schemas.WorkflowCreate
+) -> schemas.Workflow:
+    """
+    Создаёт workflow и все его задачи одной транзакцией. В outbox
+    попадают только задачи первого шага; задачи следующих шагов ждут в
+    PENDING, пока их не поставит в очередь `advance_workflow`.
+
+    :param db: Сессия базы данных.
+    :param workflow: Шаги workflow.
+    :return: Созданный workflow.
+    """
+    now = datetime.utcnow()
+    db_workflow = models.Workflow(
+        status=models.TaskStatus.IN_PROGRESS,
+        stage_count=len(workflow.stages),
+        current_stage=0,
+        created_at=now,
+        updated_at=now
+    )
+    db.add(db_workflow)
+    await db.flush()
+    tasks = [
+        (stage, task)
+        for stage, workflow_stage in enumerate(workflow.stages)
+        for task in workflow_stage.tasks
+    ]
+    payloads = [await encode_payload(task.data) for _, task in tasks]
+    result = await db.execute(
+        insert(models.Task).returning(
+            models.Task.id,
+            sort_by_parameter_order=True
+        ),
+        [
+            {
+                'type': task.type,
+                'priority': _task_priority(task),
+                'status': models.TaskStatus.PENDING,
+                'data': payload.data,
+                'data_ref': payload.ref,
+                'workflow_id': db_workflow.id,
+                'workflow_stage': stage,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for (stage, task), payload in zip(tasks, payloads)
+        ]
+    )
+    task_ids = list(result.scalars())
+    await enqueue_tasks(db, [
+        task_message(
+            task_id,
+            task.type,
+            task.data if payload.inline else None,
+            _task_priority(task)
+        )
+        for task_id, (stage, task), payload in zip(task_ids, tasks, payloads)
+        if stage == 0
+    ])
+    await db.commit()
+    stages = [[] for _ in workflow.stages]
+    for task_id, (stage, _) in zip(task_ids, tasks):
+        stages[stage].append(task_id)
+    return schemas.Workflow(
+        id=db_workflow.id,
+        status=db_workflow.status.value,
+        current_stage=0,
+        stages=stages,
+        created_at=now,
+        updated_at=now
+    )
+
+
+async def get_workflow(
+    db: AsyncSession,
+    workflow_id: int
+) -> Optional[schemas.Workflow]:
+    """
+    :param db: Сессия базы данных.
+    :param workflow_id: Идентификатор workflow.
+    :return: Workflow с идентификаторами задач по шагам или None.
+    """
+    db_workflow = await db.get(models.Workflow, workflow_id)
+    if db_workflow is None:
+        return None
+    result = await db.execute(
+        select(models.Task.id, models.Task.workflow_stage)
+        .where(models.Task.workflow_id == workflow_id)
+        .order_by(models.Task.workflow_stage, models.Task.id)
+    )
+    stages = [[] for _ in range(db_workflow.stage_count)]
+    for task_id, stage in result:
+        stages[stage].append(task_id)
+    return schemas.Workflow(
+        id=db_workflow.id,
+        status=db_workflow.status.value,
+        current_stage=db_workflow.current_stage,
+        stages=stages,
+        created_at=db_workflow.created_at,
+        updated_at=db_workflow.updated_at
+    )
+
+
+async def advance_workflow(db: AsyncSession, workflow_id: int) -> List[int]:
+    """
+    Продвигает workflow по состоянию его задач.
+
+    Строка workflow блокируется на время проверки, поэтому при
+    одновременном завершении задач шага следующий шаг ставится в очередь
+    один раз. Состояние пересчитывается по статусам задач, а не по
+    счётчику, так что повторный вызов безопасен.
+
+    - Если какая-то задача упала или отменена, workflow получает статус
+      FAILED или CANCELED, а его незавершённые задачи отменяются.
+    - Если все задачи текущего шага выполнены, задачи следующего шага
+      получают результаты текущего в `data['upstream']` и попадают в
+      outbox; после последнего шага workflow переходит в COMPLETED.
+
+    :param db: Сессия базы данных.
+    :param workflow_id: Идентификатор workflow.
+    :return: Идентификаторы задач, поставленных в очередь.
+    """
+    db_workflow = (await db.execute(
+        select(models.Workflow)
+        .where(models.Workflow.id == workflow_id)
+        .with_for_update()
+    )).scalar_one_or_none()
+    if db_workflow is None or \
+            db_workflow.status != models.TaskStatus.IN_PROGRESS:
+        await db.rollback()
+        return []
+    rows = (await db.execute(
+        select(
+            models.Task.id,
+            models.Task.workflow_stage,
+            models.Task.status,
+            models.Task.result,
+            models.Task.result_ref
+        )
+        .where(models.Task.workflow_id == workflow_id)
+        .order_by(models.Task.workflow_stage, models.Task.id)
+    )).all()
+    now = datetime.utcnow()
+    statuses = {row.status for row in rows}
+    if statuses & {models.TaskStatus.FAILED, models.TaskStatus.CANCELED}:
+        canceled = await db.execute(
+            update(models.Task)
+            .where(
+                models.Task.workflow_id == workflow_id,
+                models.Task.status.in_(CANCELABLE_STATUSES)
+            )
+            .values(status=models.TaskStatus.CANCELED, updated_at=now)
+            .returning(models.Task.id)
+        )
+        canceled_ids = list(canceled.scalars())
+        db_workflow.status = (
+            models.TaskStatus.FAILED
+            if models.TaskStatus.FAILED in statuses
+            else models.TaskStatus.CANCELED
+        )
+        db_workflow.updated_at = now
+        await db.commit()
+        await publish_cancellations(canceled_ids)
+        await invalidate_tasks(*canceled_ids)
+        await publish_task_events([
+            task_event(task_id, models.TaskStatus.CANCELED)
+            for task_id in canceled_ids
+        ])
+        return []
+
+    stage = db_workflow.current_stage
+    current = [row for row in rows if row.workflow_stage == stage]
+    if any(row.status != models.TaskStatus.COMPLETED for row in current):
+        await db.rollback()
+        return []
+    db_workflow.updated_at = now
+    if stage + 1 >= db_workflow.stage_count:
+        db_workflow.status = models.TaskStatus.COMPLETED
+        await db.commit()
+        return []
+
+    upstream = [
+        await load_result(row.result, row.result_ref) for row in current
+    ]
+    next_tasks = (await db.execute(
+        select(models.Task)
+        .options(undefer(models.Task.data), undefer(models.Task.data_ref))
+        .where(
+            models.Task.workflow_id == workflow_id,
+            models.Task.workflow_stage == stage + 1
+        )
+        .order_by(models.Task.id)
+    )).scalars().all()
+    messages = []
+    for db_task in next_tasks:
+        data = await decode_payload(db_task.data, db_task.data_ref)
+        data['upstream'] = upstream
+        payload = await encode_payload(data)
+        db_task.data, db_task.data_ref = payload.data, payload.ref
+        db_task.updated_at = now
+        messages.append(task_message(
+            db_task.id,
+            db_task.type,
+            data if payload.inline else None,
+            db_task.priority
+        ))
+    await enqueue_tasks(db, messages)
+    db_workflow.current_stage = stage + 1
+    await db.commit()
+    return [message['id'] for message in messages]
+
+
 async def retry_task(
-    db: Session,
+    db: AsyncSession,
     db_task: models.Task
 ):
     """
-    Перезапускает задачу, если её статус FAILED.
+    Перезапускает задачу, если её статус FAILED, и добавляет её сообщение
+    в outbox. Воркер возьмёт сохранённые входные данные из БД. Прогресс и
+    частичные результаты прошлой попытки удаляются.
 
     :param db: Сессия базы данных.
     :param db_task: Объект задачи, которую нужно перезапустить.
@@ -138,8 +851,108 @@ async def retry_task(
         db_task.status = models.TaskStatus.PENDING
         db_task.updated_at = datetime.utcnow()
         db_task.result = None
+        db_task.result_ref = None
+        db_task.result_size = None
+        db_task.result_digest = None
+        await enqueue_tasks(db, [task_message(
+            db_task.id, db_task.type, priority=db_task.priority
+        )])
+        # До фиксации: после неё воркер может начать новую попытку и
+        # сообщить её прогресс
+        await clear_progress(db_task.id)
         await db.commit()
         await db.refresh(db_task)
+        await cache_task(db_task)
+        await publish_task_events([task_event(db_task.id, db_task.status)])
         return db_task
     else:
         raise ValueError("Only failed tasks can be retried.")
+
+
+async def start_task(
+    db,
+    task_id: int,
+    redelivered: bool = False,
+    with_payload: bool = False
+):
+    """
+    Переводит задачу в IN_PROGRESS одним условным UPDATE ... RETURNING.
+
+    Запускаются только задачи в статусе PENDING; повторно доставленное
+    сообщение может подхватить и задачу, зависшую в IN_PROGRESS после
+    падения воркера. Отменённые, завершённые и несуществующие задачи
+    не затрагиваются.
+
+    :param db: Соединение или сессия базы данных.
+    :param task_id: Идентификатор задачи.
+    :param redelivered: Сообщение доставлено брокером повторно.
+    :param with_payload: Вернуть также сохранённые входные данные
+                         (колонки data, data_ref).
+    :return: Строка (id, type, workflow_id[, data, data_ref]) или None,
+             если задачу запускать не нужно.
+    """
+    allowed = [models.TaskStatus.PENDING]
+    if redelivered:
+        allowed.append(models.TaskStatus.IN_PROGRESS)
+    query = (
+        update(models.Task)
+        .where(models.Task.id == task_id, models.Task.status.in_(allowed))
+        .values(
+            status=models.TaskStatus.IN_PROGRESS,
+            updated_at=datetime.utcnow()
+        )
+        .returning(models.Task.id, models.Task.type, models.Task.workflow_id)
+    )
+    if with_payload:
+        query = query.returning(models.Task.data, models.Task.data_ref)
+    result = await db.execute(query)
+    return result.first()
+
+
+FINISH_TASKS_QUERY = text("""
+    UPDATE tasks
+    SET status = v.status, result = v.result, result_ref = v.result_ref,
+        result_size = v.result_size, result_digest = v.result_digest,
+        updated_at = :updated_at
+    FROM unnest(
+        CAST(:ids AS integer[]),
+        CAST(:statuses AS taskstatus[]),
+        CAST(:results AS text[]),
+        CAST(:result_refs AS text[]),
+        CAST(:result_sizes AS integer[]),
+        CAST(:result_digests AS text[])
+    ) AS v(id, status, result, result_ref, result_size, result_digest)
+    WHERE tasks.id = v.id AND tasks.status = 'IN_PROGRESS'
+    RETURNING tasks.id
+""")
+
+
+async def finish_tasks(
+    db,
+    updates: List[Tuple[int, models.TaskStatus, StoredResult]]
+):
+    """
+    Записывает итоговые статусы нескольких задач одним запросом.
+
+    Обновляются только задачи в статусе IN_PROGRESS, поэтому запись не
+    перетирает отмену или результат другого воркера.
+
+    :param db: Соединение или сессия базы данных.
+    :param updates: Список кортежей (id, статус, результат из
+                    `encode_result`).
+    :return: Множество id задач, которые были обновлены.
+    """
+    stored = [result for _, _, result in updates]
+    result = await db.execute(
+        FINISH_TASKS_QUERY,
+        {
+            'ids': [task_id for task_id, _, _ in updates],
+            'statuses': [status.value for _, status, _ in updates],
+            'results': [item.text for item in stored],
+            'result_refs': [item.ref for item in stored],
+            'result_sizes': [item.size for item in stored],
+            'result_digests': [item.digest for item in stored],
+            'updated_at': datetime.utcnow(),
+        }
+    )
+    return {row.id for row in result}
@@ -1,12 +1,34 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-import os
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+from app.resources import DATABASE_URL, build_engine, resources  # noqa: F401
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-AsyncSessionLocal = sessionmaker(
-    bind=engine, class_=AsyncSession,
+
+class LazySessionmaker(sessionmaker):
+    """
+    Фабрика сессий, которая берёт движок из `resources` при создании
+    сессии, а не при импорте.
+
+    :param get_bind: Функция, возвращающая движок.
+    """
+
+    def __init__(self, get_bind, **kw):
+        super().__init__(**kw)
+        self._get_bind = get_bind
+
+    def __call__(self, **local_kw):
+        local_kw.setdefault("bind", self._get_bind())
+        return super().__call__(**local_kw)
+
+
+AsyncSessionLocal = LazySessionmaker(
+    lambda: resources.engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+ReadSessionLocal = LazySessionmaker(
+    lambda: resources.read_engine,
+    class_=AsyncSession,
     expire_on_commit=False
 )
 
@@ -14,3 +36,11 @@ AsyncSessionLocal = sessionmaker(
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db():
+    """
+    Сессия для запросов только на чтение: реплика, если она задана.
+    """
+    async with ReadSessionLocal() as session:
+        yield session
@@ -1,11 +1,55 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .resources import resources
 from .routers import tasks
+from .utils.caching import listen_invalidations
+from .utils.events import event_hub
+from .utils.metrics import RequestMetricsMiddleware
+from .workers.relay import outbox_relay
+
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    При старте открывает соединения с RabbitMQ, подписывается на
+    инвалидации кеша и события задач и запускает ретранслятор outbox.
+    При остановке отменяет фоновые задачи и закрывает все клиенты.
+    """
+    await resources.start()
+    background_tasks = [
+        asyncio.create_task(listen_invalidations()),
+        asyncio.create_task(event_hub.run()),
+    ]
+    if OUTBOX_RELAY_ENABLED:
+        background_tasks.append(asyncio.create_task(outbox_relay.run()))
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await resources.close()
 
 
 app = FastAPI(
     title="Task Manager API",
     description="API для управления задачами",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.include_router(tasks.router)
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Метрики процесса API в формате Prometheus.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,12 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Text
+from sqlalchemy import (
+    Column, Integer, BigInteger, SmallInteger, String, DateTime, Enum, Text,
+    Index, LargeBinary, text
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 import enum
 from datetime import datetime
 
 Base = declarative_base()
 
 
-class TaskStatus(enum.Enum):
+class TaskStatus(str, enum.Enum):
     PENDING = "PENDING"
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
@@ -14,12 +18,134 @@ class TaskStatus(enum.Enum):
     CANCELED = "CANCELED"
 
 
+class TaskPriority(str, enum.Enum):
+    HIGH = "HIGH"
+    NORMAL = "NORMAL"
+    LOW = "LOW"
+
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Индексы под фильтры и keyset-пагинацию списка задач
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_tasks_type_created_at_id", "type", "created_at", "id"),
+        # Задачи workflow выбираются по шагу при его продвижении
+        Index("ix_tasks_workflow_id_stage", "workflow_id", "workflow_stage"),
+        # Сборщик блобов проверяет, остались ли ссылки на блоб
+        Index(
+            "ix_tasks_data_ref", "data_ref",
+            postgresql_where=text("data_ref IS NOT NULL")
+        ),
+        Index(
+            "ix_tasks_result_ref", "result_ref",
+            postgresql_where=text("result_ref IS NOT NULL")
+        ),
+        # Помесячные секции по created_at, см. миграцию 0008 и
+        # app/workers/retention.py
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Первичный ключ в БД - (id, created_at), так как он обязан включать
+    # ключ секций; для ORM задача по-прежнему определяется одним id.
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     type = Column(String, index=True)
     status = Column(Enum(TaskStatus), default=TaskStatus.PENDING)
+    priority = Column(
+        Enum(TaskPriority),
+        nullable=False,
+        default=TaskPriority.NORMAL,
+        server_default=TaskPriority.NORMAL.value
+    )
     result = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Размер (байт UTF-8) и SHA-256 результата. Большие результаты
+    # хранятся сжатыми в blob store по ссылке result_ref, а колонка
+    # result для них пуста; см. app/utils/results.py.
+    result_size = Column(Integer, nullable=True)
+    result_digest = Column(String(64), nullable=True)
+    result_ref = Column(String(64), nullable=True)
+    # Входные данные: сжатый zlib JSON или ссылка на блоб в blob store.
+    # Не загружаются при обычном чтении задач.
+    data = deferred(Column(LargeBinary, nullable=True))
+    data_ref = deferred(Column(String(64), nullable=True))
+    # Время запуска отложенной задачи (UTC); None - сразу после создания.
+    run_at = Column(DateTime, nullable=True)
+    # Workflow и номер его шага; None для самостоятельных задач.
+    workflow_id = Column(Integer, nullable=True)
+    workflow_stage = Column(SmallInteger, nullable=True)
+    created_at = Column(
+        DateTime, primary_key=True, nullable=False, default=datetime.utcnow
+    )
     updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class TaskCounter(Base):
+    """
+    Количество задач по типу и статусу, разбитое на шарды. Поддерживается
+    триггерами на tasks; итог - сумма по шардам.
+    """
+    __tablename__ = "task_counters"
+
+    type = Column(String, primary_key=True)
+    status = Column(Enum(TaskStatus), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    count = Column(BigInteger, nullable=False)
+
+
+class OutboxMessage(Base):
+    """
+    Сообщение для очереди задач, записанное в одной транзакции с задачей.
+    Публикуется и удаляется `OutboxRelay`, когда наступает `available_at`.
+    """
+    __tablename__ = "task_outbox"
+    __table_args__ = (
+        # Ретранслятор выбирает созревшие сообщения диапазоном по индексу
+        Index("ix_task_outbox_available_at_id", "available_at", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(
+        DateTime, nullable=False, default=datetime.utcnow
+    )
+
+
+class Workflow(Base):
+    """
+    Цепочка шагов, каждый из которых - группа задач, выполняемых
+    параллельно. Следующий шаг ставится в очередь воркером, когда все
+    задачи текущего шага завершились; см. `crud.advance_workflow`.
+    """
+    __tablename__ = "workflows"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(
+        Enum(TaskStatus),
+        nullable=False,
+        default=TaskStatus.IN_PROGRESS
+    )
+    stage_count = Column(SmallInteger, nullable=False)
+    current_stage = Column(SmallInteger, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """
+    Ключ идемпотентности создания задачи. Первичный ключ по `key`
+    гарантирует, что конкурентные дубликаты создадут одну задачу.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    task_id = Column(Integer, nullable=True)
+    # SHA-256 тела запроса; повтор ключа с другим телом отклоняется
+    request_hash = Column(String(64), nullable=True)
+    created_at = Column(
+        DateTime, nullable=False, default=datetime.utcnow, index=True
+    )
@@ -0,0 +1,132 @@
+import os
+from functools import cached_property
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+# Необязательная реплика для чтения: на неё уходят GET /tasks/ и
+# GET /tasks/{id}. Запись, long-poll и воркер работают с основной БД.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REDIS_URL = os.getenv("REDIS_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Соединения старше этого (в секундах) переоткрываются; -1 - никогда.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Проверка соединения перед выдачей из пула стоит лишнего обращения к БД
+# на каждый checkout, поэтому по умолчанию выключена.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+# Кеш подготовленных выражений asyncpg на соединение; по умолчанию
+# размер как в asyncpg. 0 нужен только за пулером соединений в режиме
+# transaction (например, pgbouncer с pool_mode=transaction), которого
+# в поставке нет; при прямом подключении к PostgreSQL кеш не мешает.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Кеш скомпилированных SQLAlchemy выражений на движок.
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", 1000))
+
+
+def build_engine(
+    url: str,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    echo: bool = DB_ECHO,
+    statement_cache_size: int = DB_STATEMENT_CACHE_SIZE,
+    query_cache_size: int = DB_QUERY_CACHE_SIZE
+):
+    """
+    Создаёт асинхронный движок с настройками пула из окружения.
+
+    :param url: URL базы данных.
+    :return: AsyncEngine.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.utils.metrics import TimedQueuePool
+
+    return create_async_engine(
+        url,
+        echo=echo,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        query_cache_size=query_cache_size,
+        connect_args={
+            'prepared_statement_cache_size': statement_cache_size,
+        },
+    )
+
+
+class Resources:
+    """
+    Общие клиенты процесса: движки БД, Redis и издатель RabbitMQ.
+
+    Клиент создаётся при первом обращении, поэтому импорт приложения не
+    требует настроенных сервисов и не открывает соединений. API и воркер
+    используют один и тот же экземпляр `resources`; `close` закрывает всё
+    созданное, после чего клиенты можно создать заново.
+    """
+
+    @cached_property
+    def engine(self):
+        return build_engine(DATABASE_URL)
+
+    @cached_property
+    def autocommit_engine(self):
+        # Тот же пул соединений, но без явных транзакций: одиночный запрос
+        # выполняется за одно обращение к БД, без отдельных BEGIN/COMMIT.
+        return self.engine.execution_options(isolation_level="AUTOCOMMIT")
+
+    @cached_property
+    def read_engine(self):
+        if DATABASE_REPLICA_URL:
+            return build_engine(DATABASE_REPLICA_URL)
+        return self.engine
+
+    @cached_property
+    def redis(self):
+        import aioredis
+        return aioredis.from_url(REDIS_URL)
+
+    @cached_property
+    def publisher(self):
+        from app.workers.produser import publisher
+        return publisher
+
+    def _created(self, name):
+        return vars(self).get(name)
+
+    async def start(self):
+        """
+        Открывает соединения с RabbitMQ заранее, чтобы первый запрос не
+        платил за подключение. Пулы БД и Redis наполняются по мере
+        запросов.
+        """
+        await self.publisher.start()
+
+    async def close(self):
+        """
+        Закрывает все созданные клиенты.
+        """
+        publisher = self._created('publisher')
+        if publisher is not None:
+            await publisher.close()
+        redis = self._created('redis')
+        if redis is not None:
+            await redis.close()
+        read_engine = self._created('read_engine')
+        engine = self._created('engine')
+        if read_engine is not None and read_engine is not engine:
+            await read_engine.dispose()
+        if engine is not None:
+            await engine.dispose()
+        for name in ('publisher', 'redis', 'read_engine',
+                     'autocommit_engine', 'engine'):
+            vars(self).pop(name, None)
+
+
+resources = Resources()
@@ -1,10 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (
+    APIRouter, Depends, Header, HTTPException, Query, Response
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud, schemas
-from app.dependencies import get_db
-from app.workers.produser import send_task_to_queue
+from app.dependencies import get_db, get_read_db, ReadSessionLocal
+from app.utils.events import event_hub, TERMINAL_STATUSES
+from app.utils.export import iter_csv, iter_ndjson
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.progress import get_partial_results, get_progress
+from app.utils.results import iter_result, parse_range
+from app.workers.relay import outbox_relay
+from app.workers.tasks import registry
 from typing import List, Optional
 from datetime import datetime
+import asyncio
+import json
+import os
+
+TASK_BATCH_MAX_SIZE = int(os.getenv("TASK_BATCH_MAX_SIZE", 1000))
+TASK_WAIT_MAX_TIMEOUT = float(os.getenv("TASK_WAIT_MAX_TIMEOUT", 60))
+SSE_KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", 15))
+IDEMPOTENCY_WINDOW = crud.IDEMPOTENCY_WINDOW
+# "1" - без заголовка Idempotency-Key дубликаты определяются по типу и
+# входным данным задачи.
+IDEMPOTENCY_PAYLOAD_DEDUP = os.getenv("IDEMPOTENCY_PAYLOAD_DEDUP", "0") == "1"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
 
 
 router = APIRouter(
@@ -14,28 +35,66 @@ router = APIRouter(
 )
 
 
+def _with_default_priority(task: schemas.TaskCreate) -> schemas.TaskCreate:
+    """
+    Подставляет приоритет типа задачи из реестра, если он не указан.
+    """
+    if task.priority is None and task.type in registry:
+        task.priority = schemas.TaskPriority(
+            registry.get(task.type).priority.value
+        )
+    return task
+
+
+async def _with_progress(db_task):
+    """
+    Добавляет к выполняющейся задаче прогресс, сообщённый обработчиком.
+    """
+    if db_task.status.value != schemas.TaskStatus.IN_PROGRESS.value:
+        return db_task
+    progress = await get_progress(db_task.id)
+    if progress is None:
+        return db_task
+    if not isinstance(db_task, schemas.Task):
+        db_task = schemas.Task.from_orm(db_task)
+    return db_task.copy(update={'progress': progress})
+
+
 @router.get("/", response_model=List[schemas.Task])
 async def read_tasks(
+    response: Response,
     status: Optional[schemas.TaskStatus] = None,
     type: Optional[str] = None,
     created_after: Optional[datetime] = None,
     created_before: Optional[datetime] = None,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список задач с возможностью фильтрации.
 
+    Задачи отдаются от новых к старым. Если страница заполнена целиком,
+    в заголовке `X-Next-Cursor` возвращается курсор следующей страницы;
+    его нужно передать в параметре `cursor` следующего запроса.
+
+    :param response: Ответ, в который добавляется заголовок курсора.
     :param status: Фильтр по статусу задачи.
     :param type: Фильтр по типу задачи.
     :param created_after: Фильтр по дате создания (начиная с).
     :param created_before: Фильтр по дате создания (до).
-    :param skip: Количество записей, которые нужно пропустить.
+    :param skip: Количество записей, которые нужно пропустить
+                 (не используется вместе с `cursor`).
     :param limit: Максимальное количество записей в ответе.
+    :param cursor: Курсор страницы из заголовка `X-Next-Cursor`.
     :param db: Асинхронная сессия базы данных.
     :return: Список задач, соответствующих критериям фильтрации.
     """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     tasks = await crud.get_tasks(
         db,
         status=status,
@@ -43,11 +102,233 @@ async def read_tasks(
         created_after=created_after,
         created_before=created_before,
         skip=skip,
-        limit=limit
+        limit=limit,
+        after=after
     )
+    if tasks and len(tasks) == limit:
+        last = tasks[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            last.created_at, last.id
+        )
     return tasks
 
 
+EXPORT_MEDIA_TYPES = {
+    schemas.ExportFormat.NDJSON: "application/x-ndjson",
+    schemas.ExportFormat.CSV: "text/csv",
+}
+
+
+@router.get("/stats", response_model=schemas.TaskStats)
+async def read_task_stats(db: AsyncSession = Depends(get_read_db)):
+    """
+    Получить количество задач по статусам и типам.
+
+    Счётчики обновляются триггерами при изменении задач, поэтому запрос
+    не сканирует таблицу задач.
+
+    :param db: Асинхронная сессия базы данных.
+    :return: Статистика задач.
+    """
+    return await crud.get_task_stats(db)
+
+
+@router.get("/export")
+async def export_tasks(
+    status: Optional[schemas.TaskStatus] = None,
+    type: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON
+):
+    """
+    Выгрузить задачи потоком в NDJSON или CSV.
+
+    Фильтры те же, что у списка задач. Строки читаются серверным курсором
+    и сразу отправляются клиенту, поэтому память не зависит от размера
+    выгрузки. Сессия открывается внутри потока, так как ответ
+    формируется уже после выхода из обработчика.
+
+    :param status: Фильтр по статусу задачи.
+    :param type: Фильтр по типу задачи.
+    :param created_after: Фильтр по дате создания (начиная с).
+    :param created_before: Фильтр по дате создания (до).
+    :param format: Формат выгрузки: ndjson или csv.
+    :return: Потоковый ответ с задачами.
+    """
+    serialize = iter_csv if format == schemas.ExportFormat.CSV \
+        else iter_ndjson
+
+    async def content():
+        async with ReadSessionLocal() as db:
+            tasks = crud.stream_tasks(
+                db,
+                status=status,
+                type=type,
+                created_after=created_after,
+                created_before=created_before
+            )
+            async for chunk in serialize(tasks):
+                yield chunk
+
+    return StreamingResponse(
+        content(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition":
+                f'attachment; filename="tasks.{format.value}"'
+        }
+    )
+
+
+@router.get("/events")
+async def task_events(
+    ids: Optional[List[int]] = Query(None)
+):
+    """
+    Поток событий смены статуса задач (Server-Sent Events).
+
+    Каждое событие - JSON вида {"id": ..., "status": ...}. Без параметра
+    `ids` передаются события всех задач.
+
+    :param ids: Идентификаторы задач, события которых нужны.
+    :return: Потоковый ответ text/event-stream.
+    """
+    async def content():
+        with event_hub.subscribe(ids) as queue:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), SSE_KEEPALIVE_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        content(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/{task_id}/wait", response_model=schemas.Task)
+async def wait_task(
+    task_id: int,
+    timeout: float = Query(30, ge=0),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Дождаться завершения задачи (long-poll).
+
+    Возвращает задачу, как только она перейдёт в COMPLETED, FAILED или
+    CANCELED, либо по истечении таймаута в текущем состоянии.
+
+    :param task_id: Идентификатор задачи.
+    :param timeout: Максимальное время ожидания в секундах.
+    :param db: Асинхронная сессия базы данных.
+    :return: Задача.
+    """
+    timeout = min(timeout, TASK_WAIT_MAX_TIMEOUT)
+    with event_hub.waiter(task_id) as finished:
+        db_task = await crud.get_task(db, task_id=task_id)
+        if db_task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if db_task.status.value in TERMINAL_STATUSES:
+            return db_task
+        try:
+            await asyncio.wait_for(finished, timeout)
+        except asyncio.TimeoutError:
+            return await _with_progress(db_task)
+    # Событие может обогнать инвалидацию кеша процесса, поэтому итоговое
+    # состояние читаем из БД.
+    return await crud.get_task(db, task_id=task_id, use_cache=False)
+
+
+@router.get("/{task_id}/partial", response_model=schemas.TaskPartial)
+async def read_task_partial(
+    task_id: int,
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить частичные результаты выполняющейся задачи.
+
+    Частичные результаты хранятся в Redis ограниченное время (PROGRESS_TTL).
+    Клиент передаёт `next_offset` из предыдущего ответа, чтобы получить
+    только новые.
+
+    :param task_id: Идентификатор задачи.
+    :param offset: Номер первого частичного результата.
+    :param db: Асинхронная сессия базы данных.
+    :return: Частичные результаты и прогресс задачи.
+    """
+    db_task = await crud.get_task(db, task_id=task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    chunks, progress = await asyncio.gather(
+        get_partial_results(task_id, offset), get_progress(task_id)
+    )
+    return schemas.TaskPartial(
+        id=task_id,
+        status=db_task.status.value,
+        progress=progress,
+        chunks=chunks,
+        next_offset=offset + len(chunks)
+    )
+
+
+@router.get("/{task_id}/result")
+async def read_task_result(
+    task_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить результат задачи целиком или диапазон байт (заголовок Range).
+
+    Большие результаты не отдаются в списке и карточке задачи, только
+    здесь: сжатый блоб распаковывается по частям во время отправки.
+
+    :param task_id: Идентификатор задачи.
+    :param range_header: Заголовок Range, например "bytes=0-1023".
+    :param db: Асинхронная сессия базы данных.
+    :return: Потоковый ответ с результатом (200 или 206).
+    """
+    row = await crud.get_task_result(db, task_id=task_id)
+    if row is None or (row.result is None and row.result_ref is None):
+        raise HTTPException(status_code=404, detail="Result not found")
+    size = row.result_size
+    if size is None:
+        # Результат записан до появления колонок размера и дайджеста
+        size = len(row.result.encode())
+    headers = {"Accept-Ranges": "bytes"}
+    if row.result_digest is not None:
+        headers["ETag"] = f'"{row.result_digest}"'
+    start, end, status_code = 0, size - 1, 200
+    if range_header is not None:
+        try:
+            requested = parse_range(range_header, size)
+        except ValueError:
+            raise HTTPException(
+                status_code=416,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{size}"}
+            )
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_result(row.result, row.result_ref, start, end),
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
+
 @router.post("/{task_id}/retry", response_model=schemas.Task)
 async def retry_task(
     task_id: int,
@@ -56,20 +337,20 @@ async def retry_task(
     """
     Повторно отправить задачу в очередь на выполнение.
 
+    Сообщение записывается в outbox вместе с изменением статуса и
+    публикуется фоновым ретранслятором. Воркер берёт сохранённые
+    входные данные задачи из БД.
+
     :param task_id: Идентификатор задачи.
     :param db: Асинхронная сессия базы данных.
     :return: Обновлённая задача.
     """
-    db_task = await crud.get_task(db, task_id=task_id)
+    db_task = await crud.get_task(db, task_id=task_id, use_cache=False)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     try:
         retried_task = await crud.retry_task(db, db_task=db_task)
-        await send_task_to_queue({
-            'id': retried_task.id,
-            'type': retried_task.type,
-            'data': retried_task.data
-        })
+        outbox_relay.kick()
         return retried_task
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
@@ -78,29 +359,177 @@ async def retry_task(
 @router.post("/", response_model=schemas.Task)
 async def create_task(
     task: schemas.TaskCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Создать новую задачу и отправить её в очередь.
 
+    Сообщение попадает в очередь класса приоритета задачи; без явного
+    приоритета используется приоритет её типа.
+
+    Задача и сообщение для очереди сохраняются одной транзакцией в БД;
+    публикацию в RabbitMQ выполняет фоновый ретранслятор outbox.
+
+    Повторный запрос с тем же заголовком `Idempotency-Key` в течение
+    IDEMPOTENCY_WINDOW секунд возвращает уже созданную задачу с
+    заголовком `Idempotent-Replayed: true`. Если тело запроса отличается
+    от первого, возвращается 422.
+
+    Задача неизвестного типа или со слишком большими входными данными
+    отклоняется с кодом 422, как и в пакетном создании.
+
     :param task: Данные для создания задачи.
+    :param idempotency_key: Ключ идемпотентности запроса.
     :param db: Асинхронная сессия базы данных.
     :return: Созданная задача.
     """
-    db_task = await crud.create_task(db=db, task=task)
-    task_data = {
-        'id': db_task.id,
-        'type': db_task.type,
-        'data': task.data
-    }
-    await send_task_to_queue(task_data)
+    try:
+        registry.get(task.type).check_input(task.data)
+    except ValueError as ve:
+        raise HTTPException(status_code=422, detail=str(ve))
+    task = _with_default_priority(task)
+    # Тело сверяется только для ключа из заголовка: ключ по содержимому
+    # и так определяется типом и данными задачи.
+    request_hash = None
+    if idempotency_key is not None:
+        request_hash = crud.request_digest(task)
+    elif IDEMPOTENCY_PAYLOAD_DEDUP:
+        idempotency_key = crud.payload_idempotency_key(task)
+    if idempotency_key is None:
+        db_task = await crud.create_task(db=db, task=task)
+        outbox_relay.kick()
+        return db_task
+
+    if not idempotency_key or \
+            len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail="Idempotency-Key must be 1 to "
+                   f"{IDEMPOTENCY_KEY_MAX_LENGTH} characters long"
+        )
+    try:
+        db_task, created = await crud.create_task_idempotent(
+            db=db,
+            task=task,
+            key=idempotency_key,
+            window=IDEMPOTENCY_WINDOW,
+            request_hash=request_hash
+        )
+    except crud.IdempotencyKeyMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if created:
+        outbox_relay.kick()
+    else:
+        response.headers["Idempotent-Replayed"] = "true"
     return db_task
 
 
+@router.post("/batch", response_model=schemas.TaskBatchResult)
+async def create_tasks_batch(
+    batch: schemas.TaskBatchCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Создать несколько задач одним запросом и отправить их в очередь.
+
+    Все корректные задачи и их сообщения для очереди вставляются одной
+    транзакцией, а ретранслятор outbox публикует их пачкой. Задачи
+    неизвестного типа или со слишком большими входными данными не
+    создаются и перечислены в `errors`.
+
+    :param batch: Список задач для создания.
+    :param db: Асинхронная сессия базы данных.
+    :return: Идентификаторы созданных задач и ошибки по индексам.
+    """
+    if len(batch.tasks) > TASK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size exceeds the limit of {TASK_BATCH_MAX_SIZE}."
+        )
+
+    ids = [None] * len(batch.tasks)
+    errors = []
+    accepted = []
+    for index, task in enumerate(batch.tasks):
+        try:
+            registry.get(task.type).check_input(task.data)
+        except ValueError as ve:
+            errors.append(schemas.TaskBatchError(index=index, detail=str(ve)))
+            continue
+        accepted.append((index, _with_default_priority(task)))
+
+    task_ids = await crud.create_tasks(db, [task for _, task in accepted])
+    outbox_relay.kick()
+    for (index, _), task_id in zip(accepted, task_ids):
+        ids[index] = task_id
+    return schemas.TaskBatchResult(ids=ids, errors=errors)
+
+
+@router.post("/workflows", response_model=schemas.Workflow)
+async def create_workflow(
+    workflow: schemas.WorkflowCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Создать workflow: цепочку шагов, каждый из которых - группа задач.
+
+    Задачи всех шагов создаются сразу, в очередь попадает первый шаг.
+    Следующий шаг ставит в очередь воркер, завершивший последнюю задачу
+    текущего, и передаёт ему результаты в `data['upstream']`. Если
+    задача упала или отменена, оставшиеся задачи workflow отменяются.
+
+    :param workflow: Шаги workflow.
+    :param db: Асинхронная сессия базы данных.
+    :return: Созданный workflow с идентификаторами задач по шагам.
+    """
+    size = sum(len(stage.tasks) for stage in workflow.stages)
+    if size > TASK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Workflow size exceeds the limit of {TASK_BATCH_MAX_SIZE}."
+        )
+    for stage_index, stage in enumerate(workflow.stages):
+        for index, task in enumerate(stage.tasks):
+            try:
+                registry.get(task.type).check_input(task.data)
+            except ValueError as ve:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Stage {stage_index}, task {index}: {ve}"
+                )
+            stage.tasks[index] = _with_default_priority(task)
+
+    db_workflow = await crud.create_workflow(db, workflow)
+    outbox_relay.kick()
+    return db_workflow
+
+
+@router.get("/workflows/{workflow_id}", response_model=schemas.Workflow)
+async def read_workflow(
+    workflow_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить состояние workflow и идентификаторы его задач по шагам.
+
+    :param workflow_id: Идентификатор workflow.
+    :param db: Асинхронная сессия базы данных.
+    :return: Workflow.
+    """
+    db_workflow = await crud.get_workflow(db, workflow_id=workflow_id)
+    if db_workflow is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return db_workflow
+
+
 @router.get("/{task_id}", response_model=schemas.Task)
 async def read_task(
     task_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить информацию о задаче по её идентификатору.
@@ -112,7 +541,7 @@ async def read_task(
     db_task = await crud.get_task(db, task_id=task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return db_task
+    return await _with_progress(db_task)
 
 
 @router.put("/{task_id}", response_model=schemas.Task)
@@ -129,7 +558,7 @@ async def update_task(
     :param db: Асинхронная сессия базы данных.
     :return: Обновлённая задача.
     """
-    db_task = await crud.get_task(db, task_id=task_id)
+    db_task = await crud.get_task(db, task_id=task_id, use_cache=False)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     updated_task = await crud.update_task(
@@ -148,12 +577,16 @@ async def cancel_task(
     """
     Отменить задачу по её идентификатору.
 
+    Выполняющаяся задача прерывается воркером.
+
     :param task_id: Идентификатор задачи.
     :param db: Асинхронная сессия базы данных.
     :return: Отменённая задача.
     """
-    db_task = await crud.get_task(db, task_id=task_id)
+    db_task = await crud.get_task(db, task_id=task_id, use_cache=False)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    canceled_task = await crud.cancel_task(db, db_task=db_task)
-    return canceled_task
+    try:
+        return await crud.cancel_task(db, db_task=db_task)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
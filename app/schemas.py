@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
 from datetime import datetime
 from enum import Enum
+from typing import Any, Dict, List, Optional
 
 
 class TaskStatus(str, Enum):
@@ -11,6 +12,17 @@ class TaskStatus(str, Enum):
     CANCELED = "CANCELED"
 
 
+class TaskPriority(str, Enum):
+    HIGH = "HIGH"
+    NORMAL = "NORMAL"
+    LOW = "LOW"
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
 class TaskBase(BaseModel):
     type: str
 
@@ -18,8 +30,50 @@ class TaskBase(BaseModel):
 class TaskCreate(TaskBase):
     """
     Схема для создания задачи.
+
+    Если приоритет не указан, берётся приоритет типа задачи из реестра.
+    Отложенная задача задаётся либо временем запуска `run_at`, либо
+    задержкой `delay` в секундах.
     """
     data: dict = {}
+    priority: Optional[TaskPriority] = None
+    run_at: Optional[datetime] = None
+    delay: Optional[float] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_schedule(cls, values):
+        if values.get('run_at') is not None and \
+                values.get('delay') is not None:
+            raise ValueError("Specify either run_at or delay, not both.")
+        if values.get('delay') is not None and values['delay'] < 0:
+            raise ValueError("delay must not be negative.")
+        return values
+
+
+class TaskBatchCreate(BaseModel):
+    """
+    Схема для пакетного создания задач.
+    """
+    tasks: List[TaskCreate]
+
+
+class TaskBatchError(BaseModel):
+    """
+    Ошибка создания или постановки в очередь одной задачи пачки.
+    """
+    index: int
+    detail: str
+
+
+class TaskBatchResult(BaseModel):
+    """
+    Результат пакетного создания задач.
+
+    `ids` совпадает по порядку с задачами запроса; для задач, которые не
+    были созданы, стоит None.
+    """
+    ids: List[Optional[int]]
+    errors: List[TaskBatchError] = []
 
 
 class TaskUpdate(BaseModel):
@@ -36,9 +90,91 @@ class Task(TaskBase):
     """
     id: int
     status: TaskStatus
+    priority: TaskPriority = TaskPriority.NORMAL
     result: str = None
+    # Для больших результатов `result` пуст; сам результат отдаёт
+    # GET /tasks/{id}/result.
+    result_size: Optional[int] = None
+    result_digest: Optional[str] = None
+    run_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
+    # Процент выполнения, который сообщил обработчик; только для
+    # выполняющихся задач в GET /tasks/{id}
+    progress: Optional[float] = None
 
     class Config:
         orm_mode = True
+
+
+class TaskPartial(BaseModel):
+    """
+    Частичные результаты выполняющейся задачи.
+    """
+    id: int
+    status: TaskStatus
+    progress: Optional[float] = None
+    chunks: List[Any]
+    next_offset: int
+
+
+class TaskCount(BaseModel):
+    """
+    Количество задач одного типа в одном статусе.
+    """
+    type: str
+    status: TaskStatus
+    count: int
+
+
+class TaskStats(BaseModel):
+    """
+    Количество задач по статусам и по парам (тип, статус).
+    """
+    total: int
+    by_status: Dict[TaskStatus, int]
+    counts: List[TaskCount]
+
+
+class WorkflowStage(BaseModel):
+    """
+    Шаг workflow: группа задач, выполняемых параллельно.
+    """
+    tasks: List[TaskCreate]
+
+
+class WorkflowCreate(BaseModel):
+    """
+    Схема для создания workflow.
+
+    Шаги выполняются по порядку: задачи следующего шага ставятся в очередь,
+    когда все задачи предыдущего завершились успешно, и получают их
+    результаты в `data['upstream']` в порядке задач шага. Цепочка - это
+    шаги из одной задачи, reducer - последний шаг из одной задачи.
+    """
+    stages: List[WorkflowStage]
+
+    @root_validator(skip_on_failure=True)
+    def check_stages(cls, values):
+        stages = values['stages']
+        if not stages or any(not stage.tasks for stage in stages):
+            raise ValueError("Workflow stages must not be empty.")
+        for stage in stages:
+            for task in stage.tasks:
+                if task.run_at is not None or task.delay is not None:
+                    raise ValueError("Workflow tasks cannot be delayed.")
+        return values
+
+
+class Workflow(BaseModel):
+    """
+    Состояние workflow.
+
+    `stages` - идентификаторы задач каждого шага в порядке запроса.
+    """
+    id: int
+    status: TaskStatus
+    current_stage: int
+    stages: List[List[int]]
+    created_at: datetime
+    updated_at: datetime
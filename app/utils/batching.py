@@ -0,0 +1,93 @@
+import asyncio
+
+from app.utils.progress import detach_progress
+
+
+class MicroBatcher:
+    """
+    Копит отдельные элементы и обрабатывает их пачкой.
+
+    Пачка отправляется в обработчик по заполнении `max_batch_size` или по
+    истечении `batch_window` секунд с момента прихода первого элемента.
+    Обработчик принимает список элементов и возвращает список результатов
+    той же длины; элементом результата может быть исключение, тогда оно
+    достаётся только соответствующему вызывающему.
+
+    :param handler: Корутина, обрабатывающая список элементов.
+    :param max_batch_size: Максимальный размер пачки.
+    :param batch_window: Максимальное время ожидания пачки в секундах.
+    :param name: Имя для сообщений об ошибках.
+    """
+
+    def __init__(self, handler, max_batch_size: int, batch_window: float,
+                 name: str = None):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.name = name or getattr(handler, "__qualname__", "batch")
+        self._pending = []
+        self._timer = None
+        self._running = set()
+
+    async def submit(self, item):
+        """
+        Добавляет элемент в текущую пачку и ждёт его результат.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_window, self.flush)
+        return await future
+
+    def flush(self):
+        """
+        Немедленно отправляет накопленную пачку в обработчик.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def drain(self):
+        """
+        Отправляет остаток и дожидается всех запущенных пачек.
+        """
+        self.flush()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self, batch):
+        # Пачка объединяет разных вызывающих, поэтому не сообщает прогресс
+        # от имени того, чей контекст скопировала задача пачки.
+        detach_progress()
+        # Элементы, чьи вызывающие уже отменены, не обрабатываем
+        batch = [(item, future) for item, future in batch
+                 if not future.cancelled()]
+        if not batch:
+            return
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Batch handler {self.name} returned "
+                    f"{len(results)} results for {len(batch)} inputs."
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
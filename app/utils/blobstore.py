@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+
+
+class BlobStore:
+    """
+    Хранилище блобов с адресацией по содержимому в локальном каталоге.
+
+    Ключ блоба - SHA-256 его содержимого, поэтому одинаковые данные
+    хранятся один раз. Каталог может быть общим для API и воркеров
+    (например, volume или сетевой диск).
+
+    :param root: Корневой каталог хранилища.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put_sync(self, data: bytes) -> str:
+        """
+        Сохраняет блоб, если его ещё нет.
+
+        :param data: Содержимое.
+        :return: SHA-256 содержимого в hex.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            # Обновляем время изменения: сборщик мусора не удаляет блобы,
+            # записанные или переиспользованные недавно.
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем, чтобы
+        # читатели не увидели недописанный блоб.
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get_sync(self, digest: str) -> bytes:
+        """
+        :param digest: SHA-256 содержимого в hex.
+        :return: Содержимое блоба.
+        :raises FileNotFoundError: Если блоба нет.
+        """
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def list_older_than(self, cutoff: float) -> list:
+        """
+        :param cutoff: Время (Unix time); блобы, изменённые позже, не
+                       попадают в список.
+        :return: Ключи блобов, изменённых до `cutoff`.
+        """
+        digests = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if len(name) != 64:
+                    # Временные файлы недописанных блобов
+                    continue
+                try:
+                    mtime = os.stat(os.path.join(directory, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime < cutoff:
+                    digests.append(name)
+        return digests
+
+    def delete_sync(self, digest: str, older_than: float = None) -> bool:
+        """
+        Удаляет блоб.
+
+        :param digest: SHA-256 содержимого в hex.
+        :param older_than: Если задано, блоб, изменённый после этого
+                           времени (Unix time), не удаляется.
+        :return: True, если блоб удалён.
+        """
+        path = self.path(digest)
+        try:
+            if older_than is not None and \
+                    os.stat(path).st_mtime >= older_than:
+                return False
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def put(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.put_sync, data)
+
+    async def get(self, digest: str) -> bytes:
+        return await asyncio.to_thread(self.get_sync, digest)
+
+
+blob_store = BlobStore()
@@ -1,46 +1,238 @@
+import asyncio
+import hashlib
 import os
 import json
-import aioredis
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
 from pydantic.json import pydantic_encoder
 
-REDIS_URL = os.getenv("REDIS_URL")
-redis = aioredis.from_url(REDIS_URL)
+from app.resources import resources
+from app.utils.metrics import CACHE_LOOKUPS
+
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 10000))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 30))
+INVALIDATION_CHANNEL = "cache:invalidate"
+MEMO_LOCAL_SIZE = int(os.getenv("MEMO_LOCAL_SIZE", 10000))
+# Ограничение памяти кеша результатов в процессе (байт JSON)
+MEMO_LOCAL_BYTES = int(os.getenv("MEMO_LOCAL_BYTES", 64 * 1024 * 1024))
+MEMO_TTL = int(os.getenv("MEMO_TTL", 3600))
+MEMO_MAX_RESULT_SIZE = int(os.getenv("MEMO_MAX_RESULT_SIZE", 64 * 1024))
+
+logger = logging.getLogger(__name__)
+
+_local_hits = CACHE_LOOKUPS.labels("local", "hit")
+_local_misses = CACHE_LOOKUPS.labels("local", "miss")
+_redis_hits = CACHE_LOOKUPS.labels("redis", "hit")
+_redis_misses = CACHE_LOOKUPS.labels("redis", "miss")
+_memo_hits = CACHE_LOOKUPS.labels("memo", "hit")
+_memo_misses = CACHE_LOOKUPS.labels("memo", "miss")
 
+# Идентификатор процесса: свои же сообщения об инвалидации пропускаем,
+# чтобы не выбрасывать только что записанное значение.
+PROCESS_ID = uuid.uuid4().hex
 
-async def get_cache(key: str):
+
+class LocalCache:
+    """
+    Кеш в памяти процесса с вытеснением по LRU и временем жизни записей.
+
+    :param maxsize: Максимальное количество записей.
+    :param ttl: Время жизни записи в секундах.
+    :param maxbytes: Ограничение суммарного размера записей, переданного
+                     в `set`; None - без ограничения.
     """
-    Получает данные из кеша Redis по заданному ключу.
+
+    def __init__(self, maxsize: int = LOCAL_CACHE_SIZE,
+                 ttl: float = LOCAL_CACHE_TTL,
+                 maxbytes: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        """
+        :return: Значение или None, если записи нет или она устарела.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: float = None, size: int = 0):
+        """
+        :param ttl: Время жизни записи; по умолчанию `self.ttl`.
+        :param size: Размер значения для ограничения `maxbytes`.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.delete(key)
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (
+            self.maxbytes is not None and self.bytes > self.maxbytes
+        ):
+            _, (_, _, evicted) = self._data.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def delete(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        :return: Размер кеша и счётчики попаданий, промахов и вытеснений.
+        """
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+local_cache = LocalCache()
+
+
+def _json_encode(value) -> str:
+    return json.dumps(value, default=pydantic_encoder)
+
+
+async def get_cache(key: str, decoder=json.loads):
+    """
+    Получает данные из кеша: сначала из памяти процесса, затем из Redis.
 
     :param key: Ключ кеша
-    :return: Распакованные JSON-данные или None, если ключ не найден
+    :param decoder: Функция декодирования значения из Redis
+                    (по умолчанию JSON)
+    :return: Декодированные данные или None, если ключ не найден
     """
-    data = await redis.get(key)
+    value = local_cache.get(key)
+    if value is not None:
+        _local_hits.inc()
+        return value
+    _local_misses.inc()
+    data = await resources.redis.get(key)
     if data:
-        return json.loads(data)
+        _redis_hits.inc()
+        value = decoder(data)
+        if value is not None:
+            local_cache.set(key, value)
+        return value
+    _redis_misses.inc()
     return None
 
 
-async def set_cache(key: str, value, expire: int = 3600):
+async def set_cache(key: str, value, expire: int = 3600,
+                    broadcast: bool = True, encoder=_json_encode):
     """
-    Записывает данные в кеш Redis с установленным временем жизни.
+    Записывает данные в кеш Redis с установленным временем жизни и в кеш
+    процесса. Остальные процессы получают инвалидацию через pub/sub.
+
+    В кеш процесса кладётся сам объект, поэтому `decoder` в `get_cache`
+    должен возвращать объекты того же вида.
 
     :param key: Ключ кеша
-    :param value: Данные для сохранения (объект, который можно сериализовать в JSON)
+    :param value: Данные для сохранения
     :param expire: Время жизни ключа в секундах (по умолчанию 3600)
+    :param broadcast: Разослать инвалидацию другим процессам. При
+                      заполнении кеша после промаха не требуется.
+    :param encoder: Функция кодирования значения для Redis
+                    (по умолчанию JSON)
+    """
+    data = encoder(value)
+    async with resources.redis.pipeline(transaction=False) as pipe:
+        pipe.set(key, data, ex=expire)
+        if broadcast:
+            pipe.publish(INVALIDATION_CHANNEL, _invalidation_message([key]))
+        await pipe.execute()
+    local_cache.set(key, value, ttl=min(expire, local_cache.ttl))
+
+
+async def invalidate(*keys: str):
+    """
+    Удаляет ключи из Redis и из кешей всех процессов.
+
+    :param keys: Ключи кеша
+    """
+    if not keys:
+        return
+    for key in keys:
+        local_cache.delete(key)
+    async with resources.redis.pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        pipe.publish(INVALIDATION_CHANNEL, _invalidation_message(keys))
+        await pipe.execute()
+
+
+def _invalidation_message(keys) -> str:
+    return json.dumps({'origin': PROCESS_ID, 'keys': list(keys)})
+
+
+async def listen_invalidations(reconnect_delay: float = 1.0):
     """
-    data = json.dumps(value, default=pydantic_encoder)
-    await redis.set(key, data, ex=expire)
+    Слушает канал инвалидаций и удаляет ключи из кеша процесса.
+
+    Пока подписка не активна, сообщения могут теряться, поэтому после
+    переподключения кеш процесса очищается целиком.
 
-REDIS_URL = os.getenv("REDIS_URL")
+    :param reconnect_delay: Пауза перед переподключением в секундах.
+    """
+    while True:
+        pubsub = resources.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            local_cache.clear()
+            async for message in pubsub.listen():
+                payload = json.loads(message['data'])
+                if payload['origin'] == PROCESS_ID:
+                    continue
+                for key in payload['keys']:
+                    local_cache.delete(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener failed")
+            await asyncio.sleep(reconnect_delay)
+        finally:
+            await pubsub.close()
 
 
 async def get_redis():
     """
-    Устанавливает и возвращает подключение к Redis.
+    Возвращает общее подключение к Redis.
 
     :return: Экземпляр подключения aioredis.Redis
     """
-    return await aioredis.from_url(REDIS_URL)
+    return resources.redis
 
 
 async def cache_result(key: str, value: str, expire: int = 3600):
@@ -53,3 +245,161 @@ async def cache_result(key: str, value: str, expire: int = 3600):
     """
     redis = await get_redis()
     await redis.set(key, value, ex=expire)
+
+
+def payload_digest(payload) -> str:
+    """
+    SHA-256 канонического JSON (с сортировкой ключей) входных данных.
+
+    :param payload: Данные, сериализуемые в JSON.
+    :return: Хеш в hex.
+    """
+    canonical = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResultMemo:
+    """
+    Кеш результатов детерминированных задач по хешу входных данных.
+
+    Результат ищется сначала в памяти процесса (LRU с ограничением
+    числа записей и суммарного размера), затем в Redis. Одновременные
+    вычисления одного и того же ключа в процессе объединяются:
+    обработчик выполняется один раз.
+
+    Кеш необязателен для выполнения задачи: ошибки Redis пишутся в лог и
+    считаются промахом, а результат, который не удалось сохранить,
+    всё равно возвращается.
+
+    :param local_size: Количество записей в кеше процесса.
+    :param ttl: Время жизни результата в секундах.
+    :param max_result_size: Результаты длиннее этого (в JSON) не
+                            кешируются, чтобы не вытеснять остальные.
+    :param local_bytes: Суммарный размер результатов (в JSON) в кеше
+                        процесса.
+    """
+
+    def __init__(self, local_size: int = MEMO_LOCAL_SIZE,
+                 ttl: int = MEMO_TTL,
+                 max_result_size: int = MEMO_MAX_RESULT_SIZE,
+                 local_bytes: int = MEMO_LOCAL_BYTES):
+        self.local = LocalCache(
+            maxsize=local_size, ttl=ttl, maxbytes=local_bytes
+        )
+        self.ttl = ttl
+        self.max_result_size = max_result_size
+        self.hits = 0
+        self.misses = 0
+        self._in_flight = {}
+
+    @staticmethod
+    def key(task_type: str, payload) -> str:
+        """
+        Ключ результата: тип задачи и хеш входных данных.
+        """
+        return f"memo:{task_type}:{payload_digest(payload)}"
+
+    async def get(self, key: str):
+        """
+        :return: Кортеж (найден ли результат, результат).
+        """
+        entry = self.local.get(key)
+        if entry is not None:
+            return True, entry[0]
+        try:
+            data = await resources.redis.get(key)
+        except Exception:
+            logger.warning("Failed to read memoized result %s", key,
+                           exc_info=True)
+            return False, None
+        if data is None:
+            return False, None
+        value = json.loads(data)
+        self.local.set(key, (value,), size=len(data))
+        return True, value
+
+    async def set(self, key: str, value, ttl: int = None):
+        data = json.dumps(value)
+        if len(data) > self.max_result_size:
+            return
+        self.local.set(key, (value,), size=len(data))
+        try:
+            await cache_result(key, data, expire=ttl or self.ttl)
+        except Exception:
+            logger.warning("Failed to store memoized result %s", key,
+                           exc_info=True)
+
+    async def get_or_run(self, key: str, run, ttl: int = None):
+        """
+        Возвращает сохранённый результат или выполняет `run` и сохраняет
+        его результат. Исключения не кешируются.
+
+        Вычисление регистрируется до обращения к Redis, поэтому
+        одновременные вызовы с тем же ключом ждут одно чтение из Redis
+        и один запуск `run`. Общее вычисление отменяется, когда отменены
+        все ожидающие его вызовы, поэтому отмена задачи прерывает и
+        вычисление её результата.
+
+        :param key: Ключ из `ResultMemo.key`.
+        :param run: Корутинная функция без аргументов.
+        :param ttl: Время жизни результата (по умолчанию `self.ttl`).
+        """
+        flight = self._in_flight.get(key)
+        if flight is None:
+            entry = self.local.get(key)
+            if entry is not None:
+                self.hits += 1
+                _memo_hits.inc()
+                return entry[0]
+            flight = self._in_flight[key] = [
+                asyncio.ensure_future(self._load_or_run(key, run, ttl)), 0
+            ]
+        else:
+            self.hits += 1
+            _memo_hits.inc()
+        return await self._wait(flight)
+
+    async def _load_or_run(self, key: str, run, ttl: int = None):
+        try:
+            found, value = await self.get(key)
+            if found:
+                self.hits += 1
+                _memo_hits.inc()
+                return value
+            self.misses += 1
+            _memo_misses.inc()
+            value = await run()
+        finally:
+            self._in_flight.pop(key, None)
+        await self.set(key, value, ttl)
+        return value
+
+    @staticmethod
+    async def _wait(flight):
+        # flight - [future вычисления, число ожидающих]
+        future = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not future.done():
+                future.cancel()
+
+    def stats(self) -> dict:
+        """
+        :return: Попадания, промахи и доля попаданий.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'local': self.local.stats(),
+        }
+
+
+result_memo = ResultMemo()
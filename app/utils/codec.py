@@ -0,0 +1,87 @@
+import json
+from datetime import datetime, timedelta
+
+from app import schemas
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack необязателен
+    msgpack = None
+
+# Версия раскладки полей. При изменении набора или порядка полей версию
+# нужно увеличить: записи старой версии читаются как промах кеша.
+TASK_CODEC_VERSION = 4
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _pack_datetime(value: datetime):
+    return None if value is None else (value - _EPOCH) // _MICROSECOND
+
+
+def _unpack_datetime(value):
+    return None if value is None else _EPOCH + value * _MICROSECOND
+
+
+def _pack(row) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(row, use_bin_type=True)
+    return json.dumps(row, separators=(",", ":")).encode()
+
+
+def _unpack(data: bytes):
+    # JSON-массив начинается с '[', массив msgpack - с байта 0x90-0x9f/0xdc.
+    if data[:1] == b"[":
+        return json.loads(data)
+    return msgpack.unpackb(data, raw=False)
+
+
+def encode_task(task) -> bytes:
+    """
+    Кодирует задачу в компактный массив фиксированной раскладки.
+
+    :param task: Объект с атрибутами задачи (модель ORM или schemas.Task).
+    :return: Байты для записи в кеш.
+    """
+    return _pack([
+        TASK_CODEC_VERSION,
+        task.id,
+        task.type,
+        getattr(task.status, "value", task.status),
+        getattr(task.priority, "value", task.priority),
+        task.result,
+        task.result_size,
+        task.result_digest,
+        _pack_datetime(task.run_at),
+        _pack_datetime(task.created_at),
+        _pack_datetime(task.updated_at),
+    ])
+
+
+def decode_task(data: bytes):
+    """
+    Декодирует задачу сразу в схему ответа без повторной валидации.
+
+    :param data: Байты, полученные из `encode_task`.
+    :return: schemas.Task или None, если запись другой версии.
+    """
+    row = _unpack(data)
+    if not row or row[0] != TASK_CODEC_VERSION:
+        return None
+    (
+        _, task_id, task_type, status, priority, result, result_size,
+        result_digest, run_at, created_at, updated_at
+    ) = row
+    return schemas.Task.construct(
+        id=task_id,
+        type=task_type,
+        status=schemas.TaskStatus(status),
+        priority=schemas.TaskPriority(priority),
+        result=result,
+        result_size=result_size,
+        result_digest=result_digest,
+        run_at=_unpack_datetime(run_at),
+        created_at=_unpack_datetime(created_at),
+        updated_at=_unpack_datetime(updated_at),
+    )
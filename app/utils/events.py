@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+
+from app.resources import resources
+
+TASK_EVENTS_CHANNEL = "task:events"
+# Канал команд воркерам; в отличие от `task:events`, в нём только редкие
+# команды, поэтому его слушает каждый воркер.
+TASK_CONTROL_CHANNEL = "task:control"
+TERMINAL_STATUSES = frozenset(("COMPLETED", "FAILED", "CANCELED"))
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def task_event(task_id: int, status) -> dict:
+    """
+    Событие смены статуса задачи.
+
+    :param task_id: Идентификатор задачи.
+    :param status: Новый статус (enum или строка).
+    """
+    return {'id': task_id, 'status': getattr(status, "value", status)}
+
+
+async def publish_task_events(events):
+    """
+    Публикует пачку событий смены статуса одним сообщением.
+
+    :param events: Список событий из `task_event`.
+    """
+    if events:
+        await resources.redis.publish(
+            TASK_EVENTS_CHANNEL,
+            json.dumps({'events': list(events)})
+        )
+
+
+async def publish_cancellations(task_ids):
+    """
+    Рассылает воркерам команду отмены задач.
+
+    :param task_ids: Идентификаторы отменённых задач.
+    """
+    if task_ids:
+        await resources.redis.publish(
+            TASK_CONTROL_CHANNEL,
+            json.dumps({'cancel': list(task_ids)})
+        )
+
+
+class TaskEventHub:
+    """
+    Раздаёт события смены статуса задач ожидающим запросам процесса.
+
+    На процесс приходится одна подписка Redis pub/sub, через которую
+    обслуживаются все long-poll ожидания и SSE-потоки.
+    """
+
+    def __init__(self):
+        self._waiters = {}
+        self._subscribers = set()
+
+    @contextmanager
+    def waiter(self, task_id: int):
+        """
+        Регистрирует ожидание завершения задачи.
+
+        Ожидание нужно зарегистрировать до чтения текущего статуса, чтобы
+        не пропустить событие, пришедшее между чтением и ожиданием.
+
+        :param task_id: Идентификатор задачи.
+        :return: Future, который получает событие с итоговым статусом.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(task_id, set()).add(future)
+        try:
+            yield future
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[task_id]
+
+    @contextmanager
+    def subscribe(self, task_ids=None):
+        """
+        Подписывает поток на все события или на события указанных задач.
+
+        :param task_ids: Идентификаторы задач (None - все задачи).
+        :return: asyncio.Queue с событиями. При переполнении очереди
+                 новые события для неё отбрасываются.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (frozenset(task_ids) if task_ids else None, queue)
+        self._subscribers.add(subscriber)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def dispatch(self, event: dict):
+        """
+        Передаёт событие ожидающим и подписчикам.
+        """
+        task_id = event['id']
+        if event['status'] in TERMINAL_STATUSES:
+            for future in self._waiters.get(task_id, ()):
+                if not future.done():
+                    future.set_result(event)
+        for task_ids, queue in self._subscribers:
+            if task_ids is None or task_id in task_ids:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    pass
+
+    async def run(self, reconnect_delay: float = 1.0):
+        """
+        Слушает канал событий и раздаёт их, пока не будет отменён.
+
+        :param reconnect_delay: Пауза перед переподключением в секундах.
+        """
+        while True:
+            pubsub = resources.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(TASK_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    for event in json.loads(message['data'])['events']:
+                        self.dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Task event listener failed")
+                await asyncio.sleep(reconnect_delay)
+            finally:
+                await pubsub.close()
+
+
+event_hub = TaskEventHub()
@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+
+EXPORT_FIELDS = (
+    "id", "type", "status", "result", "result_size", "result_digest",
+    "created_at", "updated_at"
+)
+EXPORT_CHUNK_ROWS = 500
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _task_row(task):
+    # Колонки status и updated_at в БД допускают NULL
+    return (
+        task.id,
+        task.type,
+        task.status.value if task.status is not None else None,
+        task.result,
+        task.result_size,
+        task.result_digest,
+        _isoformat(task.created_at),
+        _isoformat(task.updated_at),
+    )
+
+
+async def iter_ndjson(tasks, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Сериализует задачи в NDJSON: один JSON-объект на строку.
+
+    Строки объединяются в куски по `chunk_rows`, чтобы не отправлять
+    клиенту отдельный кусок ответа на каждую задачу.
+
+    :param tasks: Асинхронный итератор задач.
+    :param chunk_rows: Количество строк в одном куске ответа.
+    :return: Асинхронный итератор строк.
+    """
+    lines = []
+    async for task in tasks:
+        lines.append(json.dumps(dict(zip(EXPORT_FIELDS, _task_row(task)))))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def iter_csv(tasks, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Сериализует задачи в CSV с заголовком.
+
+    :param tasks: Асинхронный итератор задач.
+    :param chunk_rows: Количество строк в одном куске ответа.
+    :return: Асинхронный итератор строк.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    async for task in tasks:
+        writer.writerow(_task_row(task))
+        rows += 1
+        if rows >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
@@ -0,0 +1,198 @@
+import logging
+import time
+
+from prometheus_client import (
+    Counter as PromCounter, Histogram, start_http_server
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
+
+logger = logging.getLogger(__name__)
+
+TASK_DURATION_BUCKETS = (
+    .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300
+)
+
+
+DB_ROUND_TRIPS = PromCounter(
+    "db_round_trips_total",
+    "Обращения воркера к БД: запросы и BEGIN/COMMIT/ROLLBACK"
+)
+TASKS_PROCESSED = PromCounter(
+    "worker_tasks_processed_total",
+    "Сообщения с задачами, обработанные воркером"
+)
+
+
+def counter_value(counter) -> float:
+    """
+    Текущее значение счётчика Prometheus без меток.
+    """
+    for metric in counter.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                return sample.value
+    return 0.0
+
+
+def _count_statement(*args, **kwargs):
+    DB_ROUND_TRIPS.inc()
+
+
+def _count_transaction_command(conn, *args):
+    # SQLAlchemy вызывает begin/commit/rollback и в режиме AUTOCOMMIT,
+    # но asyncpg тогда не отправляет в БД ни BEGIN, ни COMMIT/ROLLBACK.
+    if conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+        DB_ROUND_TRIPS.inc()
+
+
+def instrument_engine(engine):
+    """
+    Считает обращения к БД через движок: выполненные запросы, а также
+    BEGIN/COMMIT/ROLLBACK, которые asyncpg отправляет отдельными
+    сообщениями. Соединения в режиме AUTOCOMMIT (autocommit_engine)
+    отправляют только сами запросы.
+
+    :param engine: AsyncEngine или Engine SQLAlchemy.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    listeners = [("before_cursor_execute", _count_statement)]
+    for name in ("begin", "commit", "rollback"):
+        listeners.append((name, _count_transaction_command))
+    for name, listener in listeners:
+        if not event.contains(sync_engine, name, listener):
+            event.listen(sync_engine, name, listener)
+
+
+def round_trips_per_task() -> float:
+    """
+    Среднее количество обращений к БД на одну обработанную задачу.
+    """
+    processed = counter_value(TASKS_PROCESSED)
+    if not processed:
+        return 0.0
+    return counter_value(DB_ROUND_TRIPS) / processed
+
+
+# Метрики Prometheus. Метки с типом задачи ограничены зарегистрированными
+# типами, чтобы произвольные значения из запросов не плодили ряды.
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"]
+)
+CACHE_LOOKUPS = PromCounter(
+    "cache_lookups_total",
+    "Обращения к кешу по уровню и исходу",
+    ["cache", "result"]
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Ожидание соединения из пула БД",
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+             5, 10)
+)
+QUEUE_PUBLISH_LATENCY = Histogram(
+    "queue_publish_duration_seconds",
+    "Публикация пачки сообщений в RabbitMQ до подтверждения брокера"
+)
+QUEUE_PUBLISHED = PromCounter(
+    "queue_published_messages_total",
+    "Сообщения, опубликованные в RabbitMQ",
+    ["result"]
+)
+TASK_QUEUE_WAIT = Histogram(
+    "task_queue_wait_seconds",
+    "Время от публикации сообщения до начала выполнения задачи",
+    ["type"],
+    buckets=TASK_DURATION_BUCKETS
+)
+TASK_EXECUTION = Histogram(
+    "task_execution_seconds",
+    "Время выполнения обработчика задачи",
+    ["type"],
+    buckets=TASK_DURATION_BUCKETS
+)
+TASKS_FINISHED = PromCounter(
+    "tasks_finished_total",
+    "Завершённые задачи по типу и итоговому статусу",
+    ["type", "status"]
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI-middleware, измеряющее время ответа по шаблону маршрута
+    (например, /tasks/{task_id}), а не по фактическому пути.
+
+    :param app: Оборачиваемое ASGI-приложение.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(
+                scope["method"], route, str(status)
+            ).observe(time.perf_counter() - started)
+
+
+class _TimedQueue(AsyncAdaptedQueue):
+    """
+    Очередь свободных соединений пула, которая измеряет ожидание в ней.
+    """
+
+    def get(self, block=True, timeout=None):
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который измеряет ожидание свободного соединения.
+
+    Замеряется только ожидание в очереди пула: открытие нового
+    соединения сверх свободных в `db_pool_wait_seconds` не входит.
+    """
+
+    _queue_class = _TimedQueue
+
+
+def start_metrics_server(port: int):
+    """
+    Запускает HTTP-экспортёр метрик в отдельном потоке (для воркера).
+
+    Если порт занят (например, другой репликой воркера на том же хосте),
+    воркер продолжает работу без экспортёра.
+
+    :param port: Порт; 0 - не запускать.
+    :return: True, если экспортёр запущен.
+    """
+    if not port:
+        return False
+    try:
+        start_http_server(port)
+    except OSError:
+        logger.warning("Metrics port %s is unavailable", port, exc_info=True)
+        return False
+    return True
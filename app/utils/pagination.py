@@ -0,0 +1,34 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(created_at: datetime, task_id: int) -> str:
+    """
+    Кодирует позицию (created_at, id) в непрозрачный курсор.
+
+    :param created_at: Дата создания последней задачи страницы.
+    :param task_id: Идентификатор последней задачи страницы.
+    :return: Строка курсора.
+    """
+    raw = json.dumps([(created_at - _EPOCH) // _MICROSECOND, task_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Декодирует курсор, полученный из `encode_cursor`.
+
+    :param cursor: Строка курсора.
+    :return: Кортеж (created_at, id).
+    :raises ValueError: Если курсор повреждён.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded))
+        return _EPOCH + created_at * _MICROSECOND, int(task_id)
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError("Invalid pagination cursor.")
@@ -0,0 +1,73 @@
+import json
+import os
+import zlib
+from collections import namedtuple
+
+from app.utils.blobstore import blob_store
+
+# Сжатые входные данные больше этого размера хранятся в blob store,
+# а в строке задачи остаётся только ссылка.
+PAYLOAD_OFFLOAD_THRESHOLD = int(
+    os.getenv("PAYLOAD_OFFLOAD_THRESHOLD", 256 * 1024)
+)
+# Входные данные не больше этого размера (JSON) передаются в сообщении
+# очереди, чтобы воркеру не приходилось их читать из БД.
+PAYLOAD_INLINE_LIMIT = int(os.getenv("PAYLOAD_INLINE_LIMIT", 4 * 1024))
+
+EncodedPayload = namedtuple("EncodedPayload", ["data", "ref", "inline"])
+
+
+async def encode_payload(payload: dict) -> EncodedPayload:
+    """
+    Готовит входные данные задачи к хранению.
+
+    :param payload: Входные данные задачи.
+    :return: EncodedPayload: сжатые данные для колонки `data` или ссылка
+             `ref` на блоб, а также признак, можно ли передать данные
+             прямо в сообщении очереди.
+    """
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    compressed = zlib.compress(raw)
+    inline = len(raw) <= PAYLOAD_INLINE_LIMIT
+    if len(compressed) > PAYLOAD_OFFLOAD_THRESHOLD:
+        return EncodedPayload(None, await blob_store.put(compressed), inline)
+    return EncodedPayload(compressed, None, inline)
+
+
+async def decode_payload(data: bytes, ref: str = None) -> dict:
+    """
+    Восстанавливает входные данные задачи из колонок `data`/`data_ref`.
+
+    :param data: Сжатые данные или None.
+    :param ref: Ссылка на блоб или None.
+    :return: Входные данные задачи (пустой словарь, если их нет).
+    """
+    if ref is not None:
+        data = await blob_store.get(ref)
+    if data is None:
+        return {}
+    return json.loads(zlib.decompress(data))
+
+
+def task_message(
+    task_id: int,
+    task_type: str,
+    payload: dict = None,
+    priority=None
+) -> dict:
+    """
+    Сообщение очереди для задачи.
+
+    :param task_id: Идентификатор задачи.
+    :param task_type: Тип задачи.
+    :param payload: Входные данные, если они достаточно малы, чтобы
+                    передать их в сообщении; иначе воркер прочитает их
+                    из БД.
+    :param priority: Приоритет задачи; по нему выбирается очередь.
+    """
+    message = {'id': task_id, 'type': task_type}
+    if payload is not None:
+        message['data'] = payload
+    if priority is not None:
+        message['priority'] = getattr(priority, "value", priority)
+    return message
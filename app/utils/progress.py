@@ -0,0 +1,158 @@
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from app.resources import resources
+from app.utils.events import TASK_EVENTS_CHANNEL, task_event
+
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", 1.0))
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", 3600))
+
+logger = logging.getLogger(__name__)
+
+_current_reporter = contextvars.ContextVar("progress_reporter", default=None)
+
+
+def progress_key(task_id: int) -> str:
+    return f"progress:{task_id}"
+
+
+def chunks_key(task_id: int) -> str:
+    return f"progress:{task_id}:chunks"
+
+
+class ProgressReporter:
+    """
+    Прогресс и частичные результаты одной выполняющейся задачи.
+
+    Обновления копятся в памяти и записываются в Redis не чаще раза в
+    `min_interval` секунд одним pipeline: процент выполнения - в хеш,
+    частичные результаты - в конец списка. В БД ничего не пишется.
+
+    :param task_id: Идентификатор задачи.
+    :param min_interval: Минимальный интервал между записями в секундах.
+    :param ttl: Время жизни записей в Redis в секундах.
+    """
+
+    def __init__(self, task_id: int,
+                 min_interval: float = PROGRESS_MIN_INTERVAL,
+                 ttl: int = PROGRESS_TTL):
+        self.task_id = task_id
+        self.min_interval = min_interval
+        self.ttl = ttl
+        self.percent = None
+        self._chunks = []
+        self._dirty = False
+        self._flushed_at = 0.0
+
+    async def report(self, percent: float = None, partial=None):
+        """
+        :param percent: Процент выполнения от 0 до 100.
+        :param partial: Частичный результат (сериализуемый в JSON).
+        """
+        if percent is not None:
+            self.percent = min(max(float(percent), 0.0), 100.0)
+            self._dirty = True
+        if partial is not None:
+            self._chunks.append(json.dumps(partial))
+            self._dirty = True
+        if time.monotonic() - self._flushed_at >= self.min_interval:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Записывает накопленные изменения в Redis.
+        """
+        if not self._dirty:
+            return
+        chunks, self._chunks = self._chunks, []
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+        event = task_event(self.task_id, "IN_PROGRESS")
+        event['progress'] = self.percent
+        async with resources.redis.pipeline(transaction=False) as pipe:
+            if self.percent is not None:
+                pipe.hset(progress_key(self.task_id), mapping={
+                    'percent': self.percent,
+                    'updated_at': time.time(),
+                })
+                pipe.expire(progress_key(self.task_id), self.ttl)
+            if chunks:
+                pipe.rpush(chunks_key(self.task_id), *chunks)
+                pipe.expire(chunks_key(self.task_id), self.ttl)
+            pipe.publish(TASK_EVENTS_CHANNEL, json.dumps({'events': [event]}))
+            await pipe.execute()
+
+
+@asynccontextmanager
+async def progress_scope(task_id: int):
+    """
+    Делает `report_progress` доступным коду, выполняемому внутри блока,
+    и записывает последние изменения при выходе.
+
+    :param task_id: Идентификатор задачи.
+    """
+    reporter = ProgressReporter(task_id)
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current_reporter.reset(token)
+        try:
+            await reporter.flush()
+        except Exception:
+            logger.exception("Failed to flush progress of task %s", task_id)
+
+
+def detach_progress():
+    """
+    Отвязывает текущую asyncio-задачу от прогресса задачи, контекст
+    которой она унаследовала.
+    """
+    _current_reporter.set(None)
+
+
+async def report_progress(percent: float = None, partial=None):
+    """
+    Сообщает прогресс текущей задачи. Вызывается из IO-обработчиков;
+    вне выполнения задачи ничего не делает. Обработчики в пуле процессов
+    и batch-обработчики прогресс не сообщают.
+
+    :param percent: Процент выполнения от 0 до 100.
+    :param partial: Частичный результат (сериализуемый в JSON); читается
+                    через GET /tasks/{id}/partial, пока задача выполняется.
+    """
+    reporter = _current_reporter.get()
+    if reporter is not None:
+        await reporter.report(percent, partial)
+
+
+async def clear_progress(task_id: int):
+    """
+    Удаляет прогресс и частичные результаты задачи, например перед её
+    перезапуском, чтобы не показывать данные предыдущей попытки.
+
+    :param task_id: Идентификатор задачи.
+    """
+    await resources.redis.delete(progress_key(task_id), chunks_key(task_id))
+
+
+async def get_progress(task_id: int):
+    """
+    :return: Процент выполнения задачи или None, если он не сообщался.
+    """
+    percent = await resources.redis.hget(progress_key(task_id), 'percent')
+    return float(percent) if percent is not None else None
+
+
+async def get_partial_results(task_id: int, offset: int = 0):
+    """
+    Частичные результаты задачи, начиная с `offset`.
+
+    :return: Список частичных результатов.
+    """
+    chunks = await resources.redis.lrange(chunks_key(task_id), offset, -1)
+    return [json.loads(chunk) for chunk in chunks]
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import os
+import re
+import zlib
+from collections import namedtuple
+
+from app.utils.blobstore import blob_store
+
+# Результаты больше этого размера (байт UTF-8) хранятся сжатыми в blob
+# store, а в строке задачи остаются только размер, дайджест и ссылка.
+RESULT_INLINE_LIMIT = int(os.getenv("RESULT_INLINE_LIMIT", 16 * 1024))
+RESULT_CHUNK_SIZE = int(os.getenv("RESULT_CHUNK_SIZE", 64 * 1024))
+
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+StoredResult = namedtuple("StoredResult", ["text", "ref", "size", "digest"])
+
+
+async def encode_result(result) -> StoredResult:
+    """
+    Готовит результат задачи к хранению.
+
+    :param result: Результат или текст ошибки (строка) либо None.
+    :return: StoredResult: текст для колонки `result` или ссылка `ref` на
+             сжатый блоб, размер в байтах и SHA-256 результата.
+    """
+    if result is None:
+        return StoredResult(None, None, None, None)
+    raw = result.encode()
+    digest = hashlib.sha256(raw).hexdigest()
+    if len(raw) <= RESULT_INLINE_LIMIT:
+        return StoredResult(result, None, len(raw), digest)
+    compressed = await asyncio.to_thread(zlib.compress, raw)
+    ref = await blob_store.put(compressed)
+    return StoredResult(None, ref, len(raw), digest)
+
+
+def parse_range(header: str, size: int):
+    """
+    Разбирает заголовок Range с одним диапазоном байт.
+
+    :param header: Значение заголовка, например "bytes=0-1023".
+    :param size: Размер результата в байтах.
+    :return: Кортеж (start, end) включительно или None, если заголовок
+             не распознан и нужно отдать результат целиком.
+    :raises ValueError: Если диапазон не пересекается с результатом.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if match is None or not (match[1] or match[2]):
+        return None
+    if not match[1]:
+        suffix = int(match[2])
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable range.")
+        return max(size - suffix, 0), size - 1
+    start = int(match[1])
+    end = int(match[2]) if match[2] else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range.")
+    return start, min(end, size - 1)
+
+
+def iter_result(
+    text: str,
+    ref: str,
+    start: int = 0,
+    end: int = None,
+    chunk_size: int = RESULT_CHUNK_SIZE
+):
+    """
+    Отдаёт байты результата в диапазоне [start, end] частями.
+
+    Сжатый блоб читается и распаковывается потоково, поэтому результат
+    целиком в памяти не держится. Генератор синхронный: StreamingResponse
+    выполняет его в пуле потоков.
+
+    :param text: Результат, хранящийся в строке задачи, или None.
+    :param ref: Ссылка на сжатый блоб или None.
+    :param start: Первый байт.
+    :param end: Последний байт включительно; None - до конца.
+    :param chunk_size: Размер читаемых частей.
+    """
+    if ref is None:
+        data = (text or "").encode()
+        stop = len(data) if end is None else end + 1
+        for offset in range(start, stop, chunk_size):
+            yield data[offset:min(offset + chunk_size, stop)]
+        return
+    decompressor = zlib.decompressobj()
+    position = 0
+    with open(blob_store.path(ref), "rb") as f:
+        while end is None or position <= end:
+            compressed = f.read(chunk_size)
+            if compressed:
+                chunk = decompressor.decompress(compressed)
+            else:
+                chunk = decompressor.flush()
+            chunk_start, position = position, position + len(chunk)
+            if position > start:
+                piece = chunk[
+                    max(start - chunk_start, 0):
+                    None if end is None else end + 1 - chunk_start
+                ]
+                if piece:
+                    yield piece
+            if not compressed:
+                break
+
+
+async def load_result(text: str, ref: str):
+    """
+    Читает результат целиком, например чтобы передать его следующему
+    шагу workflow.
+
+    :param text: Результат, хранящийся в строке задачи, или None.
+    :param ref: Ссылка на сжатый блоб или None.
+    :return: Результат или None.
+    """
+    if ref is None:
+        return text
+    compressed = await blob_store.get(ref)
+    return (await asyncio.to_thread(zlib.decompress, compressed)).decode()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from app.resources import resources
+from app.utils.caching import LocalCache
+from app.utils.events import TASK_CONTROL_CHANNEL
+
+CANCELED_IDS_SIZE = int(os.getenv("WORKER_CANCELED_IDS_SIZE", 100000))
+CANCELED_IDS_TTL = float(os.getenv("WORKER_CANCELED_IDS_TTL", 3600))
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationTracker:
+    """
+    Принимает команды отмены и прерывает выполнение задач в воркере.
+
+    Отменённые идентификаторы запоминаются на `ttl` секунд, чтобы
+    сообщения этих задач, ещё стоящие в очереди, отбрасывались без
+    обращения к БД. Выполняющаяся задача отменяется через
+    `asyncio.Task.cancel()`; задание пула процессов, которое ещё не
+    начало выполняться, при этом убирается из очереди пула, а уже
+    запущенное досчитывается, и его результат отбрасывается.
+    Вычисление детерминированной задачи, общее для одинаковых задач,
+    прерывается, только если отменены все ожидающие его задачи; элемент
+    ещё не отправленной пачки из неё убирается, а уже запущенная пачка
+    досчитывается для остальных элементов.
+
+    :param size: Сколько отменённых идентификаторов помнить.
+    :param ttl: Сколько секунд помнить отменённый идентификатор.
+    """
+
+    def __init__(self, size: int = CANCELED_IDS_SIZE,
+                 ttl: float = CANCELED_IDS_TTL):
+        self._canceled = LocalCache(maxsize=size, ttl=ttl)
+        self._running = {}
+        self.interrupted = 0
+
+    def is_canceled(self, task_id: int) -> bool:
+        return self._canceled.get(task_id) is not None
+
+    @contextmanager
+    def track(self, task_id: int, execution=None):
+        """
+        Связывает задачу с выполняющим её asyncio.Task на время
+        выполнения, чтобы команда отмены могла его прервать.
+
+        :param task_id: Идентификатор задачи.
+        :param execution: Прерываемый asyncio.Task; по умолчанию текущий.
+        """
+        self._running[task_id] = execution or asyncio.current_task()
+        try:
+            yield
+        finally:
+            self._running.pop(task_id, None)
+
+    def cancel(self, task_id: int):
+        """
+        Запоминает отмену и прерывает задачу, если она выполняется.
+        """
+        self._canceled.set(task_id, True)
+        running = self._running.get(task_id)
+        if running is not None and not running.done():
+            running.cancel()
+            self.interrupted += 1
+
+    async def run(self, reconnect_delay: float = 1.0):
+        """
+        Слушает канал команд, пока не будет отменён.
+
+        :param reconnect_delay: Пауза перед переподключением в секундах.
+        """
+        while True:
+            pubsub = resources.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(TASK_CONTROL_CHANNEL)
+                async for message in pubsub.listen():
+                    for task_id in json.loads(message['data'])['cancel']:
+                        self.cancel(task_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Task control listener failed")
+                await asyncio.sleep(reconnect_delay)
+            finally:
+                await pubsub.close()
+
+
+cancellations = CancellationTracker()
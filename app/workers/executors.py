@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+CPU_POOL_SIZE = int(os.getenv("WORKER_CPU_POOL_SIZE", os.cpu_count() or 1))
+
+
+def _init_cpu_process():
+    """
+    Инициализация процесса пула: снимаем лимит на длину строкового
+    представления int, чтобы результаты вроде факториала можно было
+    перевести в строку прямо в дочернем процессе.
+    """
+    set_int_max_str_digits = getattr(sys, "set_int_max_str_digits", None)
+    if set_int_max_str_digits is not None:
+        set_int_max_str_digits(0)
+
+
+def _call_soon_threadsafe(loop, callback):
+    # Пул может досчитать задачу уже после остановки event loop
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass
+
+
+class CpuLane:
+    """
+    Очередь исполнения для CPU-bound обработчиков на ProcessPoolExecutor.
+
+    Вычисления уходят в отдельные процессы, поэтому event loop воркера
+    продолжает обслуживать остальные сообщения и heartbeat'ы AMQP.
+    Пул создаётся при первом использовании.
+    """
+
+    def __init__(self, max_workers: int = CPU_POOL_SIZE):
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_cpu_process
+            )
+        return self._executor
+
+    async def run(self, func, *args, timeout: float = None, on_done=None):
+        """
+        Выполняет функцию в процессе пула.
+
+        Функция и аргументы должны сериализоваться pickle. По истечении
+        таймаута ожидание прерывается: задача, ещё стоящая в очереди пула,
+        отменяется, а уже запущенная досчитывается и её результат
+        отбрасывается, поэтому основной защитой от тяжёлых задач остаётся
+        ограничение размера входных данных.
+
+        :param func: Функция уровня модуля.
+        :param args: Позиционные аргументы функции.
+        :param timeout: Таймаут в секундах (None - без ограничения).
+        :param on_done: Вызывается в event loop, когда процесс пула
+                        освободился: функция завершилась или была
+                        отменена до запуска. После таймаута это
+                        происходит позже, чем возврат из `run`.
+        :return: Результат функции.
+        :raises TimeoutError: Если функция не уложилась в таймаут.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+        if on_done is not None:
+            future.add_done_callback(
+                lambda _: _call_soon_threadsafe(loop, on_done)
+            )
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"CPU-bound task exceeded timeout of {timeout}s."
+            )
+
+    def shutdown(self):
+        """
+        Останавливает пул процессов, отменяя ещё не начатые задачи.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_lane = CpuLane()
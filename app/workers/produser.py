@@ -1,9 +1,162 @@
+import asyncio
 import aio_pika
+from aio_pika.pool import Pool
 import os
 import json
+import time
+
+from app.utils.metrics import QUEUE_PUBLISHED, QUEUE_PUBLISH_LATENCY
+from app.workers.routing import QUEUES, queue_for
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
-QUEUE_NAME = "task_queue"
+CONNECTION_POOL_SIZE = int(os.getenv("RABBITMQ_CONNECTION_POOL_SIZE", 2))
+CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", 16))
+CONFIRM_BATCH_SIZE = int(os.getenv("RABBITMQ_CONFIRM_BATCH_SIZE", 256))
+
+
+class TaskPublisher:
+    """
+    Долгоживущий издатель задач в RabbitMQ.
+
+    Держит пул соединений и пул каналов с включёнными publisher confirms,
+    поэтому публикация не платит за AMQP-рукопожатие. Подтверждения
+    брокера ожидаются пачками: сообщения пачки публикуются конкурентно
+    в одном канале, и брокер подтверждает их одним multiple-ack.
+
+    Сообщение попадает в очередь своего класса приоритета (см.
+    app/workers/routing.py), если не задана единая очередь `queue_name`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue_name: str = None,
+        connection_pool_size: int = CONNECTION_POOL_SIZE,
+        channel_pool_size: int = CHANNEL_POOL_SIZE,
+        confirm_batch_size: int = CONFIRM_BATCH_SIZE
+    ):
+        self.url = url
+        self.queue_name = queue_name
+        self.connection_pool_size = connection_pool_size
+        self.channel_pool_size = channel_pool_size
+        self.confirm_batch_size = confirm_batch_size
+        self._connection_pool = None
+        self._channel_pool = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        Создаёт пулы и объявляет очередь. Повторный вызов ничего не делает.
+        """
+        async with self._lock:
+            if self._channel_pool is not None:
+                return
+            self._connection_pool = Pool(
+                self._get_connection,
+                max_size=self.connection_pool_size
+            )
+            self._channel_pool = Pool(
+                self._get_channel,
+                max_size=self.channel_pool_size
+            )
+            async with self._channel_pool.acquire() as channel:
+                for queue_name in self._queue_names():
+                    await channel.declare_queue(queue_name, durable=True)
+
+    async def close(self):
+        """
+        Закрывает все каналы и соединения пула.
+        """
+        async with self._lock:
+            if self._channel_pool is None:
+                return
+            await self._channel_pool.close()
+            await self._connection_pool.close()
+            self._channel_pool = None
+            self._connection_pool = None
+
+    async def _get_connection(self):
+        return await aio_pika.connect_robust(self.url)
+
+    async def _get_channel(self):
+        async with self._connection_pool.acquire() as connection:
+            return await connection.channel(publisher_confirms=True)
+
+    def _queue_names(self):
+        if self.queue_name is not None:
+            return [self.queue_name]
+        return list(QUEUES.values())
+
+    def _route(self, task) -> str:
+        if self.queue_name is not None:
+            return self.queue_name
+        return queue_for(task.get('priority'))
+
+    @staticmethod
+    def _build_message(task):
+        # Время публикации нужно воркеру для метрики ожидания в очереди
+        return aio_pika.Message(
+            body=json.dumps(task).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers={'x-published-at': time.time()}
+        )
+
+    async def publish(self, task):
+        """
+        Публикует одну задачу и дожидается подтверждения брокера.
+
+        :param task: Словарь с данными задачи.
+        """
+        await self.publish_many([task])
+
+    async def publish_many(self, tasks, return_exceptions: bool = False):
+        """
+        Публикует несколько задач через один канал пула.
+
+        Сообщения отправляются пачками по `confirm_batch_size`, и
+        подтверждения каждой пачки ожидаются вместе.
+
+        :param tasks: Список словарей с данными задач.
+        :param return_exceptions: Если True, ошибки публикации не
+                                  пробрасываются, а возвращаются в списке.
+        :return: Список той же длины, что и `tasks`: None для успешно
+                 подтверждённых сообщений или исключение.
+        """
+        if self._channel_pool is None:
+            await self.start()
+        results = []
+        async with self._channel_pool.acquire() as channel:
+            exchange = channel.default_exchange
+            for start in range(0, len(tasks), self.confirm_batch_size):
+                batch = tasks[start:start + self.confirm_batch_size]
+                started = time.perf_counter()
+                confirmations = await asyncio.gather(
+                    *(
+                        exchange.publish(
+                            self._build_message(task),
+                            routing_key=self._route(task),
+                        )
+                        for task in batch
+                    ),
+                    return_exceptions=return_exceptions
+                )
+                QUEUE_PUBLISH_LATENCY.observe(time.perf_counter() - started)
+                failed = sum(
+                    isinstance(confirmation, Exception)
+                    for confirmation in confirmations
+                )
+                QUEUE_PUBLISHED.labels("ok").inc(len(batch) - failed)
+                if failed:
+                    QUEUE_PUBLISHED.labels("error").inc(failed)
+                results.extend(
+                    confirmation
+                    if isinstance(confirmation, Exception) else None
+                    for confirmation in confirmations
+                )
+        return results
+
+
+publisher = TaskPublisher(RABBITMQ_URL)
 
 
 async def send_task_to_queue(task):
@@ -12,13 +165,18 @@ async def send_task_to_queue(task):
 
     :param task: Словарь с данными задачи, который будет отправлен в очередь.
     """
-    connection = await aio_pika.connect_robust(RABBITMQ_URL)
-    async with connection:
-        channel = await connection.channel()
-        await channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps(task).encode(),
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-            ),
-            routing_key=QUEUE_NAME,
-        )
\ No newline at end of file
+    await publisher.publish(task)
+
+
+async def send_tasks_to_queue(tasks, return_exceptions: bool = False):
+    """
+    Отправляет несколько задач в очередь RabbitMQ одной пачкой.
+
+    :param tasks: Список словарей с данными задач.
+    :param return_exceptions: Возвращать ошибки публикации вместо исключения.
+    :return: Список ошибок публикации (None для успешных сообщений).
+    """
+    return await publisher.publish_many(
+        tasks,
+        return_exceptions=return_exceptions
+    )
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func
+from sqlalchemy.future import select
+
+from app.dependencies import AsyncSessionLocal
+from app.models import OutboxMessage
+from app.workers.produser import publisher as default_publisher
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """
+    Переносит сообщения из таблицы outbox в RabbitMQ пачками.
+
+    Outbox служит и планировщиком отложенных задач: сообщение
+    публикуется, когда наступает его `available_at`. Созревшие сообщения
+    выбираются диапазоном по индексу (available_at, id), а в простое
+    ретранслятор спит ровно до ближайшего `available_at`, поэтому
+    количество запланированных задач не влияет на стоимость проверки.
+
+    Пачка выбирается через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько ретрансляторов (в разных процессах API и воркера) не
+    публикуют одно сообщение одновременно. Сообщение удаляется после
+    подтверждения брокера в той же транзакции; при падении между
+    публикацией и фиксацией сообщение будет опубликовано повторно, а
+    дубликат отсеет условный старт задачи в воркере.
+
+    :param publisher: Издатель с методом `publish_many`.
+    :param batch_size: Максимальный размер пачки.
+    :param poll_interval: Пауза между проверками пустого outbox в секундах.
+    """
+
+    def __init__(
+        self,
+        publisher=default_publisher,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL
+    ):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+
+    def kick(self):
+        """
+        Будит ретранслятор, не дожидаясь очередной проверки по таймеру.
+        Вызывается после фиксации транзакции с новыми сообщениями.
+        """
+        self._wakeup.set()
+
+    async def drain_once(self) -> int:
+        """
+        Публикует одну пачку сообщений.
+
+        :return: Количество опубликованных и удалённых сообщений.
+        """
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                result = await db.execute(
+                    select(OutboxMessage)
+                    .where(OutboxMessage.available_at <= datetime.utcnow())
+                    .order_by(OutboxMessage.available_at, OutboxMessage.id)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                messages = result.scalars().all()
+                if not messages:
+                    return 0
+                failures = await self.publisher.publish_many(
+                    [json.loads(message.payload) for message in messages],
+                    return_exceptions=True
+                )
+                sent = [
+                    message.id
+                    for message, failure in zip(messages, failures)
+                    if failure is None
+                ]
+                if len(sent) < len(messages):
+                    logger.warning(
+                        "Failed to publish %d outbox messages",
+                        len(messages) - len(sent)
+                    )
+                if sent:
+                    await db.execute(
+                        delete(OutboxMessage)
+                        .where(OutboxMessage.id.in_(sent))
+                    )
+        return len(sent)
+
+    async def next_due(self):
+        """
+        :return: Время ближайшего отложенного сообщения или None.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.min(OutboxMessage.available_at))
+                .where(OutboxMessage.available_at > datetime.utcnow())
+            )
+            return result.scalar()
+
+    async def _idle_timeout(self) -> float:
+        try:
+            due = await self.next_due()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to read the next scheduled message")
+            return self.poll_interval
+        if due is None:
+            return self.poll_interval
+        delay = (due - datetime.utcnow()).total_seconds()
+        return min(self.poll_interval, max(delay, 0))
+
+    async def run(self):
+        """
+        Публикует сообщения, пока не будет отменён. Полные пачки идут
+        подряд; когда созревших сообщений нет, ждёт `kick`, ближайшее
+        отложенное сообщение или `poll_interval`.
+        """
+        while True:
+            self._wakeup.clear()
+            try:
+                sent = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox relay failed")
+                sent = 0
+            if sent >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), await self._idle_timeout()
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_relay = OutboxRelay()
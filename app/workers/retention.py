@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app.crud import IDEMPOTENCY_WINDOW
+from app.resources import resources
+from app.utils.blobstore import blob_store
+
+TASKS_RETENTION_DAYS = int(os.getenv("TASKS_RETENTION_DAYS", 90))
+# Если задано, устаревшие секции переносятся в эту схему, а не удаляются
+TASKS_ARCHIVE_SCHEMA = os.getenv("TASKS_ARCHIVE_SCHEMA", "")
+TASKS_PARTITIONS_AHEAD = int(os.getenv("TASKS_PARTITIONS_AHEAD", 3))
+RETENTION_INTERVAL = float(os.getenv("TASKS_RETENTION_INTERVAL", 3600))
+# Блобы моложе этого срока (секунды) не удаляются, даже если на них
+# пока нет ссылок: задача, записавшая блоб, могла ещё не закоммитить
+# строку с ссылкой на него.
+BLOB_GC_GRACE = float(os.getenv("BLOB_GC_GRACE", 86400))
+BLOB_GC_BATCH = 1000
+
+PARTITION_NAME = re.compile(r"^tasks_p(\d{4})(\d{2})$")
+IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+LIST_PARTITIONS = text("""
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass
+""")
+
+LIST_ARCHIVED = text(
+    "SELECT tablename FROM pg_tables WHERE schemaname = :schema"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"tasks_p{month:%Y%m}"
+
+
+async def list_partitions(conn) -> dict:
+    """
+    :return: Словарь {начало месяца: имя секции} для помесячных секций.
+    """
+    partitions = {}
+    for name in (await conn.execute(LIST_PARTITIONS)).scalars():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+async def ensure_partitions(conn, ahead: int = TASKS_PARTITIONS_AHEAD):
+    """
+    Создаёт секции на текущий и `ahead` следующих месяцев, чтобы новые
+    задачи не попадали в секцию по умолчанию.
+
+    Если задачи месяца уже попали в tasks_default (например, обслуживание
+    не запускалось), секция создаётся отдельной таблицей, строки
+    переносятся в неё и она присоединяется к tasks. Перенос идёт мимо
+    триггеров tasks, поэтому счётчики по статусам не меняются.
+    tasks_default блокируется до конца транзакции, чтобы до присоединения
+    в неё не попали новые задачи этого месяца.
+
+    :param conn: Соединение в открытой транзакции.
+    :return: Имена созданных секций.
+    """
+    existing = await list_partitions(conn)
+    current = datetime.utcnow().date().replace(day=1)
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        end = add_months(month, 1)
+        await conn.execute(
+            text("LOCK TABLE tasks_default IN ACCESS EXCLUSIVE MODE")
+        )
+        await conn.execute(text(
+            f"CREATE TABLE {name} "
+            f"(LIKE tasks INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ))
+        await conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM tasks_default
+                WHERE created_at >= '{month}' AND created_at < '{end}'
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """))
+        await conn.execute(text(
+            f"ALTER TABLE tasks ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month}') TO ('{end}')"
+        ))
+        created.append(name)
+    return created
+
+
+async def expire_partitions(
+    conn,
+    retention_days: int = TASKS_RETENTION_DAYS,
+    archive_schema: str = TASKS_ARCHIVE_SCHEMA
+):
+    """
+    Отсоединяет секции, целиком вышедшие за срок хранения, и удаляет их
+    или переносит в схему архива. Задачи удаляются целой секцией, без
+    построчного DELETE и последующего VACUUM.
+
+    DETACH не вызывает триггеры удаления, поэтому счётчики по статусам
+    уменьшаются на содержимое уже отсоединённой секции в той же
+    транзакции. DETACH держит исключительную блокировку секции до конца
+    транзакции, так что между отсоединением и подсчётом задачи в ней не
+    меняются. DETACH CONCURRENTLY не подходит: он не выполняется внутри
+    транзакции.
+
+    :param conn: Соединение в открытой транзакции.
+    :param retention_days: Срок хранения задач в днях.
+    :param archive_schema: Схема архива; пустая строка - удалять секции.
+    :return: Имена обработанных секций.
+    """
+    if archive_schema and not IDENTIFIER.match(archive_schema):
+        raise ValueError(f"Invalid archive schema name: {archive_schema}")
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).date()
+    expired = []
+    for month, name in sorted((await list_partitions(conn)).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        await conn.execute(text(f"ALTER TABLE tasks DETACH PARTITION {name}"))
+        await conn.execute(text(f"""
+            INSERT INTO task_counters (type, status, shard, count)
+            SELECT coalesce(type, ''), status, 0, -count(*)
+            FROM {name} WHERE status IS NOT NULL
+            GROUP BY 1, 2
+            ON CONFLICT (type, status, shard)
+            DO UPDATE SET count = task_counters.count + EXCLUDED.count
+        """))
+        if archive_schema:
+            await conn.execute(
+                text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+            )
+            await conn.execute(
+                text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+            )
+        else:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        expired.append(name)
+    return expired
+
+
+async def expire_idempotency_keys(conn, window: int = IDEMPOTENCY_WINDOW):
+    """
+    Удаляет ключи идемпотентности старше окна дедупликации. Такие ключи
+    уже не защищают от дублей, а без удаления таблица росла бы на
+    строку с каждым запросом с ключом.
+
+    :param conn: Соединение в открытой транзакции.
+    :param window: Окно дедупликации в секундах.
+    :return: Количество удалённых ключей.
+    """
+    result = await conn.execute(
+        text("DELETE FROM idempotency_keys WHERE created_at < :cutoff"),
+        {'cutoff': datetime.utcnow() - timedelta(seconds=window)}
+    )
+    return result.rowcount
+
+
+async def _referenced_blobs_query(conn, archive_schema: str):
+    """
+    Собирает запрос ссылок на блобы из tasks и секций в схеме архива:
+    архивные задачи по-прежнему ссылаются на свои блобы.
+
+    :return: Запрос с параметром :refs, возвращающий те ключи из :refs,
+             на которые есть ссылки.
+    """
+    tables = ["tasks"]
+    if archive_schema:
+        if not IDENTIFIER.match(archive_schema):
+            raise ValueError(f"Invalid archive schema name: {archive_schema}")
+        names = await conn.execute(LIST_ARCHIVED, {'schema': archive_schema})
+        tables += [
+            f"{archive_schema}.{name}" for name in names.scalars()
+            if PARTITION_NAME.match(name)
+        ]
+    return text(" UNION ".join(
+        f"SELECT {column} FROM {table} "
+        f"WHERE {column} = ANY(CAST(:refs AS text[]))"
+        for table in tables
+        for column in ("data_ref", "result_ref")
+    ))
+
+
+async def collect_blobs(
+    conn,
+    store=blob_store,
+    grace: float = BLOB_GC_GRACE,
+    archive_schema: str = TASKS_ARCHIVE_SCHEMA
+):
+    """
+    Удаляет из blob store блобы входных данных и результатов, на которые
+    не ссылается ни одна задача: удалённые вместе с секциями, заменённые
+    при обновлении данных или сброшенные при повторе задачи. Блобы
+    адресуются по содержимому и могут быть общими у нескольких задач,
+    поэтому удаляются только по отсутствию ссылок, а не вместе с задачей.
+
+    Рассматриваются только блобы, не менявшиеся `grace` секунд;
+    BlobStore.put_sync обновляет время изменения и при повторной записи
+    существующего блоба, а перед удалением время проверяется ещё раз.
+
+    :param conn: Соединение с БД.
+    :param store: Хранилище блобов.
+    :param grace: Минимальный возраст удаляемого блоба в секундах.
+    :param archive_schema: Схема архива; ссылки из неё тоже учитываются.
+    :return: Количество удалённых блобов.
+    """
+    cutoff = time.time() - grace
+    candidates = await asyncio.to_thread(store.list_older_than, cutoff)
+    if not candidates:
+        return 0
+    query = await _referenced_blobs_query(conn, archive_schema)
+    deleted = 0
+    for start in range(0, len(candidates), BLOB_GC_BATCH):
+        batch = candidates[start:start + BLOB_GC_BATCH]
+        result = await conn.execute(query, {'refs': batch})
+        referenced = set(result.scalars())
+        for digest in batch:
+            if digest in referenced:
+                continue
+            if await asyncio.to_thread(store.delete_sync, digest, cutoff):
+                deleted += 1
+    return deleted
+
+
+async def run_once():
+    """
+    Создаёт будущие секции, убирает устаревшие, удаляет просроченные
+    ключи идемпотентности и блобы без ссылок.
+    """
+    async with resources.engine.begin() as conn:
+        created = await ensure_partitions(conn)
+    expired = []
+    if TASKS_RETENTION_DAYS > 0:
+        async with resources.engine.begin() as conn:
+            expired = await expire_partitions(conn)
+    async with resources.engine.begin() as conn:
+        keys = await expire_idempotency_keys(conn)
+    async with resources.engine.connect() as conn:
+        blobs = await collect_blobs(conn)
+    if created or expired or keys or blobs:
+        logger.info(
+            "Created partitions %s, expired partitions %s, "
+            "deleted %d idempotency keys and %d blobs",
+            created, expired, keys, blobs
+        )
+    return created, expired
+
+
+async def run(interval: float = RETENTION_INTERVAL):
+    """
+    Периодически обслуживает секции tasks, пока не будет отменён.
+
+    Ни API, ни воркер этот цикл не запускают: он работает отдельным
+    процессом `python -m app.workers.retention` (сервис retention в
+    docker-compose) в единственном экземпляре, чтобы DDL над tasks не
+    выполнялся конкурентно.
+    """
+    while True:
+        try:
+            await run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Task retention failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            await (run_once() if args.once else run())
+        finally:
+            await resources.close()
+
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from collections import deque
+
+from app.models import TaskPriority
+
+QUEUE_NAME = "task_queue"
+
+# Очередь на каждый класс приоритета. Обычные задачи остаются в прежней
+# очереди `task_queue`, поэтому уже опубликованные сообщения не теряются.
+QUEUES = {
+    TaskPriority.HIGH: f"{QUEUE_NAME}.high",
+    TaskPriority.NORMAL: QUEUE_NAME,
+    TaskPriority.LOW: f"{QUEUE_NAME}.low",
+}
+
+
+def parse_queue_weights(spec: str) -> dict:
+    """
+    Разбирает веса очередей вида "HIGH=8,NORMAL=4,LOW=1".
+
+    Воркер слушает только перечисленные классы приоритета, поэтому можно
+    запустить отдельные воркеры, например, только для HIGH.
+
+    :param spec: Строка с весами.
+    :return: Словарь {имя очереди: вес}.
+    :raises ValueError: Если класс неизвестен или вес меньше 1.
+    """
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        priority = TaskPriority(name.strip().upper())
+        weight = int(weight or 1)
+        if weight < 1:
+            raise ValueError(f"Queue weight must be positive: {item}")
+        weights[QUEUES[priority]] = weight
+    if not weights:
+        raise ValueError("At least one queue must be consumed.")
+    return weights
+
+
+QUEUE_WEIGHTS = parse_queue_weights(
+    os.getenv("WORKER_QUEUE_WEIGHTS", "HIGH=8,NORMAL=4,LOW=1")
+)
+
+
+def queue_for(priority) -> str:
+    """
+    Имя очереди для приоритета задачи.
+
+    :param priority: TaskPriority, его значение или None (NORMAL).
+    """
+    if priority is None:
+        return QUEUE_NAME
+    return QUEUES[TaskPriority(getattr(priority, "value", priority))]
+
+
+async def weighted_merge(sources: dict):
+    """
+    Объединяет несколько асинхронных итераторов в один с взвешенным
+    справедливым выбором (smooth weighted round-robin).
+
+    Сообщения каждого источника буферизуются по мере поступления; при
+    каждом запросе следующего элемента выбирается источник с наибольшим
+    накопленным кредитом среди непустых. Пока все источники заняты,
+    источник с весом w получает w/sum(w) выдач, а пустые источники не
+    простаивают слоты: выбор идёт только среди тех, где есть сообщения.
+
+    Так как `run_consumer` запрашивает следующее сообщение только после
+    того, как занял свободный слот, веса определяют, чья задача займёт
+    освободившийся слот, и высокоприоритетные задачи не ждут за потоком
+    медленных. Сами сообщения уже лежат в буферах: брокер выдаёт их до
+    `prefetch_count` на каждую очередь.
+
+    :param sources: Словарь {имя: (асинхронный итератор, вес)}.
+    """
+    buffers = {name: deque() for name in sources}
+    weights = {name: weight for name, (_, weight) in sources.items()}
+    credit = dict.fromkeys(sources, 0)
+    ready = asyncio.Event()
+    finished = set()
+    errors = []
+
+    async def pump(name, iterator):
+        try:
+            async for item in iterator:
+                buffers[name].append(item)
+                ready.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            errors.append(e)
+        finally:
+            finished.add(name)
+            ready.set()
+
+    pumps = [
+        asyncio.create_task(pump(name, iterator))
+        for name, (iterator, _) in sources.items()
+    ]
+    try:
+        while True:
+            if errors:
+                raise errors[0]
+            available = [name for name in buffers if buffers[name]]
+            if not available:
+                if len(finished) == len(sources):
+                    return
+                ready.clear()
+                await ready.wait()
+                continue
+            total = 0
+            for name in available:
+                credit[name] += weights[name]
+                total += weights[name]
+            chosen = max(available, key=credit.__getitem__)
+            credit[chosen] -= total
+            yield buffers[chosen].popleft()
+    finally:
+        for task in pumps:
+            task.cancel()
+        await asyncio.gather(*pumps, return_exceptions=True)
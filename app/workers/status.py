@@ -0,0 +1,94 @@
+import os
+
+from app import crud
+from app.resources import resources
+from app.models import TaskStatus
+from app.utils.batching import MicroBatcher
+from app.utils.events import publish_task_events, task_event
+
+STATUS_FLUSH_INTERVAL = float(os.getenv("WORKER_STATUS_FLUSH_INTERVAL", 0.01))
+STATUS_FLUSH_MAX_BATCH = int(os.getenv("WORKER_STATUS_FLUSH_MAX_BATCH", 200))
+
+
+async def start_task(
+    task_id: int,
+    redelivered: bool = False,
+    with_payload: bool = False
+):
+    """
+    Переводит задачу в IN_PROGRESS за одно обращение к БД.
+
+    :param task_id: Идентификатор задачи.
+    :param redelivered: Сообщение доставлено брокером повторно.
+    :param with_payload: Вернуть также сохранённые входные данные.
+    :return: Строка (id, type, workflow_id[, data, data_ref]) или None,
+             если задачу запускать не нужно.
+    """
+    async with resources.autocommit_engine.connect() as conn:
+        row = await crud.start_task(
+            conn,
+            task_id,
+            redelivered=redelivered,
+            with_payload=with_payload
+        )
+    if row is not None:
+        await crud.invalidate_tasks(task_id)
+        await publish_task_events(
+            [task_event(task_id, TaskStatus.IN_PROGRESS)]
+        )
+    return row
+
+
+async def _flush_terminal_statuses(updates):
+    async with resources.autocommit_engine.connect() as conn:
+        applied = await crud.finish_tasks(conn, updates)
+    await crud.invalidate_tasks(*applied)
+    await publish_task_events([
+        task_event(task_id, status)
+        for task_id, status, _ in updates
+        if task_id in applied
+    ])
+    return [task_id in applied for task_id, _, _ in updates]
+
+
+class StatusFlusher:
+    """
+    Группирует записи итоговых статусов от конкурентных задач в общие
+    UPDATE-запросы.
+
+    Вызывающий ждёт, пока его пачка будет записана, поэтому сообщение
+    подтверждается брокеру только после сохранения результата.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = STATUS_FLUSH_MAX_BATCH,
+        flush_interval: float = STATUS_FLUSH_INTERVAL
+    ):
+        self._batcher = MicroBatcher(
+            _flush_terminal_statuses,
+            max_batch_size,
+            flush_interval,
+            name="terminal statuses"
+        )
+
+    async def finish(self, task_id: int, status, result) -> bool:
+        """
+        Записывает итоговый статус задачи.
+
+        :param task_id: Идентификатор задачи.
+        :param status: COMPLETED или FAILED.
+        :param result: Результат или текст ошибки из `encode_result`.
+        :return: True, если статус записан; False, если задача уже не
+                 в IN_PROGRESS (например, отменена).
+        """
+        return await self._batcher.submit((task_id, status, result))
+
+    async def drain(self):
+        """
+        Записывает всё, что ещё накоплено.
+        """
+        await self._batcher.drain()
+
+
+status_flusher = StatusFlusher()
@@ -1,38 +1,280 @@
 import asyncio
+import os
 import random
+from contextlib import nullcontext
 from math import factorial
 
+from app.models import TaskPriority
+from app.utils.batching import MicroBatcher
+from app.utils.caching import ResultMemo, result_memo
+from app.utils.progress import report_progress
+from app.workers.executors import cpu_lane, CPU_POOL_SIZE
 
-async def process_type1(data):
+IO_LANE = "io"
+CPU_LANE = "cpu"
+
+TYPE1_MAX_NUMBER = int(os.getenv("TYPE1_MAX_NUMBER", 50000))
+TYPE1_TIMEOUT = float(os.getenv("TYPE1_TIMEOUT", 30))
+TYPE2_MAX_BATCH_SIZE = int(os.getenv("TYPE2_MAX_BATCH_SIZE", 100))
+
+
+class TaskSpec:
+    """
+    Описание зарегистрированного типа задачи и его ограничений исполнения.
+
+    :param name: Имя типа задачи.
+    :param handler: Обработчик. Для CPU_LANE - синхронная функция уровня
+                    модуля, для IO_LANE - корутина. Batch-обработчик
+                    принимает список входных данных и возвращает список
+                    результатов той же длины; элементом списка может быть
+                    исключение, тогда упадёт только соответствующая задача.
+    :param lane: IO_LANE (event loop) или CPU_LANE (пул процессов).
+    :param concurrency: Максимум одновременных вызовов обработчика.
+    :param timeout: Таймаут одного вызова в секундах.
+    :param batch: Обработчик принимает пачку входных данных.
+    :param max_batch_size: Максимальный размер пачки.
+    :param batch_window: Сколько секунд копить пачку перед вызовом.
+    :param max_input_size: Максимально допустимый размер входных данных.
+    :param input_size: Функция, вычисляющая размер входных данных.
+    :param deterministic: Результат зависит только от входных данных и
+                          может быть взят из кеша результатов.
+    :param memo_ttl: Время жизни результата в кеше в секундах.
+    :param memo: Кеш результатов (ResultMemo), задаётся реестром.
+    :param priority: Приоритет задач типа, если он не указан при создании.
+    """
+
+    def __init__(
+        self,
+        name,
+        handler,
+        lane=IO_LANE,
+        concurrency=None,
+        timeout=None,
+        batch=False,
+        max_batch_size=100,
+        batch_window=0.01,
+        max_input_size=None,
+        input_size=len,
+        deterministic=False,
+        memo_ttl=None,
+        memo=None,
+        priority=TaskPriority.NORMAL
+    ):
+        if lane not in (IO_LANE, CPU_LANE):
+            raise ValueError(f"Unknown execution lane: {lane}")
+        self.name = name
+        self.handler = handler
+        self.lane = lane
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.batch = batch
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_input_size = max_input_size
+        self.input_size = input_size
+        self.deterministic = deterministic
+        self.memo_ttl = memo_ttl
+        self.memo = memo
+        self.priority = priority
+        self._semaphore = asyncio.Semaphore(concurrency) \
+            if concurrency else None
+        self._batcher = MicroBatcher(
+            self.invoke, max_batch_size, batch_window, name=name
+        ) if batch else None
+
+    def check_input(self, data):
+        """
+        Проверяет размер входных данных.
+
+        :raises ValueError: Если размер превышает `max_input_size`.
+        """
+        if self.max_input_size is not None and \
+                self.input_size(data) > self.max_input_size:
+            raise ValueError(
+                f"Input size exceeds the limit of {self.max_input_size}."
+            )
+
+    async def run(self, data):
+        """
+        Выполняет задачу с учётом лимитов типа. Результат
+        детерминированной задачи сначала ищется в кеше результатов.
+
+        :param data: Входные данные задачи.
+        :return: Результат обработчика.
+        """
+        self.check_input(data)
+        if self.deterministic and self.memo is not None:
+            return await self.memo.get_or_run(
+                ResultMemo.key(self.name, data),
+                lambda: self._execute(data),
+                ttl=self.memo_ttl
+            )
+        return await self._execute(data)
+
+    async def _execute(self, data):
+        if self._batcher is not None:
+            return await self._batcher.submit(data)
+        return await self.invoke(data)
+
+    async def invoke(self, data):
+        """
+        Один вызов обработчика в своей очереди исполнения с учётом
+        concurrency и таймаута. Для batch-обработчика `data` - список.
+        """
+        if self.lane == CPU_LANE:
+            return await self._invoke_cpu(data)
+        async with self._semaphore or nullcontext():
+            try:
+                return await asyncio.wait_for(
+                    self.handler(data), self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"Task type {self.name} exceeded timeout "
+                    f"of {self.timeout}s."
+                )
+
+    async def _invoke_cpu(self, data):
+        # Слот занят, пока процесс пула не освободится: вычисление,
+        # прерванное таймаутом или отменой, досчитывается в процессе, и
+        # новые задачи не должны вставать за ним в очередь пула.
+        release = None
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+            release = self._semaphore.release
+        return await cpu_lane.run(
+            _call_cpu_handler,
+            self.name,
+            data,
+            timeout=self.timeout,
+            on_done=release
+        )
+
+
+class TaskRegistry:
+    """
+    Реестр типов задач. Воркер находит обработчик по имени типа.
+
+    :param memo: Кеш результатов для детерминированных типов задач.
+    """
+
+    def __init__(self, memo=None):
+        self._specs = {}
+        self.memo = memo
+
+    def register(self, name, **options):
+        """
+        Декоратор регистрации обработчика.
+
+        :param name: Имя типа задачи.
+        :param options: Параметры исполнения, см. `TaskSpec`.
+        """
+        def decorator(handler):
+            if name in self._specs:
+                raise ValueError(f"Task type {name} is already registered.")
+            self._specs[name] = TaskSpec(
+                name, handler, memo=self.memo, **options
+            )
+            return handler
+        return decorator
+
+    def get(self, name) -> TaskSpec:
+        """
+        :raises ValueError: Если тип задачи не зарегистрирован.
+        """
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ValueError(f"Unknown task type: {name}")
+        return spec
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def names(self):
+        return list(self._specs)
+
+    async def run(self, name, data):
+        """
+        Выполняет задачу указанного типа.
+
+        :param name: Имя типа задачи.
+        :param data: Входные данные задачи.
+        :return: Результат обработчика.
+        """
+        return await self.get(name).run(data)
+
+
+registry = TaskRegistry(memo=result_memo)
+
+
+def _call_cpu_handler(name, data):
+    """
+    Точка входа в процессе пула: обработчик находится по имени типа в
+    реестре, который заполняется при импорте этого модуля.
+    """
+    return registry.get(name).handler(data)
+
+
+def _factorial_input_size(data):
+    number = data.get('number')
+    return number if isinstance(number, int) else 0
+
+
+@registry.register(
+    'type1',
+    lane=CPU_LANE,
+    concurrency=CPU_POOL_SIZE,
+    priority=TaskPriority.LOW,
+    deterministic=True,
+    timeout=TYPE1_TIMEOUT,
+    max_input_size=TYPE1_MAX_NUMBER,
+    input_size=_factorial_input_size
+)
+def process_type1(data):
     """
     Обрабатывает задачу типа 1: вычисляет факториал числа.
 
+    Выполняется в пуле процессов, результат переводится в строку там же.
+
     :param data: Словарь, содержащий ключ 'number' с целочисленным значением.
-    :return: Факториал числа.
+    :return: Факториал числа в виде строки.
     """
     number = data.get('number')
     if number is None or not isinstance(number, int) or number < 0:
         raise ValueError("Invalid number provided for factorial computation.")
-    result = factorial(number)
-    await asyncio.sleep(1)  # Симулируем длительную задачу
-    return result
+    return str(factorial(number))
 
 
-async def process_type2(data):
+@registry.register(
+    'type2',
+    batch=True,
+    max_batch_size=TYPE2_MAX_BATCH_SIZE,
+    timeout=10,
+    deterministic=True
+)
+async def process_type2(payloads):
     """
-    Обрабатывает задачу типа 2: переводит текст в верхний регистр.
+    Обрабатывает задачи типа 2 пачкой: переводит текст в верхний регистр.
 
-    :param data: Словарь, содержащий ключ 'text' со строковым значением.
-    :return: Строка в верхнем регистре.
+    :param payloads: Список словарей, содержащих ключ 'text' со строковым
+                     значением.
+    :return: Список строк в верхнем регистре; для некорректных входных
+             данных в списке стоит ValueError.
     """
-    text = data.get('text')
-    if text is None or not isinstance(text, str):
-        raise ValueError("Invalid text provided for uppercasing.")
-    result = text.upper()
+    results = []
+    for data in payloads:
+        text = data.get('text')
+        if text is None or not isinstance(text, str):
+            results.append(
+                ValueError("Invalid text provided for uppercasing.")
+            )
+        else:
+            results.append(text.upper())
     await asyncio.sleep(1)
-    return result
+    return results
 
 
+@registry.register('type3', timeout=10)
 async def process_type3(data):
     """
     Обрабатывает задачу типа 3.
@@ -50,5 +292,27 @@ async def process_type3(data):
             "Invalid range provided for random number generation."
         )
     result = random.randint(min_value, max_value)
-    await asyncio.sleep(1)
+    await asyncio.sleep(0.5)
+    await report_progress(50)
+    await asyncio.sleep(0.5)
     return result
+
+
+@registry.register('type4', timeout=10)
+async def process_type4(data):
+    """
+    Обрабатывает задачу типа 4: суммирует числа.
+    Используется как reducer последнего шага workflow, которому
+    предыдущий шаг передаёт свои результаты в 'upstream'.
+
+    :param data: Словарь, содержащий ключ 'upstream' (или 'numbers') со
+                 списком целых чисел или их строковых представлений.
+    :return: Сумма чисел.
+    """
+    numbers = data.get('upstream', data.get('numbers'))
+    if not isinstance(numbers, list):
+        raise ValueError("Invalid numbers provided for summation.")
+    try:
+        return sum(int(number) for number in numbers)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid numbers provided for summation.")
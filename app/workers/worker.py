@@ -2,97 +2,270 @@ import asyncio
 import aio_pika
 import os
 import json
+import logging
+import time
+from contextlib import AsyncExitStack
 
-from app.workers.tasks import process_type1, process_type2, process_type3
-from app.dependencies import get_db
-from app import crud, schemas
+from app.workers.cancellation import cancellations
+from app.workers.executors import cpu_lane
+from app.workers.routing import QUEUE_WEIGHTS, weighted_merge
+from app.workers.status import start_task, status_flusher
+from app.workers.tasks import registry
+from app.workers.relay import outbox_relay
+from app.workers.workflows import advance_workflow
+from app.resources import resources
 from app.models import TaskStatus
+from app.utils.caching import result_memo
+from app.utils.payloads import decode_payload
+from app.utils.progress import progress_scope
+from app.utils.results import encode_result
+from app.utils.metrics import (
+    DB_ROUND_TRIPS, TASK_EXECUTION, TASK_QUEUE_WAIT, TASKS_FINISHED,
+    TASKS_PROCESSED, counter_value, instrument_engine, round_trips_per_task,
+    start_metrics_server
+)
 
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
-QUEUE_NAME = "task_queue"
+PREFETCH_COUNT = int(os.getenv("WORKER_PREFETCH_COUNT", 32))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 16))
+STATS_LOG_INTERVAL = float(os.getenv("WORKER_STATS_LOG_INTERVAL", 60))
+# 0 - не отдавать метрики; у каждой реплики на одном хосте свой порт
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+# Ретранслятор outbox в воркере публикует следующие шаги workflow сразу
+# после их постановки, не дожидаясь опроса ретранслятора API.
+OUTBOX_RELAY_ENABLED = os.getenv("WORKER_OUTBOX_RELAY_ENABLED", "1") == "1"
 
+logger = logging.getLogger(__name__)
 
-async def process_task(task_data):
+
+async def process_task(
+    task_data,
+    redelivered: bool = False,
+    published_at: float = None
+):
     """
     Обрабатывает задачу, полученную из очереди.
 
     1. Загружает данные задачи из JSON.
-    2. Получает задачу из базы данных.
-    3. Обновляет её статус на IN_PROGRESS.
-    4. Выполняет соответствующую обработку в зависимости от типа задачи.
-    5. Записывает результат и обновляет статус на COMPLETED или FAILED.
+    2. Переводит задачу из PENDING в IN_PROGRESS одним условным UPDATE;
+       если задача отменена, уже выполнена или не найдена - пропускает её.
+       Задачи, о чьей отмене воркер уже знает, пропускаются без
+       обращения к БД. Если входных данных нет в сообщении, берёт
+       сохранённые в задаче.
+    3. Выполняет обработчик типа задачи из реестра `registry`. Команда
+       отмены прерывает выполнение; статус CANCELED уже записан в БД.
+    4. Записывает результат и статус COMPLETED или FAILED через
+       `status_flusher`, который объединяет записи конкурентных задач.
+       Запись условная и не перетирает отмену.
+    5. Если задача входит в workflow, продвигает его: следующий шаг
+       ставится в очередь сразу, без опроса со стороны клиента.
 
     :param task_data: Данные задачи в формате JSON (байтовая строка).
+    :param redelivered: Сообщение доставлено брокером повторно.
+    :param published_at: Время публикации сообщения (unix time).
     """
     task = json.loads(task_data)
     task_id = task.get('id')
     task_type = task.get('type')
-    task_payload = task.get('data')
-
-    # Получаем сессию БД
-    async with get_db() as db:
-        db_task = await crud.get_task(db, task_id=task_id)
-        if db_task is None:
-            return
-
-        # Обновляем статус задачи на IN_PROGRESS
-        await crud.update_task(
-            db,
-            db_task=db_task,
-            updates=schemas.TaskUpdate(status=TaskStatus.IN_PROGRESS)
+    # Крупные входные данные не передаются в сообщении: их возвращает
+    # тот же UPDATE, что переводит задачу в IN_PROGRESS.
+    with_payload = 'data' not in task
+    if cancellations.is_canceled(task_id):
+        return
+
+    started = await start_task(
+        task_id,
+        redelivered=redelivered,
+        with_payload=with_payload
+    )
+    # Команда отмены могла прийти, пока задача запускалась
+    if started is None or cancellations.is_canceled(task_id):
+        return
+    type_label = task_type if task_type in registry else "unknown"
+    if published_at is not None:
+        TASK_QUEUE_WAIT.labels(type_label).observe(
+            max(time.time() - published_at, 0)
         )
 
+    try:
+        if with_payload:
+            task_payload = await decode_payload(
+                started.data, started.data_ref
+            )
+        else:
+            task_payload = task['data']
+        execution_started = time.perf_counter()
         try:
-            if task_type == 'type1':
-                result = await process_type1(task_payload)
-            elif task_type == 'type2':
-                result = await process_type2(task_payload)
-            elif task_type == 'type3':
-                result = await process_type3(task_payload)
-            else:
-                raise ValueError(f"Unknown task type: {task_type}")
-
-            # Сохраняем результат и обновляем статус на COMPLETED
-            await crud.update_task(
-                db,
-                db_task=db_task,
-                updates=schemas.TaskUpdate(
-                    status=TaskStatus.COMPLETED,
-                    result=str(result)
+            async with progress_scope(task_id):
+                # Обработчик выполняется в дочерней задаче: команда отмены
+                # прерывает только её, а не обработку сообщения.
+                execution = asyncio.ensure_future(
+                    registry.run(task_type, task_payload)
                 )
+                with cancellations.track(task_id, execution):
+                    result = await execution
+        finally:
+            TASK_EXECUTION.labels(type_label).observe(
+                time.perf_counter() - execution_started
             )
+        status, result = TaskStatus.COMPLETED, str(result)
+    except asyncio.CancelledError:
+        if not cancellations.is_canceled(task_id):
+            raise
+        logger.info("Task %s canceled while running", task_id)
+        return
+    except Exception as e:
+        status, result = TaskStatus.FAILED, str(e)
 
-        except Exception as e:
-            # В случае ошибки обновляем статус на FAILED
-            await crud.update_task(
-                db,
-                db_task=db_task,
-                updates=schemas.TaskUpdate(
-                    status=TaskStatus.FAILED,
-                    result=str(e)
-                )
-            )
+    applied = await status_flusher.finish(
+        task_id, status, await encode_result(result)
+    )
+    if applied and started.workflow_id is not None:
+        await advance_workflow(started.workflow_id)
+    TASKS_FINISHED.labels(type_label, status.value).inc()
+    TASKS_PROCESSED.inc()
+
+
+async def report_stats(interval: float = STATS_LOG_INTERVAL):
+    """
+    Периодически пишет в лог количество обращений к БД на задачу и
+    долю попаданий в кеш результатов.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        memo = result_memo.stats()
+        logger.info(
+            "Processed %d tasks, %d DB round trips, %.2f per task; "
+            "result memo hits %d, misses %d, hit rate %.1f%%",
+            counter_value(TASKS_PROCESSED),
+            counter_value(DB_ROUND_TRIPS),
+            round_trips_per_task(),
+            memo['hits'],
+            memo['misses'],
+            memo['hit_rate'] * 100
+        )
+
+
+async def handle_message(message):
+    """
+    Обрабатывает одно сообщение и подтверждает его только после завершения.
+
+    :param message: Входящее сообщение aio_pika.
+    """
+    published_at = (message.headers or {}).get('x-published-at')
+    async with message.process():
+        await process_task(
+            message.body,
+            redelivered=message.redelivered,
+            published_at=published_at
+        )
+
+
+async def run_consumer(messages, handler, concurrency: int):
+    """
+    Читает сообщения и обрабатывает их конкурентно.
+
+    Одновременно выполняется не больше `concurrency` обработчиков: пока все
+    слоты заняты, следующее сообщение не забирается из итератора. При
+    выходе дожидается завершения уже запущенных обработчиков.
+
+    :param messages: Асинхронный итератор входящих сообщений.
+    :param handler: Корутина-обработчик одного сообщения.
+    :param concurrency: Максимальное количество сообщений в работе.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+
+    async def run(message):
+        try:
+            await handler(message)
+        except Exception:
+            logger.exception("Failed to process message")
+        finally:
+            semaphore.release()
+
+    iterator = messages.__aiter__()
+    try:
+        while True:
+            # Слот занимается до запроса сообщения, поэтому итератор
+            # выбирает следующее сообщение, только когда его есть где
+            # выполнить.
+            await semaphore.acquire()
+            try:
+                message = await iterator.__anext__()
+            except BaseException:
+                semaphore.release()
+                raise
+            task = asyncio.create_task(run(message))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+    except StopAsyncIteration:
+        pass
+    finally:
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
 
 
-async def consume():
+async def consume(
+    prefetch_count: int = PREFETCH_COUNT,
+    concurrency: int = WORKER_CONCURRENCY,
+    queue_weights: dict = QUEUE_WEIGHTS
+):
     """
-    Подключается к RabbitMQ, слушает очередь задач и обрабатывает их.
+    Подключается к RabbitMQ, слушает очереди задач и обрабатывает их.
 
-    1. Устанавливает соединение с RabbitMQ.
-    2. Ожидает сообщения в очереди `task_queue`.
-    3. При получении сообщения вызывает `process_task`, передавая данные задачи.
+    1. Устанавливает соединение с RabbitMQ и ограничивает prefetch.
+       Лимит действует на каждую очередь отдельно, так что у воркера
+       может быть до `prefetch_count` неподтверждённых сообщений на
+       очередь (при трёх очередях и 32 по умолчанию - до 96).
+    2. Ожидает сообщения в очередях классов приоритета из
+       `queue_weights` и выбирает следующее сообщение по весам очередей.
+    3. Обрабатывает до `concurrency` сообщений одновременно; каждое
+       сообщение подтверждается после завершения `process_task`.
+
+    :param prefetch_count: Сколько неподтверждённых сообщений брокер
+                           может выдать воркеру из одной очереди; всего
+                           их до len(queue_weights) * prefetch_count.
+    :param concurrency: Максимальное количество задач в работе.
+    :param queue_weights: Словарь {имя очереди: вес}.
     """
+    instrument_engine(resources.engine)
+    start_metrics_server(METRICS_PORT)
+    reporter = asyncio.create_task(report_stats())
+    control = asyncio.create_task(cancellations.run())
+    relay = None
+    if OUTBOX_RELAY_ENABLED:
+        relay = asyncio.create_task(outbox_relay.run())
     connection = await aio_pika.connect_robust(RABBITMQ_URL)
     async with connection:
         channel = await connection.channel()
-        queue = await channel.declare_queue(QUEUE_NAME, durable=True)
+        await channel.set_qos(prefetch_count=prefetch_count)
 
-        async with queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                async with message.process():
-                    task_data = message.body
-                    await process_task(task_data)
+        try:
+            async with AsyncExitStack() as stack:
+                sources = {}
+                for queue_name, weight in queue_weights.items():
+                    queue = await channel.declare_queue(
+                        queue_name, durable=True
+                    )
+                    queue_iter = await stack.enter_async_context(
+                        queue.iterator()
+                    )
+                    sources[queue_name] = (queue_iter, weight)
+                await run_consumer(
+                    weighted_merge(sources), handle_message, concurrency
+                )
+        finally:
+            await status_flusher.drain()
+            reporter.cancel()
+            control.cancel()
+            if relay is not None:
+                relay.cancel()
+                await asyncio.gather(relay, return_exceptions=True)
+            cpu_lane.shutdown()
+            await resources.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(consume())
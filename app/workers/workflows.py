@@ -0,0 +1,25 @@
+import logging
+
+from app import crud
+from app.dependencies import AsyncSessionLocal
+from app.workers.relay import outbox_relay
+
+logger = logging.getLogger(__name__)
+
+
+async def advance_workflow(workflow_id: int):
+    """
+    Продвигает workflow после завершения одной из его задач и будит
+    ретранслятор outbox, если следующий шаг поставлен в очередь. Ошибка
+    не влияет на уже записанный результат задачи.
+
+    :param workflow_id: Идентификатор workflow.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            enqueued = await crud.advance_workflow(db, workflow_id)
+    except Exception:
+        logger.exception("Failed to advance workflow %s", workflow_id)
+        return
+    if enqueued:
+        outbox_relay.kick()
@@ -0,0 +1,58 @@
+"""
+Сравнение кодека задач для кеша с прежним путём
+json.dumps(default=pydantic_encoder) + schemas.Task(**json.loads(...)).
+
+Запуск:
+    python -m benchmarks.bench_codec --iterations 100000
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+from pydantic.json import pydantic_encoder
+
+from app import schemas
+from app.utils import codec
+
+
+def json_encode(task):
+    return json.dumps(task, default=pydantic_encoder).encode()
+
+
+def json_decode(data):
+    return schemas.Task(**json.loads(data))
+
+
+def measure(name, encode, decode, task, iterations):
+    data = encode(task)
+    encode_time = timeit.timeit(lambda: encode(task), number=iterations)
+    decode_time = timeit.timeit(lambda: decode(data), number=iterations)
+    print(
+        f"{name:<10} encode {encode_time / iterations * 1e6:6.2f} us  "
+        f"decode {decode_time / iterations * 1e6:6.2f} us  "
+        f"{len(data):4d} bytes/entry"
+    )
+
+
+def main(args):
+    now = datetime.utcnow()
+    task = schemas.Task(
+        id=123456,
+        type="type2",
+        status=schemas.TaskStatus.COMPLETED,
+        result="HELLO WORLD",
+        created_at=now,
+        updated_at=now,
+    )
+    measure("json", json_encode, json_decode, task, args.iterations)
+    backend = "msgpack" if codec.msgpack is not None else "codec/json"
+    measure(
+        backend, codec.encode_task, codec.decode_task, task, args.iterations
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+"""
+Задержка создания задачи: запись в outbox против публикации в запросе,
+а также пропускная способность ретранслятора outbox.
+
+Запуск (нужны PostgreSQL с применёнными миграциями, Redis и RabbitMQ):
+    python -m benchmarks.bench_outbox --requests 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app import crud, schemas
+from app.dependencies import AsyncSessionLocal
+from app.utils.payloads import task_message
+from app.workers.produser import publisher
+from app.workers.relay import OutboxRelay
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1]
+
+
+async def create(inline_publish):
+    task = schemas.TaskCreate(type="type2", data={"text": "benchmark"})
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        db_task = await crud.create_task(db, task)
+    if inline_publish:
+        # Прежний путь: публикация в RabbitMQ внутри запроса
+        await publisher.publish(
+            task_message(db_task.id, db_task.type, task.data)
+        )
+    return (time.perf_counter() - started) * 1000
+
+
+async def main(args):
+    await publisher.start()
+    relay = OutboxRelay(publisher=publisher)
+    try:
+        for name, inline_publish in (("outbox only", False),
+                                     ("inline publish", True)):
+            samples = [await create(inline_publish) for _ in range(args.requests)]
+            print(
+                f"{name:<15} p50 {percentile(samples, 50):6.2f} ms  "
+                f"p99 {percentile(samples, 99):6.2f} ms"
+            )
+
+        started = time.perf_counter()
+        drained = 0
+        while True:
+            sent = await relay.drain_once()
+            if not sent:
+                break
+            drained += sent
+        elapsed = time.perf_counter() - started
+        print(
+            f"relay drained {drained} messages in {elapsed:.2f}s "
+            f"-> {drained / elapsed:,.0f} msg/s"
+        )
+    finally:
+        await publisher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
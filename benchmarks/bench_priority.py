@@ -0,0 +1,109 @@
+"""
+Задержка задач разных классов приоритета при смешанной нагрузке.
+
+Поток медленных LOW-задач занимает все слоты воркера, параллельно
+приходят быстрые HIGH-задачи. Сравниваются одна общая FIFO-очередь и
+очереди по приоритетам со взвешенным выбором (`weighted_merge`).
+Задержка - время от публикации до завершения задачи, печатаются p50 и
+p99 по каждому классу.
+
+Запуск:
+    python -m benchmarks.bench_priority --low 400 --high 200
+"""
+import argparse
+import asyncio
+import time
+
+from app.workers.routing import weighted_merge
+from app.workers.worker import run_consumer
+
+WORK_TIME = {"high": 0.01, "low": 0.2}
+
+
+class Stream:
+    """
+    Очередь в памяти, в которую сообщения публикуются по ходу работы.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    def publish(self, message):
+        self._queue.put_nowait(message)
+
+    def close(self):
+        self._queue.put_nowait(None)
+
+    async def iterator(self):
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                return
+            yield message
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def produce(streams, low, high, duration):
+    # LOW-задачи приходят пачкой в начале, HIGH - равномерно
+    for _ in range(low):
+        streams["low"].publish(("low", time.perf_counter()))
+    interval = duration / high
+    for _ in range(high):
+        await asyncio.sleep(interval)
+        streams["high"].publish(("high", time.perf_counter()))
+    for stream in set(streams.values()):
+        stream.close()
+
+
+async def run_case(prioritized, args):
+    latencies = {"high": [], "low": []}
+
+    async def handler(message):
+        cls, published_at = message
+        await asyncio.sleep(WORK_TIME[cls])
+        latencies[cls].append(time.perf_counter() - published_at)
+
+    if prioritized:
+        streams = {"high": Stream(), "low": Stream()}
+        messages = weighted_merge({
+            "high": (streams["high"].iterator(), args.high_weight),
+            "low": (streams["low"].iterator(), 1),
+        })
+    else:
+        shared = Stream()
+        streams = {"high": shared, "low": shared}
+        messages = shared.iterator()
+
+    producer = asyncio.create_task(
+        produce(streams, args.low, args.high, args.duration)
+    )
+    await run_consumer(messages, handler, args.concurrency)
+    await producer
+    return latencies
+
+
+async def main(args):
+    for prioritized in (False, True):
+        latencies = await run_case(prioritized, args)
+        name = "weighted queues" if prioritized else "single queue"
+        for cls in ("high", "low"):
+            values = latencies[cls]
+            print(
+                f"{name:<16} {cls:<5} n={len(values):<5} "
+                f"p50={percentile(values, 50) * 1000:8.1f}ms "
+                f"p99={percentile(values, 99) * 1000:8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--low", type=int, default=400)
+    parser.add_argument("--high", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--high-weight", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
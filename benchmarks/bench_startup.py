@@ -0,0 +1,85 @@
+"""
+Время импорта и холодного старта приложения и воркера.
+
+Каждый замер выполняется в новом процессе интерпретатора. Импорт
+проверяется без переменных окружения сервисов (DATABASE_URL, REDIS_URL,
+RABBITMQ_URL): клиенты создаются лениво, поэтому импорт должен
+проходить и не открывать соединений. С флагом `--cold-start` также
+измеряется время от запуска процесса до ответа на первый GET /tasks/
+(нужны настроенные сервисы).
+
+Запуск:
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ("app.models", "app.main", "app.workers.worker")
+SERVICE_ENV = ("DATABASE_URL", "DATABASE_REPLICA_URL", "REDIS_URL",
+               "RABBITMQ_URL")
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+COLD_START_SCRIPT = """
+import time
+started = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client:
+    client.get("/tasks/?limit=1").raise_for_status()
+print(time.perf_counter() - started)
+"""
+
+
+def measure(script, env, runs):
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", script],
+            env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()
+            return None, error[-1] if error else "failed"
+        samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    return samples, None
+
+
+def report(name, samples, error):
+    if error is not None:
+        print(f"{name:<22} FAILED: {error}")
+        return
+    print(
+        f"{name:<22} median={statistics.median(samples) * 1000:8.1f}ms "
+        f"min={min(samples) * 1000:8.1f}ms"
+    )
+
+
+def main(args):
+    bare_env = {
+        key: value for key, value in os.environ.items()
+        if key not in SERVICE_ENV
+    }
+    for module in MODULES:
+        samples, error = measure(
+            IMPORT_SCRIPT.format(module=module), bare_env, args.runs
+        )
+        report(f"import {module}", samples, error)
+    if args.cold_start:
+        samples, error = measure(COLD_START_SCRIPT, os.environ, args.runs)
+        report("cold start", samples, error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--cold-start", action="store_true")
+    main(parser.parse_args())
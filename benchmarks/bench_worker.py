@@ -0,0 +1,55 @@
+"""
+Пропускная способность одного воркера в зависимости от concurrency.
+
+Брокер заменён очередью в памяти, а обработчик имитирует задачу из
+app/workers/tasks.py через asyncio.sleep.
+
+Запуск:
+    python -m benchmarks.bench_worker --messages 500 --work-time 0.1
+"""
+import argparse
+import asyncio
+import time
+
+from app.workers.worker import run_consumer
+from tests.inmemory_broker import InMemoryBroker
+
+
+async def run_case(messages, work_time, prefetch_count, concurrency):
+    broker = InMemoryBroker(prefetch_count=prefetch_count)
+    for i in range(messages):
+        broker.publish(str(i).encode())
+
+    async def handler(message):
+        async with message.process():
+            await asyncio.sleep(work_time)
+
+    started = time.perf_counter()
+    await run_consumer(broker.iterator(), handler, concurrency)
+    elapsed = time.perf_counter() - started
+    assert broker.acked == messages
+    return elapsed
+
+
+async def main(args):
+    for concurrency in args.concurrency:
+        prefetch_count = max(args.prefetch, concurrency)
+        elapsed = await run_case(
+            args.messages, args.work_time, prefetch_count, concurrency
+        )
+        print(
+            f"concurrency={concurrency:<4} prefetch={prefetch_count:<4} "
+            f"{args.messages} tasks in {elapsed:.2f}s "
+            f"-> {args.messages / elapsed:,.1f} tasks/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--work-time", type=float, default=0.1)
+    parser.add_argument("--prefetch", type=int, default=32)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 16, 64]
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import pytest
+
+from app.resources import resources
+from app.utils.events import TASK_EVENTS_CHANNEL
+
+
+class FakePipeline:
+    """
+    Конвейер FakeRedis: команды копятся и выполняются по порядку в
+    `execute`.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+        return queue
+
+    async def execute(self):
+        self.redis.executed += 1
+        commands, self.commands = self.commands, []
+        return [
+            await method(*args, **kwargs) for method, args, kwargs in commands
+        ]
+
+
+class FakeRedis:
+    """
+    Redis в памяти с командами, которые используют приложение и воркер.
+
+    Как настоящий клиент, каждая команда отдаёт управление циклу событий.
+
+    :param data: Начальные строковые значения.
+    """
+
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+        self.expires = {}
+        self.hashes = {}
+        self.lists = {}
+        self.deleted = []
+        self.published = []
+        self.executed = 0
+
+    @property
+    def events(self):
+        """
+        :return: События смены статуса, опубликованные в TASK_EVENTS_CHANNEL.
+        """
+        return [
+            event
+            for channel, message in self.published
+            if channel == TASK_EVENTS_CHANNEL
+            for event in json.loads(message)['events']
+        ]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        await asyncio.sleep(0)
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        await asyncio.sleep(0)
+        self.data[key] = value
+        self.expires[key] = ex
+
+    async def delete(self, *keys):
+        await asyncio.sleep(0)
+        self.deleted.extend(keys)
+        for key in keys:
+            self.data.pop(key, None)
+            self.hashes.pop(key, None)
+            self.lists.pop(key, None)
+
+    async def expire(self, key, ttl):
+        await asyncio.sleep(0)
+        self.expires[key] = ttl
+
+    async def hset(self, key, mapping):
+        await asyncio.sleep(0)
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hget(self, key, field):
+        await asyncio.sleep(0)
+        return self.hashes.get(key, {}).get(field)
+
+    async def rpush(self, key, *values):
+        await asyncio.sleep(0)
+        self.lists.setdefault(key, []).extend(values)
+
+    async def lrange(self, key, start, end):
+        await asyncio.sleep(0)
+        values = self.lists.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    async def publish(self, channel, message):
+        await asyncio.sleep(0)
+        self.published.append((channel, message))
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """
+    FakeRedis вместо клиента Redis из `resources`.
+    """
+    fake = FakeRedis()
+    monkeypatch.setitem(vars(resources), "redis", fake)
+    return fake
@@ -0,0 +1,49 @@
+"""
+Простая замена RabbitMQ в памяти для тестов и бенчмарков воркера.
+
+Повторяет то, что нужно `run_consumer`: асинхронный итератор сообщений,
+ограничение prefetch и `message.process()` с ack/nack.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class InMemoryMessage:
+
+    def __init__(self, broker, body, queue_name=None):
+        self.broker = broker
+        self.body = body
+        self.queue_name = queue_name
+
+    @asynccontextmanager
+    async def process(self):
+        try:
+            yield self
+        except Exception:
+            self.broker.nacked += 1
+            raise
+        else:
+            self.broker.acked += 1
+        finally:
+            self.broker.release()
+
+
+class InMemoryBroker:
+
+    def __init__(self, prefetch_count: int):
+        self.messages = deque()
+        self.acked = 0
+        self.nacked = 0
+        self._prefetch = asyncio.Semaphore(prefetch_count)
+
+    def publish(self, body):
+        self.messages.append(body)
+
+    def release(self):
+        self._prefetch.release()
+
+    async def iterator(self):
+        while self.messages:
+            await self._prefetch.acquire()
+            yield InMemoryMessage(self, self.messages.popleft())
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from datetime import datetime
+
+from app import crud, models
+from app.resources import resources
+from app.utils import caching
+from app.utils.caching import LocalCache
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()['expirations'] == 1
+
+
+class BrokenRedis:
+
+    async def get(self, key):
+        raise ConnectionError("redis is down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("redis is down")
+
+
+class FakeSession:
+
+    def __init__(self, bind, task):
+        self.bind = bind
+        self.task = task
+
+    async def get(self, model, task_id):
+        return self.task
+
+
+def test_result_memo_runs_identical_payloads_once(redis):
+    memo = caching.ResultMemo(local_size=10, ttl=60)
+    calls = 0
+
+    async def run():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "RESULT"
+
+    async def main():
+        key = memo.key("type2", {"text": "a"})
+        # Одновременные одинаковые задачи объединяются, повторная
+        # берётся из кеша
+        first = await asyncio.gather(
+            *(memo.get_or_run(key, run) for _ in range(3))
+        )
+        second = await memo.get_or_run(key, run)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == ["RESULT"] * 3
+    assert second == "RESULT"
+    assert calls == 1
+    assert memo.stats()['misses'] == 1
+    assert memo.stats()['hits'] == 3
+
+
+def test_result_memo_survives_redis_errors(monkeypatch):
+    monkeypatch.setitem(vars(resources), "redis", BrokenRedis())
+    memo = caching.ResultMemo(local_size=10, ttl=60)
+
+    async def run():
+        return "RESULT"
+
+    key = memo.key("type2", {"text": "a"})
+    assert asyncio.run(memo.get_or_run(key, run)) == "RESULT"
+    # Результат остался в кеше процесса
+    assert memo.local.get(key) == ("RESULT",)
+
+
+def test_local_cache_limits_total_size():
+    cache = LocalCache(maxsize=10, ttl=60, maxbytes=100)
+    cache.set("a", 1, size=60)
+    cache.set("b", 2, size=30)
+    cache.set("a", 3, size=50)
+    cache.set("c", 4, size=40)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 3
+    assert cache.get("c") == 4
+    assert cache.stats()['bytes'] == 90
+
+
+def test_result_memo_key_ignores_key_order():
+    assert caching.ResultMemo.key("t", {"a": 1, "b": 2}) == \
+        caching.ResultMemo.key("t", {"b": 2, "a": 1})
+
+
+def make_task(status):
+    now = datetime.utcnow()
+    return models.Task(
+        id=1, type="type3", status=status,
+        priority=models.TaskPriority.NORMAL, created_at=now, updated_at=now
+    )
+
+
+def test_get_task_does_not_cache_replica_reads(monkeypatch, redis):
+    monkeypatch.setitem(vars(resources), "engine", object())
+    caching.local_cache.clear()
+    replica = FakeSession(object(), make_task(models.TaskStatus.PENDING))
+
+    task = asyncio.run(crud.get_task(replica, 1))
+    assert task.status == "PENDING"
+    assert redis.data == {}
+    assert caching.local_cache.get(crud.task_cache_key(1)) is None
+
+
+def test_get_task_caches_active_tasks_briefly(monkeypatch, redis):
+    primary = object()
+    monkeypatch.setitem(vars(resources), "engine", primary)
+    key = crud.task_cache_key(1)
+
+    for status, ttl in (
+        (models.TaskStatus.IN_PROGRESS, crud.TASK_CACHE_ACTIVE_TTL),
+        (models.TaskStatus.COMPLETED, crud.TASK_CACHE_TTL),
+    ):
+        caching.local_cache.clear()
+        redis.data.clear()
+        asyncio.run(crud.get_task(FakeSession(primary, make_task(status)), 1))
+        assert redis.expires[key] == ttl
@@ -0,0 +1,106 @@
+import asyncio
+
+from app.utils.caching import ResultMemo, result_memo
+from app.workers.cancellation import CancellationTracker
+from app.workers.tasks import TaskRegistry, registry
+
+
+def test_cancel_interrupts_running_task():
+    tracker = CancellationTracker()
+
+    async def run():
+        with tracker.track(1):
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(run())
+        await asyncio.sleep(0)
+        tracker.cancel(1)
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert tracker.is_canceled(1)
+    assert tracker.interrupted == 1
+
+
+def test_cancel_before_start_is_remembered():
+    tracker = CancellationTracker()
+    tracker.cancel(2)
+    assert tracker.is_canceled(2)
+    assert not tracker.is_canceled(3)
+    assert tracker.interrupted == 0
+
+
+def run_and_cancel(run, delay, settle, check):
+    """
+    Запускает `run` как выполняющуюся задачу 1, отменяет её через
+    `delay` секунд и через `settle` секунд вызывает `check`. Проверка
+    делается до остановки event loop, которая сама отменила бы всё
+    оставшееся.
+    """
+    tracker = CancellationTracker()
+
+    async def tracked():
+        with tracker.track(1):
+            return await run()
+
+    async def main():
+        task = asyncio.create_task(tracked())
+        await asyncio.sleep(delay)
+        tracker.cancel(1)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("Task was not canceled")
+        await asyncio.sleep(settle)
+        return check()
+
+    return asyncio.run(main())
+
+
+def test_cancel_interrupts_memoized_computation(redis):
+    memo = ResultMemo(local_size=10, ttl=60)
+    local_registry = TaskRegistry(memo=memo)
+    interrupted = []
+
+    @local_registry.register('slow', deterministic=True)
+    async def slow(data):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            interrupted.append(True)
+            raise
+        return "done"
+
+    async def run():
+        return await local_registry.run('slow', {'n': 1})
+
+    assert run_and_cancel(run, 0.05, 0.05, lambda: list(interrupted)) == [True]
+    assert memo._in_flight == {}
+
+
+def test_cancel_interrupts_type2_task(monkeypatch, redis):
+    spec = registry.get('type2')
+    batches = []
+
+    async def handler(payloads):
+        batches.append(payloads)
+        return [data['text'].upper() for data in payloads]
+
+    monkeypatch.setattr(spec, "handler", handler)
+    # Пачка копится дольше, чем задача выполняется до отмены
+    monkeypatch.setattr(spec._batcher, "batch_window", 0.3)
+    payload = {'text': 'cancel me'}
+
+    async def run():
+        return await registry.run('type2', payload)
+
+    # Отменённая задача не попадает в пачку, и её результат не кешируется
+    assert run_and_cancel(run, 0.05, 0.4, lambda: list(batches)) == []
+    assert result_memo.local.get(ResultMemo.key('type2', payload)) is None
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from app import schemas
+from app.utils import codec
+
+
+def test_task_roundtrip():
+    now = datetime.utcnow()
+    task = schemas.Task(
+        id=1,
+        type="type1",
+        status=schemas.TaskStatus.COMPLETED,
+        priority=schemas.TaskPriority.HIGH,
+        result="120",
+        result_size=3,
+        result_digest="ab" * 32,
+        created_at=now,
+        updated_at=now,
+    )
+    decoded = codec.decode_task(codec.encode_task(task))
+    assert decoded == task
+    assert isinstance(decoded, schemas.Task)
+
+
+def test_other_version_is_a_miss():
+    now = datetime.utcnow()
+    task = schemas.Task(
+        id=1, type="type1", status="PENDING", created_at=now, updated_at=now
+    )
+    row = codec._unpack(codec.encode_task(task))
+    row[0] = codec.TASK_CODEC_VERSION + 1
+    assert codec.decode_task(codec._pack(row)) is None
@@ -0,0 +1,28 @@
+import asyncio
+
+from app.utils.events import TaskEventHub, task_event
+
+
+def test_waiter_resolves_on_terminal_status():
+    hub = TaskEventHub()
+
+    async def main():
+        with hub.waiter(1) as finished:
+            hub.dispatch(task_event(1, "IN_PROGRESS"))
+            assert not finished.done()
+            hub.dispatch(task_event(1, "COMPLETED"))
+            return await asyncio.wait_for(finished, 1)
+
+    assert asyncio.run(main()) == {'id': 1, 'status': "COMPLETED"}
+
+
+def test_subscribers_receive_filtered_events():
+    hub = TaskEventHub()
+
+    async def main():
+        with hub.subscribe([2]) as only_two, hub.subscribe() as everything:
+            hub.dispatch(task_event(1, "COMPLETED"))
+            hub.dispatch(task_event(2, "FAILED"))
+            return only_two.qsize(), everything.qsize()
+
+    assert asyncio.run(main()) == (1, 2)
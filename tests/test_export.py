@@ -0,0 +1,52 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.models import TaskStatus
+from app.utils.export import EXPORT_FIELDS, iter_csv, iter_ndjson
+
+CREATED_AT = datetime(2026, 10, 18, 12, 0)
+
+
+def make_task(task_id, updated_at=CREATED_AT):
+    return SimpleNamespace(
+        id=task_id, type="type1", status=TaskStatus.COMPLETED,
+        result="ok", result_size=2, result_digest="digest",
+        created_at=CREATED_AT, updated_at=updated_at
+    )
+
+
+async def stream(tasks):
+    for task in tasks:
+        yield task
+
+
+def collect(chunks):
+    async def main():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(main())
+
+
+def test_ndjson_is_chunked_by_rows():
+    tasks = [make_task(i) for i in range(5)]
+    chunks = collect(iter_ndjson(stream(tasks), chunk_rows=2))
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+    rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [row["id"] for row in rows] == list(range(5))
+    assert rows[0]["status"] == "COMPLETED"
+    assert rows[0]["created_at"] == CREATED_AT.isoformat()
+
+
+def test_export_allows_missing_updated_at():
+    tasks = [make_task(1, updated_at=None)]
+    row = json.loads("".join(collect(iter_ndjson(stream(tasks)))))
+    assert row["updated_at"] is None
+
+    text = "".join(collect(iter_csv(stream(tasks))))
+    header, values = csv.reader(io.StringIO(text))
+    assert tuple(header) == EXPORT_FIELDS
+    assert values[0] == "1"
+    assert values[-1] == ""
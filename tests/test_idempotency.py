@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from app import crud, schemas
+
+
+def test_payload_idempotency_key_has_fixed_length():
+    task = schemas.TaskCreate(type="t" * 300, data={"text": "x" * 1000})
+    key = crud.payload_idempotency_key(task)
+    assert len(key) == len("payload:") + 64
+    assert key == crud.payload_idempotency_key(
+        schemas.TaskCreate(type="t" * 300, data={"text": "x" * 1000})
+    )
+
+
+def test_request_digest_ignores_key_order_but_not_body():
+    first = schemas.TaskCreate(type="type1", data={"a": 1, "b": 2})
+    same = schemas.TaskCreate(type="type1", data={"b": 2, "a": 1})
+    other = schemas.TaskCreate(type="type1", data={"a": 1, "b": 3})
+    assert crud.request_digest(first) == crud.request_digest(same)
+    assert crud.request_digest(first) != crud.request_digest(other)
+
+
+def test_reused_key_with_different_body_is_rejected(redis):
+    first = schemas.TaskCreate(type="type1", data={"a": 1})
+    other = schemas.TaskCreate(type="type1", data={"a": 2})
+    cache_key = crud.idempotency_cache_key("key")
+    redis.data[cache_key] = f"7:{crud.request_digest(first)}".encode()
+
+    with pytest.raises(crud.IdempotencyKeyMismatch):
+        asyncio.run(crud.create_task_idempotent(
+            None, other, "key", window=60,
+            request_hash=crud.request_digest(other)
+        ))
@@ -0,0 +1,68 @@
+import socket
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.utils.metrics import (
+    DB_POOL_WAIT, DB_ROUND_TRIPS, TimedQueuePool, counter_value,
+    instrument_engine, start_metrics_server
+)
+
+
+class FakeConnection:
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def pool_wait_totals():
+    values = {}
+    for metric in DB_POOL_WAIT.collect():
+        for sample in metric.samples:
+            values[sample.name] = sample.value
+    return values["db_pool_wait_seconds_sum"], \
+        values["db_pool_wait_seconds_count"]
+
+
+def test_pool_wait_excludes_connection_setup():
+    def connect():
+        time.sleep(0.2)
+        return FakeConnection()
+
+    pool = TimedQueuePool(connect, pool_size=1, max_overflow=0)
+    total, count = pool_wait_totals()
+    connection = pool.connect()
+    connection.close()
+    waited, checkouts = pool_wait_totals()
+    assert checkouts == count + 1
+    assert waited - total < 0.1
+    pool.dispose()
+
+
+def test_metrics_server_skips_busy_port():
+    with socket.socket() as busy:
+        busy.bind(("", 0))
+        busy.listen()
+        assert start_metrics_server(busy.getsockname()[1]) is False
+    assert start_metrics_server(0) is False
+
+
+def test_round_trips_skip_transaction_events_in_autocommit():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    instrument_engine(engine)
+    autocommit = engine.execution_options(isolation_level="AUTOCOMMIT")
+
+    before = counter_value(DB_ROUND_TRIPS)
+    with autocommit.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    # Только сам запрос: BEGIN и ROLLBACK в AUTOCOMMIT не отправляются
+    assert counter_value(DB_ROUND_TRIPS) == before + 1
+
+    with engine.begin() as conn:
+        conn.execute(text("SELECT 1"))
+    assert counter_value(DB_ROUND_TRIPS) == before + 4
+    engine.dispose()
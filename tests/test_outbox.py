@@ -0,0 +1,94 @@
+import asyncio
+
+from sqlalchemy import delete, func
+from sqlalchemy.future import select
+
+from app import crud, schemas
+from app.dependencies import AsyncSessionLocal
+from app.models import OutboxMessage
+from app.workers.relay import OutboxRelay
+
+
+class RecordingPublisher:
+    """
+    Издатель, который запоминает сообщения вместо отправки в RabbitMQ.
+    """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.published = []
+
+    async def publish_many(self, tasks, return_exceptions=False):
+        if self.fail:
+            return [ConnectionError("broker is down") for _ in tasks]
+        self.published.extend(tasks)
+        return [None for _ in tasks]
+
+
+async def outbox_task_ids():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(OutboxMessage.task_id))
+        return set(result.scalars())
+
+
+async def create_task_without_relay():
+    # Задача сохранена, но процесс "упал" до публикации: ретранслятор
+    # не запускался
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(OutboxMessage))
+        await db.commit()
+        db_task = await crud.create_task(
+            db, schemas.TaskCreate(type="type2", data={"text": "a"})
+        )
+        return db_task.id
+
+
+def test_outbox_recovers_after_crash():
+    async def main():
+        task_id = await create_task_without_relay()
+        assert task_id in await outbox_task_ids()
+
+        # Ретранслятор после перезапуска публикует незавершённую отправку
+        publisher = RecordingPublisher()
+        sent = await OutboxRelay(publisher=publisher).drain_once()
+        return task_id, sent, publisher.published, await outbox_task_ids()
+
+    task_id, sent, published, remaining = asyncio.run(main())
+    assert sent == 1
+    assert published == [
+        {"id": task_id, "type": "type2", "data": {"text": "a"}, "priority": "NORMAL"}
+    ]
+    assert task_id not in remaining
+
+
+def test_outbox_keeps_messages_when_publish_fails():
+    async def main():
+        task_id = await create_task_without_relay()
+        sent = await OutboxRelay(publisher=RecordingPublisher(fail=True)).drain_once()
+        return task_id, sent, await outbox_task_ids()
+
+    task_id, sent, remaining = asyncio.run(main())
+    assert sent == 0
+    assert task_id in remaining
+
+
+def test_outbox_holds_delayed_task_until_due():
+    async def main():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(OutboxMessage))
+            await db.commit()
+            db_task = await crud.create_task(
+                db, schemas.TaskCreate(type="type3", delay=0.5)
+            )
+        relay = OutboxRelay(publisher=RecordingPublisher())
+        early = await relay.drain_once()
+        due = await relay.next_due()
+        await asyncio.sleep(0.6)
+        late = await relay.drain_once()
+        return db_task, early, due, late
+
+    db_task, early, due, late = asyncio.run(main())
+    assert db_task.run_at is not None
+    assert early == 0
+    assert due == db_task.run_at
+    assert late == 1
@@ -0,0 +1,34 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_cursor_round_trip_keeps_microseconds():
+    created_at = datetime(2026, 10, 18, 12, 30, 15, 123456)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "!!!!",
+    raw_cursor([1]),
+    raw_cursor([1, 2, 3]),
+    raw_cursor({"created_at": 1, "id": 2}),
+    raw_cursor(["yesterday", 2]),
+    raw_cursor([1, "two"]),
+    raw_cursor([10 ** 20, 2]),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid pagination cursor"):
+        decode_cursor(cursor)
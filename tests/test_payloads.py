@@ -0,0 +1,25 @@
+import asyncio
+
+from app.utils import payloads
+from app.utils.blobstore import BlobStore
+
+
+def test_small_payload_is_stored_inline():
+    encoded = asyncio.run(payloads.encode_payload({'text': 'hello'}))
+    assert encoded.ref is None
+    assert encoded.inline
+    decoded = asyncio.run(payloads.decode_payload(encoded.data))
+    assert decoded == {"text": "hello"}
+
+
+def test_large_payload_is_offloaded(monkeypatch, tmp_path):
+    monkeypatch.setattr(payloads, "blob_store", BlobStore(str(tmp_path)))
+    monkeypatch.setattr(payloads, "PAYLOAD_OFFLOAD_THRESHOLD", 16)
+    data = {'text': 'x' * 10000, 'numbers': list(range(100))}
+
+    encoded = asyncio.run(payloads.encode_payload(data))
+    assert encoded.data is None
+    assert not encoded.inline
+    assert asyncio.run(payloads.decode_payload(None, encoded.ref)) == data
+    # Одинаковые данные хранятся одним блобом
+    assert asyncio.run(payloads.encode_payload(data)).ref == encoded.ref
@@ -0,0 +1,108 @@
+import asyncio
+
+from app.models import TaskPriority
+from app.workers.produser import TaskPublisher
+from app.workers.routing import QUEUE_NAME, QUEUES
+
+
+class FakeExchange:
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, message, routing_key):
+        broker = self.broker
+        broker.in_flight += 1
+        broker.peak = max(broker.peak, broker.in_flight)
+        # Подтверждения пачки приходят вместе
+        await asyncio.sleep(0.01)
+        broker.in_flight -= 1
+        if message.body in broker.rejected:
+            raise RuntimeError("nack")
+        broker.published.append((routing_key, message.body))
+
+
+class FakeChannel:
+
+    def __init__(self, broker):
+        self.default_exchange = FakeExchange(broker)
+        self.declared = []
+
+    async def declare_queue(self, name, durable):
+        self.declared.append(name)
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def channel(self, publisher_confirms):
+        assert publisher_confirms
+        self.broker.channels += 1
+        return FakeChannel(self.broker)
+
+    async def close(self):
+        pass
+
+
+class FakeBroker:
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.published = []
+        self.connections = 0
+        self.channels = 0
+        self.in_flight = 0
+        self.peak = 0
+
+
+class FakePublisher(TaskPublisher):
+
+    def __init__(self, broker, **kwargs):
+        super().__init__("amqp://fake", **kwargs)
+        self.broker = broker
+
+    async def _get_connection(self):
+        self.broker.connections += 1
+        return FakeConnection(self.broker)
+
+
+def test_publisher_reuses_pooled_channel_and_batches_confirms():
+    broker = FakeBroker()
+    publisher = FakePublisher(broker, confirm_batch_size=2)
+    tasks = [{'id': i, 'priority': 'NORMAL'} for i in range(5)]
+
+    async def main():
+        await publisher.publish_many(tasks)
+        await publisher.publish({'id': 5, 'priority': 'HIGH'})
+        await publisher.close()
+
+    asyncio.run(main())
+    assert broker.connections == 1
+    assert broker.channels == 1
+    # Одновременно ждут подтверждения не больше сообщений, чем в пачке
+    assert broker.peak == 2
+    assert [key for key, _ in broker.published] == \
+        [QUEUE_NAME] * 5 + [QUEUES[TaskPriority.HIGH]]
+
+
+def test_publish_many_returns_failures_in_place():
+    broker = FakeBroker(rejected={b'{"id": 1}'})
+    publisher = FakePublisher(broker)
+
+    async def main():
+        try:
+            return await publisher.publish_many(
+                [{'id': 0}, {'id': 1}, {'id': 2}], return_exceptions=True
+            )
+        finally:
+            await publisher.close()
+
+    results = asyncio.run(main())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], RuntimeError)
+    assert len(broker.published) == 2
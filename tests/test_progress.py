@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from app import crud, models
+from app.utils.batching import MicroBatcher
+from app.utils.progress import (
+    chunks_key, get_partial_results, get_progress, progress_key,
+    progress_scope, report_progress
+)
+
+
+def test_progress_is_rate_limited_and_flushed_on_exit(redis):
+    async def main():
+        async with progress_scope(1):
+            for step in range(1, 11):
+                await report_progress(step * 10, {"step": step})
+        # Вне выполнения задачи прогресс игнорируется
+        await report_progress(100)
+        return await get_partial_results(1, offset=8)
+
+    tail = asyncio.run(main())
+    # Первое обновление и остаток при выходе, а не запись на каждый шаг
+    assert redis.executed == 2
+    assert redis.hashes[progress_key(1)]["percent"] == 100.0
+    assert len(redis.lists[chunks_key(1)]) == 10
+    assert tail == [{"step": 9}, {"step": 10}]
+
+
+def test_batch_does_not_report_progress_of_submitter(redis):
+    async def handler(items):
+        await report_progress(50)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(handler, max_batch_size=2, batch_window=0.01)
+        async with progress_scope(1):
+            # Пачку отправляет таймер, скопировавший контекст задачи 1
+            result = await asyncio.wait_for(batcher.submit("a"), 1)
+        return result
+
+    assert asyncio.run(main()) == "a"
+    assert redis.executed == 0
+
+
+def test_retry_clears_previous_progress(monkeypatch, redis):
+    committed = []
+
+    async def enqueue_tasks(db, messages):
+        pass
+
+    async def cache_task(db_task):
+        pass
+
+    async def publish_task_events(events):
+        pass
+
+    async def commit():
+        # Прогресс прошлой попытки удалён до фиксации перезапуска
+        committed.append(progress_key(1) not in redis.hashes)
+
+    async def refresh(db_task):
+        pass
+
+    monkeypatch.setattr(crud, "enqueue_tasks", enqueue_tasks)
+    monkeypatch.setattr(crud, "cache_task", cache_task)
+    monkeypatch.setattr(crud, "publish_task_events", publish_task_events)
+    db = SimpleNamespace(commit=commit, refresh=refresh)
+    db_task = models.Task(
+        id=1, type="type3", status=models.TaskStatus.FAILED,
+        priority=models.TaskPriority.NORMAL, updated_at=datetime.utcnow()
+    )
+
+    async def main():
+        async with progress_scope(1):
+            await report_progress(40, {"step": 1})
+        await crud.retry_task(db, db_task)
+        return await get_progress(1), await get_partial_results(1)
+
+    assert asyncio.run(main()) == (None, [])
+    assert committed == [True]
+    assert db_task.status == models.TaskStatus.PENDING
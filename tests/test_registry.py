@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from app.workers import tasks
+from app.workers.executors import CpuLane
+from app.workers.tasks import (
+    CPU_LANE, TYPE1_MAX_NUMBER, TaskRegistry, TaskSpec, registry
+)
+
+
+def test_unknown_task_type():
+    with pytest.raises(ValueError):
+        asyncio.run(registry.run('unknown', {}))
+
+
+def test_batch_handler_called_once_per_batch():
+    # Несколько задач одного типа обрабатываются одним вызовом
+    local_registry = TaskRegistry()
+    calls = []
+
+    @local_registry.register('upper', batch=True, max_batch_size=10)
+    async def upper(payloads):
+        calls.append(len(payloads))
+        return [
+            ValueError("bad") if data.get('text') is None
+            else data['text'].upper()
+            for data in payloads
+        ]
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                local_registry.run('upper', {'text': f"t{i}"})
+                for i in range(5)
+            ),
+            local_registry.run('upper', {}),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert calls == [6]
+    assert results[:5] == [f"T{i}" for i in range(5)]
+    assert isinstance(results[5], ValueError)
+
+
+def test_concurrency_and_timeout_limits():
+    local_registry = TaskRegistry()
+    in_flight = 0
+    peak = 0
+
+    @local_registry.register('slow', concurrency=2, timeout=0.05)
+    async def slow(data):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(data['sleep'])
+        finally:
+            in_flight -= 1
+        return data['sleep']
+
+    async def main():
+        fast = await asyncio.gather(
+            *(local_registry.run('slow', {'sleep': 0.01}) for _ in range(6))
+        )
+        with pytest.raises(TimeoutError):
+            await local_registry.run('slow', {'sleep': 1})
+        return fast
+
+    assert asyncio.run(main()) == [0.01] * 6
+    assert peak == 2
+
+
+def sleep_in_pool(name, seconds):
+    # Выполняется в процессе пула вместо обработчика из реестра
+    time.sleep(seconds)
+    return name
+
+
+@pytest.fixture
+def cpu_lane(monkeypatch):
+    lane = CpuLane(max_workers=1)
+    monkeypatch.setattr(tasks, "cpu_lane", lane)
+    yield lane
+    lane.shutdown()
+
+
+def test_type1_runs_in_process_pool(cpu_lane):
+    spec = registry.get('type1')
+    assert asyncio.run(spec.invoke({'number': 5})) == "120"
+    assert cpu_lane._executor is not None
+
+
+def test_type1_rejects_too_large_number():
+    with pytest.raises(ValueError, match="exceeds the limit"):
+        asyncio.run(registry.run('type1', {'number': TYPE1_MAX_NUMBER + 1}))
+
+
+def test_cpu_timeout_keeps_slot_until_process_is_free(
+    monkeypatch, cpu_lane
+):
+    monkeypatch.setattr(tasks, "_call_cpu_handler", sleep_in_pool)
+    spec = TaskSpec(
+        'sleepy', sleep_in_pool, lane=CPU_LANE, concurrency=1, timeout=0.05
+    )
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await spec.invoke(0.5)
+        # Процесс ещё досчитывает: следующая задача его не ждёт в пуле
+        held = spec._semaphore.locked()
+        started = time.monotonic()
+        assert await spec.invoke(0) == 'sleepy'
+        return held, time.monotonic() - started
+
+    held, waited = asyncio.run(main())
+    assert held
+    assert waited > 0.3
+
+
+def test_io_tasks_run_while_cpu_lane_is_busy(monkeypatch, cpu_lane):
+    monkeypatch.setattr(tasks, "_call_cpu_handler", sleep_in_pool)
+    cpu_spec = TaskSpec('sleepy', sleep_in_pool, lane=CPU_LANE)
+    local_registry = TaskRegistry()
+    finished = []
+
+    @local_registry.register('io')
+    async def io(data):
+        await asyncio.sleep(0.01)
+        finished.append(data)
+        return data
+
+    async def main():
+        cpu = asyncio.ensure_future(cpu_spec.invoke(0.5))
+        await asyncio.gather(*(local_registry.run('io', i) for i in range(3)))
+        # IO-задачи завершились, пока процесс пула занят
+        assert not cpu.done()
+        return await cpu
+
+    assert asyncio.run(main()) == 'sleepy'
+    assert finished == [0, 1, 2]
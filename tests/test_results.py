@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from app.utils import results
+from app.utils.blobstore import BlobStore
+
+
+def test_large_result_is_stored_out_of_line(monkeypatch, tmp_path):
+    monkeypatch.setattr(results, "blob_store", BlobStore(str(tmp_path)))
+    monkeypatch.setattr(results, "RESULT_INLINE_LIMIT", 100)
+    small = asyncio.run(results.encode_result("120"))
+    assert small.text == "120" and small.ref is None and small.size == 3
+
+    text = "".join(str(i) for i in range(10000))
+    stored = asyncio.run(results.encode_result(text))
+    assert stored.text is None and stored.size == len(text)
+    data = b"".join(results.iter_result(None, stored.ref, chunk_size=512))
+    assert data == text.encode()
+    part = b"".join(
+        results.iter_result(None, stored.ref, 1000, 2999, chunk_size=512)
+    )
+    assert part == text.encode()[1000:3000]
+
+
+def test_parse_range():
+    assert results.parse_range("bytes=0-99", 1000) == (0, 99)
+    assert results.parse_range("bytes=900-", 1000) == (900, 999)
+    assert results.parse_range("bytes=-100", 1000) == (900, 999)
+    assert results.parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert results.parse_range("items=0-1", 1000) is None
+    with pytest.raises(ValueError):
+        results.parse_range("bytes=1000-", 1000)
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime
+
+from app.utils.blobstore import BlobStore
+from app.workers.retention import (
+    add_months, collect_blobs, ensure_partitions, expire_idempotency_keys,
+    expire_partitions, partition_name
+)
+
+
+def test_add_months_crosses_year():
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_partition_name():
+    assert partition_name(date(2026, 3, 1)) == "tasks_p202603"
+
+
+class FakeResult:
+
+    def __init__(self, rows, rowcount=0):
+        self.rows = rows
+        self.rowcount = rowcount
+
+    def scalars(self):
+        return self.rows
+
+
+class FakeConnection:
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.statements = []
+        self.params = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        self.params.append(params)
+        if "pg_inherits" in sql:
+            return FakeResult(self.partitions)
+        return FakeResult([], rowcount=2)
+
+
+def test_ensure_partitions_moves_default_rows_before_attaching():
+    current = datetime.utcnow().date().replace(day=1)
+    name = partition_name(current)
+    existing = [partition_name(add_months(current, 1)), "tasks_default"]
+    conn = FakeConnection(existing)
+
+    assert asyncio.run(ensure_partitions(conn, ahead=1)) == [name]
+    lock, create, move, attach = conn.statements[1:]
+    assert lock.startswith("LOCK TABLE tasks_default")
+    assert create.startswith(f"CREATE TABLE {name} (LIKE tasks")
+    assert "DELETE FROM tasks_default" in move
+    assert f"INSERT INTO {name}" in move
+    assert attach.startswith(f"ALTER TABLE tasks ATTACH PARTITION {name}")
+
+
+def test_expire_partitions_counts_rows_after_detach():
+    conn = FakeConnection(["tasks_p200001", "tasks_default"])
+
+    assert asyncio.run(expire_partitions(conn)) == ["tasks_p200001"]
+    detach, counters, drop = conn.statements[1:]
+    assert detach == "ALTER TABLE tasks DETACH PARTITION tasks_p200001"
+    assert counters.startswith("INSERT INTO task_counters")
+    assert "FROM tasks_p200001" in counters
+    assert drop == "DROP TABLE tasks_p200001"
+
+
+def test_expire_idempotency_keys_deletes_keys_past_window():
+    conn = FakeConnection([])
+
+    assert asyncio.run(expire_idempotency_keys(conn, window=3600)) == 2
+    assert conn.statements == [
+        "DELETE FROM idempotency_keys WHERE created_at < :cutoff"
+    ]
+    age = datetime.utcnow() - conn.params[0]['cutoff']
+    assert 3599 < age.total_seconds() < 3660
+
+
+class RefsConnection(FakeConnection):
+
+    def __init__(self, referenced, archived=()):
+        super().__init__([])
+        self.referenced = set(referenced)
+        self.archived = list(archived)
+
+    async def execute(self, statement, params=None):
+        await super().execute(statement, params)
+        if "pg_tables" in self.statements[-1]:
+            return FakeResult(self.archived)
+        return FakeResult([
+            ref for ref in params['refs'] if ref in self.referenced
+        ])
+
+
+def age(store, digest, seconds):
+    past = time.time() - seconds
+    os.utime(store.path(digest), (past, past))
+
+
+def test_collect_blobs_deletes_only_old_unreferenced_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    kept, orphan, fresh = (store.put_sync(data) for data in (b"a", b"b", b"c"))
+    age(store, kept, 7200)
+    age(store, orphan, 7200)
+    conn = RefsConnection([kept])
+
+    deleted = asyncio.run(
+        collect_blobs(conn, store=store, grace=3600, archive_schema="")
+    )
+
+    assert deleted == 1
+    assert not os.path.exists(store.path(orphan))
+    assert os.path.exists(store.path(kept))
+    assert os.path.exists(store.path(fresh))
+    assert sorted(conn.params[0]['refs']) == sorted([kept, orphan])
+    assert "FROM tasks WHERE data_ref" in conn.statements[0]
+    assert "FROM tasks WHERE result_ref" in conn.statements[0]
+
+
+def test_collect_blobs_checks_archived_partitions(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest = store.put_sync(b"archived")
+    age(store, digest, 7200)
+    conn = RefsConnection([digest], archived=["tasks_p200001", "other"])
+
+    deleted = asyncio.run(
+        collect_blobs(conn, store=store, grace=3600, archive_schema="archive")
+    )
+
+    assert deleted == 0
+    query = conn.statements[-1]
+    assert "FROM archive.tasks_p200001 WHERE data_ref" in query
+    assert "archive.other" not in query
+
+
+def test_put_refreshes_existing_blob(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest = store.put_sync(b"shared")
+    age(store, digest, 7200)
+
+    store.put_sync(b"shared")
+
+    assert store.list_older_than(time.time() - 3600) == []
+    assert not store.delete_sync(digest, older_than=time.time() - 3600)
+    assert os.path.exists(store.path(digest))
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.models import TaskPriority
+from app.workers.routing import (
+    QUEUE_NAME, QUEUES, parse_queue_weights, queue_for, weighted_merge
+)
+
+
+async def _source(items):
+    for item in items:
+        yield item
+
+
+def test_queue_for_priority():
+    assert queue_for(None) == QUEUE_NAME
+    assert queue_for("NORMAL") == QUEUE_NAME
+    assert queue_for(TaskPriority.HIGH) == QUEUES[TaskPriority.HIGH]
+
+
+def test_parse_queue_weights():
+    weights = parse_queue_weights("high=3, low=1")
+    assert weights == {
+        QUEUES[TaskPriority.HIGH]: 3,
+        QUEUES[TaskPriority.LOW]: 1,
+    }
+    with pytest.raises(ValueError):
+        parse_queue_weights("HIGH=0")
+    with pytest.raises(ValueError):
+        parse_queue_weights("URGENT=1")
+
+
+def test_weighted_merge_shares_by_weight():
+    # Пока обе очереди не пусты, выдачи делятся в пропорции весов 3:1,
+    # после опустошения одной очереди выдаётся остаток другой
+    async def collect():
+        merged = weighted_merge({
+            "high": (_source(["h"] * 30), 3),
+            "low": (_source(["l"] * 30), 1),
+        })
+        return [item async for item in merged]
+
+    items = asyncio.run(collect())
+    assert len(items) == 60
+    assert items[:40].count("h") == 30
+    assert items[:40].count("l") == 10
+
+
+def test_weighted_merge_propagates_source_error():
+    async def broken():
+        yield "a"
+        raise ConnectionError("lost")
+
+    async def collect():
+        return [item async for item in weighted_merge({
+            "broken": (broken(), 1),
+        })]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect())
@@ -0,0 +1,141 @@
+import asyncio
+
+from sqlalchemy.dialects import postgresql
+
+from app import crud, schemas
+from app.dependencies import AsyncSessionLocal
+from app.models import TaskStatus
+from app.resources import resources
+from app.utils.results import StoredResult
+from app.workers.status import StatusFlusher, start_task
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeConnection:
+    """
+    Таблица задач в памяти, к которой применяется FINISH_TASKS_QUERY.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.queries = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def connect(self):
+        return self
+
+    async def execute(self, query, params=None):
+        self.queries.append((query, params))
+        if query is not crud.FINISH_TASKS_QUERY:
+            return FakeResult([])
+        applied = []
+        for task_id, status in zip(params['ids'], params['statuses']):
+            if self.statuses.get(task_id) == TaskStatus.IN_PROGRESS:
+                self.statuses[task_id] = TaskStatus(status)
+                applied.append(type("Row", (), {'id': task_id}))
+        return FakeResult(applied)
+
+
+def compile_where(query):
+    compiled = query.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def test_start_task_only_claims_pending_tasks():
+    db = FakeConnection({})
+
+    asyncio.run(crud.start_task(db, 1))
+    asyncio.run(crud.start_task(db, 1, redelivered=True))
+    (first, _), (redelivered, _) = db.queries
+    sql, params = compile_where(first)
+    assert "tasks.status IN" in sql
+    assert params['status_1'] == [TaskStatus.PENDING]
+    _, params = compile_where(redelivered)
+    assert params['status_1'] == [
+        TaskStatus.PENDING, TaskStatus.IN_PROGRESS
+    ]
+
+
+def test_finish_does_not_overwrite_canceled_task():
+    # Нужны PostgreSQL и Redis, как в test_outbox.py
+    done = StoredResult("ok", None, 2, "digest")
+
+    async def main():
+        try:
+            async with AsyncSessionLocal() as db:
+                canceled = await crud.create_task(
+                    db, schemas.TaskCreate(type="type3")
+                )
+                running = await crud.create_task(
+                    db, schemas.TaskCreate(type="type3")
+                )
+            await start_task(canceled.id)
+            await start_task(running.id)
+            async with AsyncSessionLocal() as db:
+                await crud.cancel_task(
+                    db, await crud.get_task(db, canceled.id, use_cache=False)
+                )
+            flusher = StatusFlusher()
+            applied = await asyncio.gather(
+                flusher.finish(canceled.id, TaskStatus.COMPLETED, done),
+                flusher.finish(running.id, TaskStatus.COMPLETED, done),
+            )
+            async with AsyncSessionLocal() as db:
+                statuses = [
+                    (await crud.get_task(db, task_id, use_cache=False)).status
+                    for task_id in (canceled.id, running.id)
+                ]
+            return applied, statuses
+        finally:
+            await resources.close()
+
+    applied, statuses = asyncio.run(main())
+    assert applied == [False, True]
+    assert statuses == [TaskStatus.CANCELED, TaskStatus.COMPLETED]
+
+
+def test_status_flusher_batches_and_keeps_cancellation(monkeypatch, redis):
+    conn = FakeConnection({
+        1: TaskStatus.IN_PROGRESS,
+        2: TaskStatus.CANCELED,
+        3: TaskStatus.IN_PROGRESS,
+    })
+    monkeypatch.setitem(vars(resources), "autocommit_engine", conn)
+    done = StoredResult("ok", None, 2, "digest")
+
+    async def main():
+        flusher = StatusFlusher(max_batch_size=10, flush_interval=0.01)
+        return await asyncio.gather(
+            flusher.finish(1, TaskStatus.COMPLETED, done),
+            flusher.finish(2, TaskStatus.COMPLETED, done),
+            flusher.finish(3, TaskStatus.FAILED, done),
+        )
+
+    assert asyncio.run(main()) == [True, False, True]
+    # Три итоговых статуса записаны одним запросом
+    assert len(conn.queries) == 1
+    assert conn.statuses == {
+        1: TaskStatus.COMPLETED,
+        2: TaskStatus.CANCELED,
+        3: TaskStatus.FAILED,
+    }
+    assert sorted(redis.deleted) == [
+        crud.task_cache_key(1), crud.task_cache_key(3)
+    ]
+    assert [event['id'] for event in redis.events] == [1, 3]
@@ -1,49 +1,63 @@
 from fastapi.testclient import TestClient
 from app.main import app
+import pytest
 import time
 
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client():
+    # В контексте клиента выполняется lifespan приложения: подписки на
+    # события задач и инвалидации кеша, ретранслятор outbox.
+    with TestClient(app) as client:
+        yield client
 
 
-def test_create_task():
+def test_create_task(client):
     response = client.post("/tasks/", json={"type": "type1"})
     assert response.status_code == 200
     assert response.json()["type"] == "type1"
 
 
-def test_read_tasks():
+def test_create_task_rejects_invalid_input(client):
+    response = client.post("/tasks/", json={"type": "unknown"})
+    assert response.status_code == 422
+
+    response = client.post(
+        "/tasks/", json={"type": "type1", "data": {"number": 10 ** 9}}
+    )
+    assert response.status_code == 422
+
+
+def test_read_tasks(client):
     response = client.get("/tasks/")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
 
-def test_retry_task():
+def test_retry_task(client):
     # Создаем задачу с ошибкой
     response = client.post("/tasks/", json={"type": "type1", "data": {"number": -1}})
     task = response.json()
     task_id = task["id"]
 
     # Ждем обработки задачи
-    time.sleep(2)
+    response = client.get(f"/tasks/{task_id}/wait?timeout=10")
 
     # Проверяем, что статус FAILED
-    response = client.get(f"/tasks/{task_id}")
     assert response.json()["status"] == "FAILED"
 
     # Повторяем задачу
     response = client.post(f"/tasks/{task_id}/retry")
     assert response.status_code == 200
 
-    # Ждем обработки
-    time.sleep(2)
+    assert response.json()["status"] == "PENDING"
 
-    # Проверяем статус задачи после повторного выполнения
-    response = client.get(f"/tasks/{task_id}")
-    assert response.json()["status"] in ["PENDING", "IN_PROGRESS", "COMPLETED"]
+    # Повтор выполняется с сохранёнными входными данными и снова падает
+    response = client.get(f"/tasks/{task_id}/wait?timeout=10")
+    assert response.json()["status"] == "FAILED"
 
 
-def test_task_filtering():
+def test_task_filtering(client):
     # Создаем несколько задач с разными типами и статусами
     client.post("/tasks/", json={"type": "type1", "data": {}})
     client.post("/tasks/", json={"type": "type2", "data": {}})
@@ -62,26 +76,108 @@ def test_task_filtering():
     assert all(task["status"] == "PENDING" for task in tasks)
 
 
-def test_retry_failed_task():
+def test_retry_failed_task(client):
     # Создаем задачу, которая заведомо упадет
     response = client.post("/tasks/", json={"type": "type1", "data": {"number": -1}})
     task = response.json()
     task_id = task['id']
 
     # Ждем обработки задачи
-    time.sleep(2)
+    response = client.get(f"/tasks/{task_id}/wait?timeout=10")
 
     # Проверяем, что задача упала
-    response = client.get(f"/tasks/{task_id}")
     assert response.json()["status"] == "FAILED"
+    first_error = response.json()["result"]
 
     # Повторное выполнение задачи
     response = client.post(f"/tasks/{task_id}/retry")
     assert response.status_code == 200
 
-    # Ждем обработки повторной задачи
-    time.sleep(2)
+    # Повтор получает те же входные данные и падает с той же ошибкой
+    response = client.get(f"/tasks/{task_id}/wait?timeout=10")
+    assert response.json()["status"] == "FAILED"
+    assert response.json()["result"] == first_error
+
+
+def test_create_tasks_batch(client):
+    # Задача неизвестного типа не создаётся, остальные создаются
+    response = client.post("/tasks/batch", json={"tasks": [
+        {"type": "type2", "data": {"text": "a"}},
+        {"type": "type3", "data": {}},
+        {"type": "unknown", "data": {}},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ids"][0] is not None
+    assert body["ids"][1] is not None
+    assert body["ids"][2] is None
+    assert [error["index"] for error in body["errors"]] == [2]
+
 
-    # Проверяем статус задачи
-    response = client.get(f"/tasks/{task_id}")
-    assert response.json()["status"] in ["PENDING", "IN_PROGRESS", "COMPLETED"]
+def test_create_task_idempotency_key(client):
+    headers = {"Idempotency-Key": f"test-{time.time()}"}
+    first = client.post("/tasks/", json={"type": "type3"}, headers=headers)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    second = client.post("/tasks/", json={"type": "type3"}, headers=headers)
+    assert second.status_code == 200
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json()["id"] == first.json()["id"]
+
+    changed = client.post(
+        "/tasks/", json={"type": "type3", "data": {"x": 1}}, headers=headers
+    )
+    assert changed.status_code == 422
+
+
+def test_cancel_finished_task_is_rejected(client):
+    response = client.post("/tasks/", json={"type": "type1", "data": {"number": 5}})
+    task_id = response.json()["id"]
+    client.get(f"/tasks/{task_id}/wait?timeout=10")
+
+    response = client.delete(f"/tasks/{task_id}")
+    assert response.status_code == 400
+    assert client.get(f"/tasks/{task_id}").json()["status"] == "COMPLETED"
+
+
+def test_metrics_endpoint(client):
+    client.get("/tasks/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/tasks/"' in response.text
+
+
+def test_task_stats_follow_new_tasks(client):
+    before = client.get("/tasks/stats").json()
+    client.post("/tasks/", json={"type": "type3", "delay": 3600})
+    after = client.get("/tasks/stats").json()
+    assert after["total"] == before["total"] + 1
+    assert after["by_status"]["PENDING"] == before["by_status"]["PENDING"] + 1
+
+
+def test_workflow_fan_out_and_reduce(client):
+    # Три задачи type3 с фиксированным результатом, затем сумма
+    draws = [
+        {"type": "type3", "data": {"min": value, "max": value}}
+        for value in (1, 2, 3)
+    ]
+    response = client.post("/tasks/workflows", json={"stages": [
+        {"tasks": draws},
+        {"tasks": [{"type": "type4"}]},
+    ]})
+    assert response.status_code == 200
+    workflow = response.json()
+    assert [len(stage) for stage in workflow["stages"]] == [3, 1]
+
+    reducer_id = workflow["stages"][1][0]
+    response = client.get(f"/tasks/{reducer_id}/wait?timeout=20")
+    assert response.json()["status"] == "COMPLETED"
+    assert response.json()["result"] == "6"
+    # Workflow завершается сразу после записи результата reducer
+    for _ in range(20):
+        state = client.get(f"/tasks/workflows/{workflow['id']}").json()
+        if state["status"] == "COMPLETED":
+            break
+        time.sleep(0.1)
+    assert state["status"] == "COMPLETED"
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.workers import worker
+from app.workers.cancellation import CancellationTracker
+from app.workers.worker import run_consumer
+from tests.inmemory_broker import InMemoryBroker
+
+
+def test_run_consumer_limits_in_flight():
+    # Проверяем, что одновременно выполняется не больше concurrency задач
+    broker = InMemoryBroker(prefetch_count=10)
+    for i in range(20):
+        broker.publish(str(i).encode())
+    in_flight = 0
+    peak = 0
+
+    async def handler(message):
+        nonlocal in_flight, peak
+        async with message.process():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    asyncio.run(run_consumer(broker.iterator(), handler, concurrency=4))
+    assert peak == 4
+    assert broker.acked == 20
+
+
+def test_run_consumer_acks_after_completion():
+    # Сообщение с ошибкой не подтверждается, остальные обрабатываются
+    broker = InMemoryBroker(prefetch_count=2)
+    for body in (b"ok", b"fail", b"ok"):
+        broker.publish(body)
+
+    async def handler(message):
+        async with message.process():
+            await asyncio.sleep(0)
+            if message.body == b"fail":
+                raise ValueError("boom")
+
+    asyncio.run(run_consumer(broker.iterator(), handler, concurrency=2))
+    assert broker.acked == 2
+    assert broker.nacked == 1
+
+
+def test_run_consumer_takes_message_only_for_free_slot():
+    # Следующее сообщение запрашивается после того, как освободился слот
+    pulled = []
+    done = []
+
+    async def messages():
+        for i in range(3):
+            pulled.append(i)
+            yield i
+
+    async def handler(message):
+        await asyncio.sleep(0.01)
+        # Пока обработчик работает, новое сообщение не запрошено
+        assert len(pulled) == len(done) + 1
+        done.append(message)
+
+    asyncio.run(run_consumer(messages(), handler, concurrency=1))
+    assert done == [0, 1, 2]
+
+
+def test_cancel_command_interrupts_handler_only(monkeypatch):
+    # Команда отмены прерывает обработчик, а обработка сообщения
+    # завершается штатно и не записывает результат
+    tracker = CancellationTracker()
+    finished = []
+
+    async def start_task(task_id, **kwargs):
+        return SimpleNamespace(id=task_id, type='type3', workflow_id=None)
+
+    async def run(task_type, data):
+        await asyncio.sleep(10)
+
+    async def finish(task_id, status, result):
+        finished.append(task_id)
+        return True
+
+    monkeypatch.setattr(worker, "start_task", start_task)
+    monkeypatch.setattr(worker, "cancellations", tracker)
+    monkeypatch.setattr(worker.registry, "run", run)
+    monkeypatch.setattr(worker.status_flusher, "finish", finish)
+
+    async def main():
+        body = json.dumps({'id': 1, 'type': 'type3', 'data': {}}).encode()
+        processing = asyncio.create_task(worker.process_task(body))
+        await asyncio.sleep(0.05)
+        tracker.cancel(1)
+        await asyncio.wait_for(processing, 1)
+        return processing
+
+    processing = asyncio.run(main())
+    assert not processing.cancelled()
+    assert tracker.interrupted == 1
+    assert finished == []